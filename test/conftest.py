@@ -1,2 +1,34 @@
+import os
+import shutil
+
+import pytest
+
 CACHE_TEST_PATH = "test/.cache/"
-EXAMPLE_FILE = "test/example_data/2014_Q1.json"
+EXAMPLE_DIRECTORY = "test/example_data"
+EXAMPLE_FILE = f"{EXAMPLE_DIRECTORY}/2014_Q1.json"
+# Example payloads, by the year and quarter they are named after
+EXAMPLES_2014 = ("2014_Q1",)
+EXAMPLES_2024 = ("2024_Q1", "2024_Q2", "2024_Q3")
+
+
+def copy_examples(directory, examples, code: str = "0113A") -> str:
+    """Copy example payloads into a cache directory as a gauge's quarters"""
+    os.makedirs(directory, exist_ok=True)
+    for example in examples:
+        shutil.copyfile(
+            os.path.join(EXAMPLE_DIRECTORY, f"{example}.json"),
+            os.path.join(directory, f"{code}_{example}.json"),
+        )
+    return str(directory)
+
+
+@pytest.fixture
+def examples():
+    """The example payloads in cache_path; override in a module, or parametrise"""
+    return EXAMPLES_2024
+
+
+@pytest.fixture
+def cache_path(tmp_path, examples):
+    """A cache holding the examples as quarters of Chelsea Bridge (0113A)"""
+    return copy_examples(tmp_path / "cache", examples)
@@ -28,3 +28,32 @@ def test_bad_site_code():
         assert silly_code in str(
             e
         ), "Error message should include the offending site code"
+
+
+def test_lookup_ignores_case_and_accepts_aliases():
+    assert API.site_to_code("chelsea  BRIDGE") == "0113A"
+    assert API.site_to_code("Chelsea") == "0113A"
+    assert API.site_to_code("0113a") == "0113A"
+    assert API.code_to_site("0113a") == "Chelsea Bridge"
+    assert API.canonical_site("walton-on-the-naze") == "Walton on the Naze"
+
+
+def test_registry_covers_every_gauge():
+    for gauge in API.TIDAL_GAUGES:
+        assert API.code_to_site(gauge.code) == gauge.name
+        assert API.site_to_code(gauge.name) == gauge.code
+
+
+def test_requests_not_imported_until_fetch():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys\n"
+        "import thames_tidal_helper.__main__\n"
+        "assert 'requests' not in sys.modules, 'requests imported at startup'\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
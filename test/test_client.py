@@ -1,8 +1,15 @@
+import threading
+
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock, mock_open
 from datetime import datetime
+
+import numpy as np
+
 from thames_tidal_helper.client import Client
-from thames_tidal_helper.schema import TideEntry, CalendarQuarter
+from thames_tidal_helper.interpolation import INTERPOLATION_METHODS
+from thames_tidal_helper.schema import TideEntry, TideSeries, CalendarQuarter
 
 
 @pytest.fixture
@@ -19,11 +26,15 @@ def mock_parse_data_package():
 
 
 @pytest.fixture
-def mock_interpolate_tidal_heights():
-    with patch(
-        "thames_tidal_helper.client.interpolate_tidal_heights"
-    ) as mock_interpolate:
-        yield mock_interpolate
+def mock_parse_series():
+    with patch("thames_tidal_helper.client.parse_data_package_series") as mock_parse:
+        yield mock_parse
+
+
+@pytest.fixture
+def mock_interpolator():
+    with patch("thames_tidal_helper.client.TideInterpolator") as mock_interpolator:
+        yield mock_interpolator
 
 
 @pytest.fixture
@@ -49,24 +60,185 @@ def test_missing_quarter(client, mock_data_manager):
         client.populate_entry_list([CalendarQuarter(2021, 1)])
 
 
-def test_run(
-    client, mock_data_manager, mock_parse_data_package, mock_interpolate_tidal_heights
-):
+def test_run(client, mock_data_manager, mock_parse_series, mock_interpolator):
     mock_data_manager.get_from_cache.return_value = MagicMock()
-    mock_parse_data_package.return_value = [TideEntry(datetime.now(), "HIGH", 5.0)]
-    mock_interpolate_tidal_heights.return_value = {datetime.now(): 5.0}
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [TideEntry(datetime.now(), "HIGH", 5.0)]
+    )
+    mock_interpolator.return_value.return_value = np.array([5.0])
 
     with patch(
-        "thames_tidal_helper.client.Client.load_input_datetimes",
-        return_value=[datetime(2021, 1, 1)],
+        "thames_tidal_helper.client.Client.load_input_times",
+        return_value=np.array(["2021-01-01"], dtype="datetime64[s]"),
     ):
         client.run()
 
-    assert len(client.entry_list) == 1
-    assert client.entry_list[0].height == 5.0
+    series, method = mock_interpolator.call_args.args
+    assert method == "linear"
+    assert len(series) == 1
+    assert series.heights[0] == 5.0
 
 
 def test_load_input_datetimes():
     with patch("builtins.open", mock_open(read_data="2021-02-12 10:01:01\n")):
         datetimes = Client.load_input_datetimes("input.txt")
         assert datetimes == [datetime(2021, 2, 12, 10, 1, 1)]
+
+
+def test_heights_reuses_loaded_quarters(client, mock_data_manager, mock_parse_series):
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 1, 1), "HIGH", 5.0),
+            TideEntry(datetime(2021, 1, 3), "LOW", 1.0),
+        ]
+    )
+
+    heights = client.heights("Chelsea Bridge", [datetime(2021, 1, 2)])
+    assert heights.tolist() == [3.0]
+    heights = client.heights(
+        "Chelsea Bridge", np.array(["2021-01-01"], "datetime64[s]")
+    )
+    assert heights.tolist() == [5.0]
+    assert mock_parse_series.call_count == 1
+    assert client.heights("Chelsea Bridge", []).size == 0
+
+
+def test_heights_from_threads(client, mock_data_manager, mock_parse_series):
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 1, 1), "HIGH", 5.0),
+            TideEntry(datetime(2021, 1, 3), "LOW", 1.0),
+        ]
+    )
+    times = ["2021-01-02 00:00:00"] * 10
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(
+            pool.map(lambda _: client.heights("Chelsea Bridge", times), range(50))
+        )
+
+    assert all(result.tolist() == [3.0] * 10 for result in results)
+    assert mock_parse_series.call_count == 1
+
+
+def test_heights_reuses_interpolator(client, mock_data_manager, mock_parse_series):
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 1, 1), "HIGH", 5.0),
+            TideEntry(datetime(2021, 1, 3), "LOW", 1.0),
+        ]
+    )
+    cosine = client.heights("Chelsea Bridge", ["2021-01-01 12:00:00"], "cosine")
+    assert 4.0 < cosine[0] < 5.0, "Cosine curve should stay near high water"
+    quarters = [CalendarQuarter(2021, 1)]
+    interpolator = client.load_interpolator("Chelsea Bridge", quarters, "cosine")
+    client.heights("Chelsea Bridge", ["2021-01-02 12:00:00"], "cosine")
+    assert (
+        client.load_interpolator("Chelsea Bridge", quarters, "cosine") is interpolator
+    )
+
+
+def test_slow_fetch_does_not_block_other_sites(client, mock_data_manager):
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    fetching, release = threading.Event(), threading.Event()
+
+    def get_quarters(site, quarters):
+        if site == "Chelsea Bridge":
+            fetching.set()
+            assert release.wait(5)
+
+    mock_data_manager.get_quarters.side_effect = get_quarters
+    series = TideSeries.from_entries([TideEntry(datetime(2021, 1, 1), "HIGH", 5.0)])
+    with patch(
+        "thames_tidal_helper.client.parse_data_package_series", return_value=series
+    ), ThreadPoolExecutor(max_workers=1) as pool:
+        slow = pool.submit(
+            client.load_series, "Chelsea Bridge", [CalendarQuarter(2021, 1)]
+        )
+        assert fetching.wait(5)
+        # answered while the other site's fetch is still in flight
+        assert client.load_series("London Bridge", [CalendarQuarter(2021, 1)]) is series
+        release.set()
+        slow.result()
+
+
+def test_series_includes_neighbouring_edge_events(
+    client, mock_data_manager, mock_parse_series
+):
+    q1, q2, q3 = (CalendarQuarter(2021, q) for q in (1, 2, 3))
+    events = {
+        q: TideSeries.from_entries(
+            [
+                TideEntry(datetime(2021, 3 * q.quarter - 2, day), "HIGH", 5.0)
+                for day in (1, 2, 3)
+            ]
+        )
+        for q in (q1, q2, q3)
+    }
+    mock_data_manager.get_from_cache.side_effect = lambda site, quarter: quarter
+    mock_parse_series.side_effect = lambda data, timezone: events[data]
+    client.load_series("Chelsea Bridge", [q1, q3])
+    # nothing is fetched for Q2, so only the loaded quarters lend it their edge events
+    mock_data_manager.cached_months.return_value = set()
+    series = client.load_series("Chelsea Bridge", [q2])
+    expected = np.concatenate(
+        [events[q1].times[-2:], events[q2].times, events[q3].times[:2]]
+    )
+    assert series.times.tolist() == expected.tolist()
+    assert len(client.load_series("Chelsea Bridge", [q1, q2, q3])) == 9
+
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_boundary_heights_do_not_depend_on_the_batch(cache_path, method):
+    time = "2024-03-31 23:30:00"
+    batch = [time, "2024-04-02 00:00:00", "2024-08-01 00:00:00"]
+    client = Client(cache_path=cache_path, silent=True, method=method)
+    alone = client.heights("Chelsea Bridge", [time])[0]
+    # between March's last high water and April's first low water, not clamped to the former
+    assert alone < 2.0
+    assert client.heights("Chelsea Bridge", batch)[0] == alone
+    preloaded = Client(cache_path=cache_path, silent=True, method=method)
+    preloaded.preload()
+    assert preloaded.heights("Chelsea Bridge", [time])[0] == alone
+
+
+def test_heights_in_uk_time(client, mock_data_manager, mock_parse_series):
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 7, 1, 0), "HIGH", 5.0),
+            TideEntry(datetime(2021, 7, 1, 6), "LOW", 1.0),
+        ]
+    )
+    # 03:00 BST is 02:00 UTC
+    uk = client.heights("Chelsea Bridge", ["2021-07-01 03:00:00"], timezone="uk")
+    utc = client.heights("Chelsea Bridge", ["2021-07-01 02:00:00"])
+    assert uk.tolist() == utc.tolist()
+
+
+def test_window_granularity_fetches_queried_months(
+    mock_data_manager, mock_parse_series
+):
+    client = Client(fetch_granularity="window")
+    mock_data_manager.get_from_cache.return_value = MagicMock()
+    mock_parse_series.return_value = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 2, 1), "HIGH", 5.0),
+            TideEntry(datetime(2021, 2, 3), "LOW", 1.0),
+        ]
+    )
+    january = CalendarQuarter(2021, 1).month_indices()[0]
+    mock_data_manager.cached_months.return_value = {january + 1}
+
+    client.heights("Chelsea Bridge", ["2021-02-02 00:00:00"])
+    mock_data_manager.get_months.assert_called_once_with(
+        "Chelsea Bridge", [january + 1]
+    )
+    mock_data_manager.get_quarters.assert_not_called()
+
+    # a month already loaded is not fetched or parsed again
+    client.heights("Chelsea Bridge", ["2021-02-02 12:00:00"])
+    assert mock_parse_series.call_count == 1
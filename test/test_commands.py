@@ -5,6 +5,7 @@ import pytest
 import uuid
 from datetime import datetime
 
+from conftest import copy_examples
 from thames_tidal_helper.config import DEFAULT_CACHE_PATH
 
 # Define paths for input and output files
@@ -175,3 +176,57 @@ def test_invalid_site_option(setup_files):
     assert result.returncode != 0
     assert bad_site_name in result.stderr
     assert "not found" in result.stderr.lower()
+
+
+def test_table_timezone_option(tmp_path):
+    cache = copy_examples(tmp_path / "cache", ["2024_Q3"])
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("2024-07-01 12:00:00\n")
+    outputs = {}
+    for timezone in ("utc", "uk"):
+        output_file = tmp_path / f"output_{timezone}.txt"
+        result = subprocess.run(
+            [
+                venv_python,
+                "-m",
+                "thames_tidal_helper",
+                "--silent",
+                "--cache",
+                str(cache),
+                "--input",
+                str(input_file),
+                "--output",
+                str(output_file),
+                "--table-timezone",
+                timezone,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        outputs[timezone] = output_file.read_text()
+    # BST tables are an hour ahead of UTC in July, so the heights differ
+    assert outputs["utc"] != outputs["uk"]
+
+
+def test_cache_max_size_is_rejected_with_server(setup_files):
+    # the server owns the cache, so a local cap would be silently ignored
+    result = subprocess.run(
+        [
+            venv_python,
+            "-m",
+            "thames_tidal_helper",
+            "--server",
+            "http://127.0.0.1:1",
+            "--cache-max-size",
+            "2G",
+            "--input",
+            INPUT_FILE,
+            "--output",
+            OUTPUT_FILE,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "cache_max_size" in result.stderr
@@ -1,12 +1,16 @@
+import json
 import os
 import shutil
-from unittest.mock import patch
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
 
 import pytest
 
 from conftest import CACHE_TEST_PATH, EXAMPLE_FILE
 from thames_tidal_helper.data_manager import DataManager
-from thames_tidal_helper.schema import CalendarQuarter
+from thames_tidal_helper.schema import CalendarQuarter, DataPackage
 from thames_tidal_helper.api_adapter import API
 
 
@@ -85,11 +89,10 @@ def test_add_data_to_cache(wipe_cache, example_data):
     cached_data = data_manager.get_from_cache(site, quarter)
     assert cached_data is not None
 
-    # Now delete the file to mess with the cache
-    with pytest.raises(FileNotFoundError):
-        os.remove(filepath)
-        assert not os.path.exists(filepath)
-        _ = data_manager.check_exists(site, quarter)
+    # Now delete the file to mess with the cache: the entry is forgotten, to be fetched again
+    os.remove(filepath)
+    assert not data_manager.check_exists(site, quarter)
+    assert (site, quarter) not in data_manager.contents
 
 
 def test_no_entry_in_cache(wipe_cache):
@@ -154,3 +157,205 @@ def test_wipe_cache(wipe_cache, example_data):
 
     # Manually clean up the cache directory
     shutil.rmtree(CACHE_TEST_PATH, ignore_errors=True)
+
+
+def test_concurrent_get_quarters(wipe_cache):
+    data_manager = DataManager(CACHE_TEST_PATH)
+    site = "Chelsea Bridge"
+    quarters = [CalendarQuarter(2024, q) for q in range(1, 4)]
+    responses = {}
+    for quarter in quarters:
+        with open(f"test/example_data/2024_Q{quarter.quarter}.json") as file:
+            responses[f"/2024/{quarter.quarter * 3 - 2}/1/0/1/"] = file.read()
+    fetched_urls = []
+    fetch_lock = threading.Lock()
+
+    def slow_get(url):
+        with fetch_lock:
+            fetched_urls.append(url)
+        time.sleep(0.01)  # widen the window for racing threads
+        return MagicMock(text=responses[url[url.index("/2024/") :]])
+
+    def hammer(i):
+        # each worker asks for the quarters in a different order
+        shift = i % len(quarters)
+        data_manager.get_quarters(site, quarters[shift:] + quarters[:shift])
+        for quarter in quarters:
+            assert data_manager.check_exists(site, quarter)
+
+    with patch("thames_tidal_helper.data_manager.req_get", side_effect=slow_get):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(hammer, range(64)))
+
+    assert len(fetched_urls) == len(quarters), "Each quarter should be fetched once"
+    assert data_manager.contents == {(site, quarter) for quarter in quarters}
+    assert data_manager.get_from_cache(site, quarters[0]) is not None
+    leftovers = [f for f in os.listdir(CACHE_TEST_PATH) if f.endswith(".tmp")]
+    assert leftovers == []
+
+
+def test_site_aliases_share_cache_entries(wipe_cache, example_data):
+    data_manager = DataManager(CACHE_TEST_PATH)
+    quarter = CalendarQuarter(2014, 1)
+    data_manager.write_to_cache("chelsea", quarter, example_data)
+    assert data_manager.check_exists("Chelsea Bridge", quarter)
+    assert data_manager.check_exists("0113A", quarter)
+
+
+def test_scan_finds_four_character_codes(tmp_path, example_data):
+    for filename in ("0110_2024_Q1.json", "0113A_2024_Q1.json"):
+        (tmp_path / filename).write_text(example_data)
+    (tmp_path / "0103_2024_Q2.months-5-6.json").write_text(example_data)
+    data_manager = DataManager(str(tmp_path))
+    quarter = CalendarQuarter(2024, 1)
+    assert data_manager.contents == {("Southend", quarter), ("Chelsea Bridge", quarter)}
+    may_june = set(CalendarQuarter(2024, 2).month_indices()[1:])
+    assert data_manager.partial == {("Margate", CalendarQuarter(2024, 2)): may_june}
+
+
+def window_payload(start: CalendarQuarter, offset: int) -> str:
+    """Build the response for a window starting `offset` months into an example quarter"""
+    months = []
+    for quarter in (start, CalendarQuarter(start.year, start.quarter + 1)):
+        with open(f"test/example_data/{quarter.year}_Q{quarter.quarter}.json") as f:
+            months.extend(json.load(f)["table"].values())
+    window = months[offset : offset + 3]
+    return json.dumps(
+        {"table": {str(i): month for i, month in enumerate(window)}, "TimeOffset": "0"}
+    )
+
+
+def test_plan_windows():
+    assert DataManager.plan_windows([]) == []
+    assert DataManager.plan_windows([0, 1, 2, 3, 7, 9, 10]) == [0, 3, 7, 10]
+
+
+def test_window_fetches_merge_into_quarters(wipe_cache):
+    shutil.rmtree(CACHE_TEST_PATH, ignore_errors=True)
+    data_manager = DataManager(CACHE_TEST_PATH, fetch_granularity="window")
+    site = "Chelsea Bridge"
+    q1, q2 = CalendarQuarter(2024, 1), CalendarQuarter(2024, 2)
+    february, april = q1.month_indices()[1], q2.month_indices()[0]
+
+    responses = [window_payload(q1, 1), window_payload(q1, 0)]
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=lambda url: MagicMock(text=responses.pop(0)),
+    ) as mock_get:
+        # February and April are covered by one window starting in February
+        data_manager.get_months(site, [february, april])
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.args[0].endswith("/2024/2/1/0/1/")
+        assert data_manager.cached_months(site, q1) == {february, february + 1}
+        assert data_manager.cached_months(site, q2) == {april}
+        assert not data_manager.check_exists(site, q1)
+        assert len(data_manager.get_from_cache(site, q1).table) == 2
+
+        # the partial quarters are found again by a new DataManager
+        rescanned = DataManager(CACHE_TEST_PATH, fetch_granularity="window")
+        assert rescanned.partial == data_manager.partial
+
+        # fetching January completes the first quarter
+        data_manager.get_months(site, q1.month_indices())
+        assert mock_get.call_count == 2
+    assert data_manager.check_exists(site, q1)
+    assert (site, q1) not in data_manager.partial
+    assert sorted(f for f in os.listdir(CACHE_TEST_PATH) if f.startswith("0113A")) == [
+        "0113A_2024_Q1.json",
+        "0113A_2024_Q2.months-4.json",
+    ]
+
+
+def test_partial_quarters_are_read_while_windows_merge(tmp_path):
+    site = "Chelsea Bridge"
+    q1 = CalendarQuarter(2024, 1)
+    february, january = q1.month_indices()[1], q1.month_indices()[0]
+    responses = {
+        "/2024/2/1/0/1/": window_payload(q1, 1),
+        "/2024/1/1/0/1/": window_payload(q1, 0),
+    }
+    remove = os.remove
+
+    def slow_remove(path):
+        remove(path)
+        time.sleep(0.005)  # widen the gap between a partial file going and its entry
+
+    def read(data_manager, done):
+        while not done.is_set():
+            data_manager.get_from_cache(site, q1)
+
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=lambda url: MagicMock(text=responses[url[url.index("/2024/") :]]),
+    ), patch("thames_tidal_helper.data_manager.os.remove", side_effect=slow_remove):
+        for attempt in range(10):
+            data_manager = DataManager(
+                str(tmp_path / str(attempt)), fetch_granularity="window"
+            )
+            done = threading.Event()
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                readers = [pool.submit(read, data_manager, done) for _ in range(4)]
+                # a partial Q1 of February and March, then January completes it
+                data_manager.get_months(site, [february])
+                data_manager.get_months(site, [january])
+                done.set()
+                for reader in readers:
+                    reader.result()
+            assert data_manager.check_exists(site, q1)
+            assert (site, q1) not in data_manager.partial
+
+
+def test_plan_fetches(wipe_cache):
+    shutil.rmtree(CACHE_TEST_PATH, ignore_errors=True)
+    quarters = [CalendarQuarter(2024, 1), CalendarQuarter(2024, 2)]
+    months = [month for q in quarters for month in q.month_indices()]
+    starts = [months[0], months[3]]
+    plans = {}
+    for granularity in ("quarter", "window", "auto"):
+        data_manager = DataManager(CACHE_TEST_PATH, fetch_granularity=granularity)
+        plans[granularity] = (
+            data_manager.plan_fetches("Chelsea Bridge", months),
+            # a month either side of a quarter boundary
+            data_manager.plan_fetches("Chelsea Bridge", [months[2], months[3]]),
+        )
+    assert plans["quarter"] == (starts, starts)
+    assert plans["window"] == (starts, [months[2]])
+    # windows are only used when they need fewer requests than quarters
+    assert plans["auto"] == (starts, [months[2]])
+
+
+def test_get_quarters_requests_quarter_start(wipe_cache):
+    shutil.rmtree(CACHE_TEST_PATH, ignore_errors=True)
+    data_manager = DataManager(CACHE_TEST_PATH)
+    with open("test/example_data/2024_Q2.json") as file:
+        response = MagicMock(text=file.read())
+    with patch(
+        "thames_tidal_helper.data_manager.req_get", return_value=response
+    ) as mock_get:
+        data_manager.get_quarters("Chelsea Bridge", [CalendarQuarter(2024, 2)])
+    assert mock_get.call_args.args[0].endswith("/0113A/2024/4/1/0/1/")
+    assert data_manager.check_exists("Chelsea Bridge", CalendarQuarter(2024, 2))
+
+
+def test_mismatched_response_is_not_cached(wipe_cache):
+    shutil.rmtree(CACHE_TEST_PATH, ignore_errors=True)
+    data_manager = DataManager(CACHE_TEST_PATH)
+    quarter = CalendarQuarter(2024, 3)
+    with open("test/example_data/2024_Q2.json") as file:
+        response = MagicMock(text=file.read())
+    with patch("thames_tidal_helper.data_manager.req_get", return_value=response):
+        with pytest.raises(ValueError, match="requested 2024-07"):
+            data_manager.get_quarters("Chelsea Bridge", [quarter])
+    assert not data_manager.check_exists("Chelsea Bridge", quarter)
+
+    # the table is checked too, for responses without year and month fields
+    with pytest.raises(ValueError, match="April 2024"):
+        data_manager.check_response(
+            DataPackage(window_payload(CalendarQuarter(2024, 1), 3)),
+            quarter.index() * 3,
+        )
+
+
+def test_invalid_fetch_granularity():
+    with pytest.raises(ValueError):
+        DataManager(CACHE_TEST_PATH, fetch_granularity="daily")
@@ -1,6 +1,9 @@
+import io
 import os
 from datetime import datetime
+from unittest.mock import patch
 
+import numpy as np
 import pytest
 
 from thames_tidal_helper.client import (
@@ -47,3 +50,60 @@ def test_datetime_to_quarter():
     assert (
         quarter.year == 2021 and quarter.quarter == 1
     ), "Datetime should match the input"
+
+
+def test_read_text_as_datetime64(example_file):
+    """Text input is parsed straight into a datetime64 array"""
+    times = Client.load_input_times(example_file)
+    assert times.dtype == np.dtype("datetime64[s]")
+    assert times[1] == np.datetime64("2021-01-02T12:42:00")
+
+
+def test_read_npy(tmp_path):
+    """.npy input of datetime64 values or epoch seconds is accepted"""
+    expected = np.array(["2021-01-01T12:00:00", "2021-06-01T00:30:00"], "datetime64[s]")
+
+    datetime_file = str(tmp_path / "datetimes.npy")
+    np.save(datetime_file, expected.astype("datetime64[ms]"))
+    assert np.array_equal(Client.load_input_times(datetime_file), expected)
+
+    epoch_file = str(tmp_path / "epochs.npy")
+    np.save(epoch_file, expected.astype(np.int64))
+    assert np.array_equal(Client.load_input_times(epoch_file), expected)
+
+    float_file = str(tmp_path / "floats.npy")
+    np.save(float_file, expected.astype(np.int64).astype(np.float64))
+    assert np.array_equal(Client.load_input_times(float_file), expected)
+
+    bad_file = str(tmp_path / "bad.npy")
+    np.save(bad_file, np.array(["not a time"]))
+    with pytest.raises(ValueError):
+        Client.load_input_times(bad_file)
+
+
+def test_read_stdin():
+    """'-' reads text or .npy data from stdin"""
+    text = io.TextIOWrapper(io.BytesIO(b"2021-01-01 12:00:00\n\n"))
+    with patch("sys.stdin", text):
+        times = Client.load_input_times("-")
+    assert times.tolist() == [datetime(2021, 1, 1, 12)]
+
+    buffer = io.BytesIO()
+    np.save(buffer, np.array([1609502400], dtype=np.int64))
+    with patch("sys.stdin", io.TextIOWrapper(io.BytesIO(buffer.getvalue()))):
+        times = Client.load_input_times("-")
+    assert times.tolist() == [datetime(2021, 1, 1, 12)]
+
+
+def test_datetime64_to_quarters():
+    """Distinct quarters are found without building datetimes"""
+    times = np.array(
+        ["2021-03-31T23:59:59", "2021-01-01", "2021-04-01", "1969-12-31"],
+        dtype="datetime64[s]",
+    )
+    quarters = CalendarQuarter.from_datetime64(times)
+    assert quarters == [
+        CalendarQuarter(1969, 4),
+        CalendarQuarter(2021, 1),
+        CalendarQuarter(2021, 2),
+    ]
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+from thames_tidal_helper.files import pid_alive
+
+
+def test_pid_alive():
+    assert pid_alive(os.getpid())
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    assert not pid_alive(process.pid)
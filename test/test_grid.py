@@ -0,0 +1,176 @@
+import os
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLES_2014, EXAMPLES_2024, copy_examples
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.grid import HeightGrid
+from thames_tidal_helper.interpolation import TideInterpolator
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.schema import (
+    CalendarQuarter,
+    TideEntry,
+    TideSeries,
+    parse_data_package_series,
+)
+
+
+@pytest.fixture
+def examples():
+    return EXAMPLES_2014
+
+
+def test_quarter_bounds():
+    start, end = CalendarQuarter(2014, 4).bounds()
+    assert start == np.datetime64("2014-10-01T00:00:00")
+    assert end == np.datetime64("2015-01-01T00:00:00")
+
+
+def test_grid_lookup():
+    grid = HeightGrid(0, 10, np.array([0.0, 1.0, 4.0], dtype=np.float32))
+    times = np.array([0, 5, 10, 14, 20, 99, -5], dtype=np.int64).view("datetime64[s]")
+    assert np.allclose(grid(times), [0.0, 0.5, 1.0, 2.2, 4.0, 4.0, 0.0])
+    assert grid(times, refine=False).tolist() == [0.0, 0.0, 1.0, 1.0, 4.0, 4.0, 0.0]
+    with pytest.raises(ValueError):
+        HeightGrid(0, 0, np.zeros(3))
+
+
+def test_grid_build_samples_interpolator():
+    series = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 1, 1, 0, 0), "HIGH", 5.0),
+            TideEntry(datetime(2021, 1, 1, 6, 0), "LOW", 1.0),
+        ]
+    )
+    interpolator = TideInterpolator(series, "cosine")
+    grid = HeightGrid.build(CalendarQuarter(2021, 1), 600, interpolator)
+    assert len(grid) == 90 * 24 * 6 + 1
+    assert grid.heights.dtype == np.float32
+
+    times = np.array(["2021-01-01T01:00", "2021-01-01T03:20"], dtype="datetime64[s]")
+    assert np.allclose(grid(times, refine=False), interpolator(times), atol=1e-6)
+
+
+def test_listing_gaps_are_not_bridged():
+    series = TideSeries.from_entries(
+        [
+            TideEntry(datetime(2021, 1, 1, 0, 0), "HIGH", 5.0),
+            TideEntry(datetime(2021, 1, 1, 6, 0), "LOW", 1.0),
+        ]
+    )
+    interpolator = TideInterpolator(series, "linear")
+    # per-minute rows for the first and third hours, with a gap between them
+    minutes = np.concatenate([np.arange(0, 61), np.arange(120, 181)])
+    times = np.datetime64("2021-01-01T00:00", "s") + minutes * np.timedelta64(60, "s")
+    reference = (times, np.full(len(times), 9.0))
+    grid = HeightGrid.build(CalendarQuarter(2021, 1), 60, interpolator, reference)
+    samples = np.array(
+        ["2021-01-01T00:30", "2021-01-01T01:30", "2021-01-01T02:30"],
+        dtype="datetime64[s]",
+    )
+    assert grid(samples).tolist() == [9.0, pytest.approx(4.0), 9.0]
+
+
+@pytest.mark.parametrize("examples", [EXAMPLES_2024[:2]])
+def test_grid_matches_interpolator_at_quarter_edge(cache_path):
+    times = np.array(["2024-03-31T23:30", "2024-04-01T00:30"], dtype="datetime64[s]")
+    gridded = Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+    data_manager = DataManager(cache_path)
+    parts = [
+        parse_data_package_series(
+            data_manager.get_from_cache("Chelsea", CalendarQuarter(2024, quarter))
+        )
+        for quarter in (1, 2)
+    ]
+    merged = TideSeries(
+        *(
+            np.concatenate([getattr(part, field) for part in parts])
+            for field in ("times", "heights", "is_high")
+        )
+    )
+    exact = TideInterpolator(merged, "linear")(times)
+    np.testing.assert_allclose(gridded, exact, atol=1e-3)
+
+
+@pytest.mark.parametrize("examples", [EXAMPLES_2024[:1]])
+def test_grid_is_rebuilt_when_a_neighbour_is_cached(cache_path):
+    times = np.array(["2024-03-31T23:30:00"], dtype="datetime64[s]")
+    clamped = Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+    grid = next(f for f in os.listdir(cache_path) if f.endswith(".npy"))
+    stamp = os.stat(os.path.join(cache_path, grid)).st_mtime_ns
+
+    copy_examples(cache_path, ["2024_Q2"])
+    path = os.path.join(cache_path, "0113A_2024_Q2.json")
+    os.utime(path, ns=(stamp + 10**9, stamp + 10**9))
+    heights = Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+    assert heights[0] < clamped[0] - 1.0
+
+
+def test_client_grid_matches_interpolation(cache_path):
+    times = np.arange(
+        np.datetime64("2014-01-02"),
+        np.datetime64("2014-03-30"),
+        np.timedelta64(3671, "s"),
+    ).astype("datetime64[s]")
+    exact = Client(cache_path=cache_path, method="cosine").heights("Chelsea", times)
+    gridded = Client(cache_path=cache_path, method="cosine", grid_step=60)
+    assert np.allclose(gridded.heights("Chelsea", times), exact, atol=1e-3)
+    assert any(
+        ".grid-interpolated-cosine-utc-60s.npy" in f for f in os.listdir(cache_path)
+    )
+
+    # a new client reads the saved grid without parsing the quarter again
+    with patch("thames_tidal_helper.client.parse_data_package_series") as mock_parse:
+        reused = Client(cache_path=cache_path, method="cosine", grid_step=60)
+        assert np.allclose(reused.heights("Chelsea", times), exact, atol=1e-3)
+    mock_parse.assert_not_called()
+
+
+def test_client_grid_from_listing(cache_path):
+    times = np.array(["2014-01-10T12:34:00"], dtype="datetime64[s]")
+    client = Client(cache_path=cache_path, grid_step=60, grid_source="listing")
+    linear = Client(cache_path=cache_path).heights("Chelsea", times)
+    listing = client.heights("Chelsea", times)
+    assert listing[0] != pytest.approx(linear[0], abs=1e-3)
+
+    with pytest.raises(ValueError):
+        Client(cache_path=cache_path, grid_source="wibble")
+
+
+def test_grid_is_keyed_by_table_timezone(cache_path):
+    times = np.array(["2014-01-10T12:34:00"], dtype="datetime64[s]")
+    Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+    Client(cache_path=cache_path, grid_step=60, table_timezone="uk").heights(
+        "Chelsea", times
+    )
+    names = {f.split(".")[1] for f in os.listdir(cache_path) if f.endswith(".npy")}
+    assert names == {
+        "grid-interpolated-linear-utc-60s",
+        "grid-interpolated-linear-uk-60s",
+    }
+
+
+def test_grid_is_rebuilt_when_quarter_is_replaced(cache_path):
+    times = np.array(["2014-01-10T12:34:00"], dtype="datetime64[s]")
+    Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+
+    # the quarter is replaced after the grid was built, e.g. by a refetch
+    path = os.path.join(cache_path, "0113A_2014_Q1.json")
+    with open(path) as file:
+        text = file.read()
+    text = text.replace('"Height": "', '"Height": "1', 1)
+    grid = next(f for f in os.listdir(cache_path) if f.endswith(".npy"))
+    stamp = os.stat(os.path.join(cache_path, grid)).st_mtime_ns
+    with open(path, "w") as file:
+        file.write(text)
+    os.utime(path, ns=(stamp + 10**9, stamp + 10**9))
+
+    build = HeightGrid.build
+    with patch(
+        "thames_tidal_helper.client.HeightGrid.build", side_effect=build
+    ) as mock_build:
+        Client(cache_path=cache_path, grid_step=60).heights("Chelsea", times)
+    mock_build.assert_called_once()
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+import requests
+
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.harmonics import (
+    HarmonicModel,
+    choose_constituents,
+    holdout_report,
+    load_model,
+    model_path,
+)
+from thames_tidal_helper.schema import TideSeries
+
+
+def test_choose_constituents():
+    # a month separates M2 from S2 and N2, but a quarter is too short for K2 and P1
+    assert choose_constituents(24 * 30)[:3] == ["M2", "S2", "N2"]
+    assert "K2" not in choose_constituents(24 * 91)
+    assert {"K2", "P1"} <= set(choose_constituents(24 * 366))
+
+
+def test_fit_recovers_constituents():
+    truth = HarmonicModel(
+        "Chelsea Bridge",
+        3.2,
+        {"M2": (2.4, 250.0), "S2": (0.7, 130.0), "K1": (0.1, 40.0), "M4": (0.15, 60.0)},
+    )
+    times = np.arange(
+        np.datetime64("2024-01-01", "s"), np.datetime64("2024-04-01", "s"), 600
+    )
+    heights = truth(times)
+    series = TideSeries(times.view(np.int64), heights, np.zeros(len(times), bool))
+    model = HarmonicModel.fit("Chelsea Bridge", [series])
+    assert model.mean == pytest.approx(3.2, abs=1e-3)
+    for name, (amplitude, phase) in truth.constituents.items():
+        assert model.constituents[name][0] == pytest.approx(amplitude, abs=1e-3)
+        assert model.constituents[name][1] == pytest.approx(phase, abs=0.5)
+    later = times + np.timedelta64(5 * 365, "D")
+    np.testing.assert_allclose(model(later), truth(later), atol=0.01)
+
+
+def test_load_model_is_saved_and_refitted(cache_path):
+    data_manager = DataManager(cache_path)
+    model = load_model(data_manager, "Chelsea Bridge")
+    assert model.quarters == ["2024_Q1", "2024_Q2", "2024_Q3"]
+    path = model_path(cache_path, "Chelsea Bridge")
+    with open(path) as file:
+        assert json.load(file)["constituents"]["M2"]["amplitude"] > 1.0
+
+    with patch("thames_tidal_helper.harmonics.fit_cached") as mock_fit:
+        load_model(DataManager(cache_path), "Chelsea Bridge")
+    mock_fit.assert_not_called()
+
+    os.remove(os.path.join(cache_path, "0113A_2024_Q3.json"))
+    model = load_model(DataManager(cache_path), "Chelsea Bridge")
+    assert model.quarters == ["2024_Q1", "2024_Q2"]
+
+
+def test_holdout_report(cache_path):
+    report = holdout_report(DataManager(cache_path), "Chelsea Bridge")
+    assert list(report["quarters"]) == ["2024_Q1", "2024_Q2", "2024_Q3"]
+    for result in report["quarters"].values():
+        assert result["rmse"] < 0.5
+        assert result["high_water_rmse"] < 0.5
+
+
+def test_client_falls_back_to_harmonics(cache_path):
+    client = Client(cache_path=cache_path, silent=True, harmonic_fallback=True)
+    times = np.array(["2024-02-01T12:00", "2031-05-01T12:00"], dtype="datetime64[s]")
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=requests.ConnectionError("offline"),
+    ) as mock_get:
+        heights = client.heights("Chelsea Bridge", times)
+        # the failed quarter is not fetched again
+        client.heights("Chelsea Bridge", times[1:])
+    assert mock_get.call_count == 1
+
+    expected = Client(cache_path=cache_path, silent=True).heights(
+        "Chelsea Bridge", times[:1]
+    )
+    assert heights[0] == expected[0]
+    model = load_model(DataManager(cache_path), "Chelsea Bridge")
+    assert heights[1] == pytest.approx(model(times[1:])[0])
+
+
+def test_fallback_warning_goes_to_stderr(cache_path, capsys):
+    client = Client(cache_path=cache_path, harmonic_fallback=True)
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=requests.ConnectionError("offline"),
+    ):
+        client.heights("Chelsea Bridge", ["2031-05-01 12:00:00"])
+    captured = capsys.readouterr()
+    assert "Predicting 2031 Q2 from harmonics" in captured.err
+    assert captured.out == ""
+
+
+def test_slow_fit_does_not_block_other_sites(cache_path):
+    client = Client(cache_path=cache_path, silent=True, harmonic_fallback=True)
+    fitting, release = threading.Event(), threading.Event()
+    model = MagicMock()
+
+    def fit(data_manager, site, table_timezone):
+        if site == "Chelsea Bridge":
+            fitting.set()
+            assert release.wait(5)
+        return model
+
+    with patch(
+        "thames_tidal_helper.client.load_model", side_effect=fit
+    ) as mock_fit, ThreadPoolExecutor(max_workers=2) as pool:
+        slow = [pool.submit(client.load_harmonic_model, "Chelsea Bridge")]
+        assert fitting.wait(5)
+        slow.append(pool.submit(client.load_harmonic_model, "Chelsea Bridge"))
+        # fitted while the other site's fit is still running
+        assert client.load_harmonic_model("London Bridge") is model
+        release.set()
+        assert all(future.result() is model for future in slow)
+    # each site is fitted once
+    assert mock_fit.call_count == 2
+
+
+def test_unavailable_quarters_are_retried(cache_path):
+    client = Client(cache_path=cache_path, silent=True, harmonic_fallback=True)
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=requests.ConnectionError("offline"),
+    ) as mock_get, patch("thames_tidal_helper.client.UNAVAILABLE_RETRY_SECONDS", 0):
+        client.heights("Chelsea Bridge", ["2031-05-01 12:00:00"])
+        client.heights("Chelsea Bridge", ["2031-05-01 12:00:00"])
+    assert mock_get.call_count == 2
+
+
+def test_fallback_does_not_hide_a_corrupt_cache(cache_path):
+    with open(os.path.join(cache_path, "0113A_2024_Q1.json"), "w") as f:
+        f.write("{not json")
+    client = Client(cache_path=cache_path, silent=True, harmonic_fallback=True)
+    with patch("thames_tidal_helper.data_manager.req_get") as mock_get:
+        with pytest.raises(ValueError):
+            client.heights("Chelsea Bridge", ["2024-02-01 12:00:00"])
+    mock_get.assert_not_called()
+
+
+def test_fallback_is_rejected_where_unsupported(cache_path):
+    with pytest.raises(ValueError):
+        Client(cache_path=cache_path, harmonic_fallback=True, grid_step=60)
+    client = Client(cache_path=cache_path, silent=True, harmonic_fallback=True)
+    with pytest.raises(ValueError):
+        client.windows("Chelsea Bridge", "2024-02-01", "2024-02-02", 3.0)
+
+
+def test_client_without_fallback_fails(cache_path):
+    client = Client(cache_path=cache_path, silent=True)
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=requests.ConnectionError("offline"),
+    ):
+        with pytest.raises(requests.ConnectionError):
+            client.heights("Chelsea Bridge", ["2031-05-01 12:00:00"])
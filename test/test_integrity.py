@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from conftest import EXAMPLES_2024, copy_examples
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.integrity import (
+    MANIFEST_FILENAME,
+    QUARANTINE_DIRECTORY,
+    check_file,
+    stale_temp_files,
+    verify_cache,
+)
+from thames_tidal_helper.schema import CalendarQuarter
+
+
+@pytest.fixture
+def examples():
+    return EXAMPLES_2024[:2]
+
+
+def test_good_cache_verifies(cache_path):
+    report = verify_cache(cache_path, workers=2)
+    assert report["checked"] == 2
+    assert report["ok"] == 2
+    assert report["bad"] == []
+    assert os.path.exists(os.path.join(cache_path, MANIFEST_FILENAME))
+
+
+def test_problems_are_found(cache_path):
+    with open("test/example_data/2024_Q3.json") as file:
+        data = file.read()
+    # truncated, and a quarter whose file holds the wrong months
+    with open(os.path.join(cache_path, "0113A_2024_Q3.json"), "w") as file:
+        file.write(data[:1000])
+    shutil.copyfile(
+        os.path.join(cache_path, "0113A_2024_Q1.json"),
+        os.path.join(cache_path, "0113A_2024_Q4.json"),
+    )
+    report = verify_cache(cache_path, workers=2)
+    problems = {result["file"]: result["problems"] for result in report["bad"]}
+    assert list(problems) == ["0113A_2024_Q3.json", "0113A_2024_Q4.json"]
+    assert "invalid data" in problems["0113A_2024_Q3.json"][0]
+    assert "expected [2024-10, 2024-11, 2024-12]" in problems["0113A_2024_Q4.json"][0]
+
+
+def test_checksum_catches_corruption_in_place(cache_path):
+    verify_cache(cache_path, workers=1)
+    path = os.path.join(cache_path, "0113A_2024_Q1.json")
+    stat = os.stat(path)
+    with open(path, "r+") as file:
+        data = file.read()
+        file.seek(0)
+        # the same size and still valid JSON, but a height has changed
+        file.write(data.replace('"Height": "5.71"', '"Height": "5.17"', 1))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    result = check_file(cache_path, "0113A_2024_Q1.json", None)
+    assert result["problems"] == []
+    report = verify_cache(cache_path, workers=1)
+    assert report["bad"][0]["problems"] == ["checksum does not match the manifest"]
+
+
+def test_repair_quarantines_and_refetches(cache_path):
+    path = os.path.join(cache_path, "0113A_2024_Q2.json")
+    with open(path, "w") as file:
+        file.write("{")
+    stale = os.path.join(cache_path, "0113A_2024_Q1.json.999999999.1.tmp")
+    open(stale, "w").close()
+    with open("test/example_data/2024_Q2.json") as file:
+        response = MagicMock(text=file.read())
+
+    with patch(
+        "thames_tidal_helper.data_manager.req_get", return_value=response
+    ) as mock_get:
+        report = verify_cache(cache_path, repair=True, workers=1)
+
+    mock_get.assert_called_once()
+    assert report["quarantined"] == ["0113A_2024_Q2.json"]
+    assert report["refetched"] == ["0113A_2024_Q2.json"]
+    assert report["stale_temp_files"] == [os.path.basename(stale)]
+    assert not os.path.exists(stale)
+    assert len(os.listdir(os.path.join(cache_path, QUARANTINE_DIRECTORY))) == 1
+    assert verify_cache(cache_path, workers=1)["bad"] == []
+
+
+def test_temp_files_are_checked_without_signals_on_windows(cache_path):
+    live = f"0113A_2024_Q1.json.{os.getpid()}.1.tmp"
+    dead = "0113A_2024_Q2.json.999999999.1.tmp"
+    for filename in (live, dead):
+        open(os.path.join(cache_path, filename), "w").close()
+    # on Windows, os.kill would terminate the writer it found
+    with patch("thames_tidal_helper.files.sys.platform", "win32"), patch(
+        "thames_tidal_helper.files.windows_pid_alive",
+        side_effect=lambda pid: pid == os.getpid(),
+    ), patch("os.kill", side_effect=AssertionError("signalled")):
+        assert stale_temp_files(cache_path) == [dead]
+
+
+def test_get_from_cache_reports_corrupt_files(cache_path):
+    data_manager = DataManager(cache_path)
+    with open(os.path.join(cache_path, "0113A_2024_Q1.json"), "w") as file:
+        file.write('{"table": ')
+    with pytest.raises(ValueError, match="cache repair"):
+        data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 1))
+
+
+def test_cache_verify_command(cache_path):
+    command = [sys.executable, "-m", "thames_tidal_helper", "cache", "verify"]
+    result = subprocess.run([*command, "--cache", cache_path], capture_output=True)
+    assert result.returncode == 0, result.stderr
+    assert b"2 ok, 0 bad" in result.stdout
+
+    with open(os.path.join(cache_path, "0113A_2024_Q1.json"), "w") as file:
+        file.write("not json")
+    result = subprocess.run([*command, "--cache", cache_path], capture_output=True)
+    assert result.returncode == 1
+
+
+def test_four_character_codes_are_checked(cache_path):
+    copy_examples(cache_path, ["2024_Q3"], code="0110")
+    report = verify_cache(cache_path, workers=1)
+    assert report["checked"] == 3
+    assert report["unrecognised"] == []
@@ -1,7 +1,23 @@
 from datetime import datetime, timedelta
 
-from thames_tidal_helper.interpolation import interpolate_tidal_heights
-from thames_tidal_helper.schema import TideEntry
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_FILE
+from thames_tidal_helper.interpolation import (
+    INTERPOLATION_METHODS,
+    TideInterpolator,
+    accuracy_report,
+    interpolate_tidal_heights,
+    interpolate_heights,
+)
+from thames_tidal_helper.schema import (
+    DataPackage,
+    TideEntry,
+    TideSeries,
+    parse_data_package,
+    parse_reference_heights,
+)
 
 
 def test_interpolate_tidal_heights():
@@ -32,3 +48,70 @@ def test_many_data_points():
     query = START + timedelta(hours=4242.5)
     result = interpolate_tidal_heights(data, [query])
     assert result[query] == 4242.5
+
+
+def test_interpolate_heights_array():
+    data = [
+        TideEntry(datetime(2021, 1, 3), "LOW", 0),
+        TideEntry(datetime(2021, 1, 1), "HIGH", 5.0),
+    ]
+    series = TideSeries.from_entries(data)
+    assert series.is_high.tolist() == [True, False], "Series should be sorted"
+
+    queries = np.array(["2021-01-01", "2021-01-02", "2021-01-03"], "datetime64[s]")
+    heights = interpolate_heights(series, queries)
+    assert heights.tolist() == [5.0, 2.5, 0.0]
+
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_methods_pass_through_events(method):
+    data = [
+        TideEntry(datetime(2021, 1, 1, 0, 0), "HIGH", 5.0),
+        TideEntry(datetime(2021, 1, 1, 6, 10), "LOW", 1.0),
+        TideEntry(datetime(2021, 1, 1, 12, 30), "HIGH", 6.0),
+        TideEntry(datetime(2021, 1, 1, 18, 35), "LOW", 0.5),
+    ]
+    series = TideSeries.from_entries(data)
+    interpolator = TideInterpolator(series, method)
+
+    events = series.times.view("datetime64[s]")
+    assert np.allclose(interpolator(events), series.heights)
+
+    # never overshoot the surrounding high and low waters
+    minutes = np.arange(events[0], events[-1], np.timedelta64(1, "m"))
+    heights = interpolator(minutes)
+    assert heights.min() >= 0.5 and heights.max() <= 6.0
+
+    # clamped outside the series
+    outside = np.array(["2020-12-31", "2021-01-02"], dtype="datetime64[s]")
+    assert interpolator(outside).tolist() == [5.0, 0.5]
+
+
+def test_cosine_rule_of_twelfths():
+    data = [
+        TideEntry(datetime(2021, 1, 1, 0), "LOW", 0.0),
+        TideEntry(datetime(2021, 1, 1, 6), "HIGH", 12.0),
+    ]
+    interpolator = TideInterpolator(TideSeries.from_entries(data), "cosine")
+    hours = np.array([f"2021-01-01T0{h}" for h in range(7)], dtype="datetime64[s]")
+    # the rule of twelfths gives 1, 3, 6, 9, 11 twelfths after each hour
+    assert np.allclose(interpolator(hours), [0, 1, 3, 6, 9, 11, 12], atol=0.25)
+
+
+def test_bad_method():
+    series = TideSeries.from_entries([TideEntry(datetime(2021, 1, 1), "HIGH", 5.0)])
+    with pytest.raises(ValueError):
+        TideInterpolator(series, "wibble")
+    assert TideInterpolator(series)(np.array(["2021-01-02"], "datetime64[s]")) == 5.0
+
+
+def test_accuracy_against_listing():
+    with open(EXAMPLE_FILE, "r") as file:
+        data_package = DataPackage(file.read())
+    series = TideSeries.from_entries(parse_data_package(data_package))
+    times, heights = parse_reference_heights(data_package)
+    assert len(times) > 80000
+
+    report = accuracy_report(series, times, heights)
+    assert report["cosine"]["rmse"] < report["linear"]["rmse"] / 3
+    assert report["pchip"]["rmse"] < report["linear"]["rmse"] / 3
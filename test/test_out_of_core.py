@@ -0,0 +1,88 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.out_of_core import (
+    QuarterBuckets,
+    chunk_size_for,
+    iter_input_chunks,
+)
+
+MEMORY_LIMIT = 8 * 2**20
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2024-01-01", "s").astype(np.int64)
+    end = np.datetime64("2024-10-01", "s").astype(np.int64)
+    times = rng.integers(start, end, 1_000_000).view("datetime64[s]")
+    path = str(tmp_path / "input.npy")
+    np.save(path, times)
+    return path
+
+
+def test_quarter_buckets(tmp_path):
+    buckets = QuarterBuckets(str(tmp_path))
+    times = np.array(
+        ["2024-05-01", "2024-01-02", "2024-04-03", "2024-01-04"], dtype="datetime64[s]"
+    )
+    buckets.add(times[:2], times[:2])
+    buckets.add(times[2:], times[2:])
+
+    assert buckets.total == 4
+    first, second = buckets.quarters()
+    assert second == first + 1
+    positions, utc_times = next(buckets.read(first, chunk_size=10))
+    assert positions.tolist() == [1, 3]
+    assert utc_times.tolist() == times[[1, 3]].tolist()
+    chunks = list(buckets.read(second, chunk_size=1))
+    assert [positions.tolist() for positions, _ in chunks] == [[0], [2]]
+    starts = [start for start, _ in buckets.read_times(chunk_size=3)]
+    assert starts == [0, 3]
+
+
+def test_iter_input_chunks(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("2024-01-01 00:00:00\n2024-01-02 00:00:00\n\n2024-01-03 00:00:00\n")
+    chunks = list(iter_input_chunks(str(path), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[1][0] == np.datetime64("2024-01-03")
+
+
+def test_out_of_core_matches_in_memory(cache_path, input_file, tmp_path):
+    outputs = {}
+    for memory_limit in (None, MEMORY_LIMIT):
+        outputs[memory_limit] = str(tmp_path / f"output_{memory_limit}.npy")
+        Client(
+            cache_path=cache_path,
+            silent=True,
+            input_file=input_file,
+            output_file=outputs[memory_limit],
+            method="pchip",
+            memory_limit=memory_limit,
+        ).run()
+    assert np.array_equal(np.load(outputs[None]), np.load(outputs[MEMORY_LIMIT]))
+
+
+def test_out_of_core_respects_memory_limit(cache_path, input_file, tmp_path):
+    assert chunk_size_for(MEMORY_LIMIT) < 1_000_000
+    client = Client(
+        cache_path=cache_path,
+        silent=True,
+        input_file=input_file,
+        output_file=str(tmp_path / "output.npy"),
+        memory_limit=MEMORY_LIMIT,
+    )
+    tracemalloc.start()
+    try:
+        client.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < MEMORY_LIMIT
+    # everything is evicted once the run is over
+    assert client.quarter_series == {}
+    assert len(np.load(str(tmp_path / "output.npy"))) == 1_000_000
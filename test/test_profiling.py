@@ -0,0 +1,87 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from conftest import EXAMPLE_FILE, EXAMPLES_2014, copy_examples
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.profiling import NullProfiler, Profiler
+from thames_tidal_helper.schema import CalendarQuarter
+
+
+def test_profiler_records_stages_and_counts():
+    profiler = Profiler()
+    with profiler.stage("fetch"):
+        pass
+    with profiler.stage("fetch"):
+        pass
+    profiler.count("cache_hits")
+    profiler.count("bytes_read", 100)
+
+    report = profiler.report()
+    assert report["stages"]["fetch"]["calls"] == 2
+    assert report["counters"] == {"bytes_read": 100, "cache_hits": 1}
+    assert report["queries_per_second"] is None
+
+
+def test_null_profiler_records_nothing():
+    profiler = NullProfiler()
+    with profiler.stage("fetch"):
+        profiler.count("cache_hits")
+    assert not profiler.enabled
+
+
+def test_client_run_report(tmp_path):
+    cache = copy_examples(tmp_path / "cache", EXAMPLES_2014)
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("2014-01-01 12:00:00\n2014-02-01 12:00:00\n")
+
+    profiler = Profiler()
+    client = Client(
+        cache_path=str(cache),
+        input_file=str(input_file),
+        output_file=str(tmp_path / "output.txt"),
+        silent=True,
+        profiler=profiler,
+    )
+    client.run()
+
+    report_file = tmp_path / "report.json"
+    profiler.write_report(str(report_file))
+    report = json.loads(report_file.read_text())
+    for stage in [
+        "run",
+        "cache_scan",
+        "input_load",
+        "cache_read",
+        "json_parse",
+        "parse_data_package",
+        "interpolator_build",
+        "interpolation",
+        "output_write",
+    ]:
+        assert stage in report["stages"], f"{stage} should be timed"
+    assert "fetch" not in report["stages"], "Nothing should be fetched"
+    assert report["counters"]["cache_hits"] == 1
+    assert report["counters"]["queries"] == 2
+    assert report["counters"]["bytes_read"] == os.path.getsize(EXAMPLE_FILE)
+    assert report["counters"]["entries"] > 90
+    assert report["queries_per_second"] > 0
+
+
+def test_bytes_are_counted_encoded(tmp_path):
+    with open("test/example_data/2024_Q1.json") as file:
+        payload = json.load(file)
+    payload["table"]["0"]["rows"]["0"][0]["moon"] = "½ lune"
+    text = json.dumps(payload, ensure_ascii=False)
+    response = MagicMock(text=text, content=text.encode())
+
+    profiler = Profiler()
+    data_manager = DataManager(str(tmp_path), profiler)
+    with patch("thames_tidal_helper.data_manager.req_get", return_value=response):
+        data_manager.get_quarters("Chelsea Bridge", [CalendarQuarter(2024, 1)])
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 1))
+
+    counters = profiler.report()["counters"]
+    assert counters["bytes_fetched"] == len(text.encode()) > len(text)
+    assert counters["bytes_read"] == os.path.getsize(tmp_path / "0113A_2024_Q1.json")
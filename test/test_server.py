@@ -0,0 +1,114 @@
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLES_2014, copy_examples
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.data_manager import ResponseError
+from thames_tidal_helper.server import RemoteClient, TideServer
+
+
+@pytest.fixture(scope="module")
+def cache_path(tmp_path_factory):
+    return copy_examples(tmp_path_factory.mktemp("server_cache"), EXAMPLES_2014)
+
+
+@pytest.fixture(scope="module")
+def server(cache_path):
+    client = Client(cache_path=cache_path, silent=True)
+    client.preload()
+    server = TideServer(client, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_preload_loads_every_cached_quarter(server):
+    assert server.client.loaded_sites() == ["Chelsea Bridge"]
+
+
+def test_remote_heights_match_local(server, cache_path):
+    times = np.arange(
+        np.datetime64("2014-01-02"), np.datetime64("2014-01-05"), np.timedelta64(7, "m")
+    ).astype("datetime64[s]")
+    local = Client(cache_path=cache_path, silent=True)
+    remote = RemoteClient(server.url, Client(cache_path=None))
+    for method in ["linear", "cosine"]:
+        assert np.array_equal(
+            remote.heights("Chelsea Bridge", times, method),
+            local.heights("Chelsea Bridge", times, method),
+        )
+
+
+def test_remote_errors_are_raised(server):
+    remote = RemoteClient(server.url, Client(cache_path=None))
+    with pytest.raises(ValueError, match="Wibble"):
+        remote.heights("Wibble", ["2014-01-02 00:00:00"])
+    # other failures are answered with a 500 rather than dropping the connection
+    with patch.object(
+        server.client, "heights", side_effect=OSError("cache unreadable")
+    ), pytest.raises(OSError, match="500: OSError: cache unreadable"):
+        remote.heights("Chelsea Bridge", ["2014-01-02 00:00:00"])
+
+
+def test_bad_queries_are_answered_with_400(server):
+    remote = RemoteClient(server.url, Client(cache_path=None))
+    with pytest.raises(ValueError, match="Wibble"):
+        remote.heights("Chelsea Bridge", ["2014-01-02 00:00:00"], method="Wibble")
+    request = urllib.request.Request(
+        f"{server.url}/heights?site=Chelsea+Bridge", data=b"1234567", method="POST"
+    )
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request)
+    assert error.value.code == 400
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [ResponseError("bad payload"), ValueError("corrupt cache file")],
+)
+def test_server_value_errors_are_answered_with_500(server, failure):
+    # a ValueError raised while answering a good query is not the caller's fault
+    remote = RemoteClient(server.url, Client(cache_path=None))
+    with patch.object(server.client, "heights", side_effect=failure), pytest.raises(
+        OSError, match=f"500: {type(failure).__name__}: {failure}"
+    ):
+        remote.heights("Chelsea Bridge", ["2014-01-02 00:00:00"])
+
+
+@pytest.mark.parametrize(
+    "option",
+    [
+        {"chainage": 20.0},
+        {"memory_limit": 2**20},
+        {"grid_step": 60},
+        {"harmonic_fallback": True},
+    ],
+)
+def test_remote_rejects_local_only_options(server, option):
+    with pytest.raises(ValueError, match=list(option)[0]):
+        RemoteClient(server.url, Client(cache_path=None, **option))
+
+
+def test_remote_run_writes_output(server, tmp_path):
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("2014-01-02 00:00:00\n2014-01-03 00:00:00\n")
+    output_file = tmp_path / "output.txt"
+    RemoteClient(
+        server.url,
+        Client(
+            cache_path=None,
+            input_file=str(input_file),
+            output_file=str(output_file),
+            silent=True,
+        ),
+    ).run()
+    lines = output_file.read_text().splitlines()
+    assert lines[0] == "Datetime, Tidal Height (m)"
+    assert lines[1].startswith("2014-01-02 00:00:00, ")
@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import patch
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.schema import TideSeries
+from thames_tidal_helper.spatial import (
+    bracketing_gauges,
+    chainage_from_position,
+    estimate_phase_lag,
+)
+
+HOUR = 3600
+
+
+def test_bracketing_gauges():
+    upstream, downstream, fraction = bracketing_gauges(26.0)
+    assert upstream.name == "Chelsea Bridge"
+    assert downstream.name == "London Bridge"
+    assert fraction == pytest.approx(0.5)
+
+    upstream, downstream, fraction = bracketing_gauges(4.0)
+    assert upstream.name == "Richmond"
+    assert fraction == 0.0
+
+
+def test_bracketing_gauges_outside_river():
+    with pytest.raises(ValueError):
+        bracketing_gauges(200.0)
+
+
+def test_gauges_sorted_by_chainage():
+    chainages = [gauge.chainage for gauge in API.GAUGES.by_chainage]
+    assert chainages == sorted(chainages)
+    assert "Walton on the Naze" not in [g.name for g in API.GAUGES.by_chainage]
+
+
+def test_chainage_from_position():
+    tilbury = API.GAUGES.find("Tilbury")
+    assert chainage_from_position(tilbury.latitude, tilbury.longitude) == (
+        pytest.approx(tilbury.chainage)
+    )
+    chelsea = API.GAUGES.find("Chelsea Bridge")
+    london = API.GAUGES.find("London Bridge")
+    chainage = chainage_from_position(
+        (chelsea.latitude + london.latitude) / 2,
+        (chelsea.longitude + london.longitude) / 2,
+    )
+    assert chelsea.chainage < chainage < london.chainage
+
+
+def make_series(first_high: int) -> TideSeries:
+    times = first_high + np.arange(8) * 6 * HOUR + np.arange(8) % 2 * 15 * 60
+    return TideSeries(
+        times, np.where(np.arange(8) % 2, 1.0, 6.0), np.arange(8) % 2 == 0
+    )
+
+
+def test_estimate_phase_lag():
+    downstream = make_series(0)
+    upstream = make_series(40 * 60)
+    assert estimate_phase_lag(upstream, downstream) == 40 * 60
+    assert estimate_phase_lag(upstream, make_series(5 * HOUR)) == 0.0
+
+
+def test_heights_at_chainage():
+    with patch("thames_tidal_helper.client.DataManager"):
+        client = Client(phase_lag=HOUR)
+    sampled = {}
+
+    def heights(site, times, method=None, timezone=None):
+        sampled[site] = times
+        return np.full(len(times), 2.0 if site == "Chelsea Bridge" else 4.0)
+
+    times = np.array(["2024-01-01 12:00:00"], dtype="datetime64[s]")
+    with patch.object(client, "heights", side_effect=heights):
+        result = client.heights_at_chainage(23.5, times)
+
+    # a quarter of the way from Chelsea Bridge to London Bridge
+    assert result == pytest.approx([2.5])
+    assert sampled["Chelsea Bridge"][0] == times[0] + np.timedelta64(900, "s")
+    assert sampled["London Bridge"][0] == times[0] - np.timedelta64(2700, "s")
@@ -0,0 +1,171 @@
+import gc
+import os
+import stat
+import subprocess
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from conftest import EXAMPLES_2024
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.schema import CalendarQuarter, parse_data_package_series
+from thames_tidal_helper.store import TideStore, publish_cache
+
+
+@pytest.fixture
+def examples():
+    return EXAMPLES_2024[:2]
+
+
+@pytest.fixture
+def store_path(tmp_path, cache_path):
+    store = str(tmp_path / "store")
+    publish_cache(cache_path, store)
+    yield store
+    TideStore(store).teardown()
+
+
+def test_publish_and_attach(cache_path, store_path):
+    quarter = CalendarQuarter(2024, 2)
+    store = TideStore(store_path)
+    series = store.attach("Chelsea Bridge", quarter)
+    data = DataManager(cache_path).get_from_cache("Chelsea Bridge", quarter)
+    expected = parse_data_package_series(data)
+    np.testing.assert_array_equal(series.times, expected.times)
+    np.testing.assert_array_equal(series.heights, expected.heights)
+    np.testing.assert_array_equal(series.is_high, expected.is_high)
+    # views of the read-only mapping, not copies
+    assert not series.heights.flags.writeable
+    assert not series.heights.flags.owndata
+    assert store.attach("Chelsea Bridge", CalendarQuarter(2024, 3)) is None
+    store.close()
+
+
+def test_attach_needs_a_ready_store(tmp_path):
+    store = TideStore(str(tmp_path / "store"))
+    assert store.attach("Chelsea Bridge", CalendarQuarter(2024, 1)) is None
+
+
+def test_refcounts(store_path):
+    name = TideStore.entry_name("Chelsea Bridge", CalendarQuarter(2024, 1), "utc")
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from thames_tidal_helper.schema import CalendarQuarter\n"
+            "from thames_tidal_helper.store import TideStore\n"
+            f"store = TideStore({store_path!r})\n"
+            "store.attach('Chelsea Bridge', CalendarQuarter(2024, 1))\n"
+            "print('attached', flush=True)\n"
+            "sys.stdin.readline()\n",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "attached"
+        store = TideStore(store_path)
+        assert store.refcounts()[name] == 1
+        store.attach("Chelsea Bridge", CalendarQuarter(2024, 1))
+        assert store.refcounts()[name] == 2
+        store.close()
+        assert store.refcounts()[name] == 1
+    finally:
+        holder.communicate("\n")
+    assert TideStore(store_path).refcounts()[name] == 0
+
+
+def test_leases_are_released_when_collected(store_path):
+    name = TideStore.entry_name("Chelsea Bridge", CalendarQuarter(2024, 1), "utc")
+    store = TideStore(store_path)
+    store.attach("Chelsea Bridge", CalendarQuarter(2024, 1))
+    assert TideStore(store_path).refcounts()[name] == 1
+    del store
+    gc.collect()
+    assert TideStore(store_path).refcounts()[name] == 0
+
+
+def test_leases_are_checked_without_signals_on_windows(store_path):
+    name = TideStore.entry_name("Chelsea Bridge", CalendarQuarter(2024, 1), "utc")
+    store = TideStore(store_path)
+    store.attach("Chelsea Bridge", CalendarQuarter(2024, 1))
+    # on Windows, os.kill would terminate the process holding the lease
+    with patch("thames_tidal_helper.files.sys.platform", "win32"), patch(
+        "thames_tidal_helper.files.windows_pid_alive", return_value=True
+    ), patch("os.kill", side_effect=AssertionError("signalled")):
+        assert store.refcounts()[name] == 1
+    store.close()
+
+
+def test_published_files_are_read_only(store_path):
+    names = os.listdir(store_path)
+    assert not [name for name in names if name.endswith(".tmp")]
+    for name in TideStore(store_path).entries():
+        mode = os.stat(os.path.join(store_path, name)).st_mode
+        assert not mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def test_teardown(store_path):
+    store = TideStore(store_path)
+    series = store.attach("Chelsea Bridge", CalendarQuarter(2024, 1))
+    report = TideStore(store_path).teardown()
+    assert report["removed"] == 2
+    assert list(report["in_use"].values()) == [1]
+    assert not os.path.exists(store_path)
+    # the mapping stays valid for the process holding it
+    assert len(series.heights) > 0 and np.isfinite(series.heights).all()
+    assert store.attach("Chelsea Bridge", CalendarQuarter(2024, 2)) is None
+    store.close()
+
+
+def test_client_attaches_instead_of_parsing(tmp_path, store_path):
+    client = Client(
+        cache_path=str(tmp_path / "empty"),
+        site="Chelsea Bridge",
+        silent=True,
+        store_directory=store_path,
+    )
+    times = np.array(["2024-02-01T12:00:00", "2024-05-01T12:00:00"], "datetime64[s]")
+    with patch("thames_tidal_helper.client.parse_data_package_series") as mock_parse:
+        heights = client.heights("Chelsea Bridge", times)
+    mock_parse.assert_not_called()
+    assert np.isfinite(heights).all()
+    assert not client.quarter_series[
+        ("Chelsea Bridge", CalendarQuarter(2024, 1))
+    ].times.flags.writeable
+    client.store.close()
+
+
+def test_lone_quarter_is_not_copied(tmp_path, cache_path):
+    # without neighbours to lend it edge events, the quarter is used as it is
+    os.remove(os.path.join(cache_path, "0113A_2024_Q1.json"))
+    store_path = str(tmp_path / "lone")
+    publish_cache(cache_path, store_path)
+    client = Client(
+        cache_path=str(tmp_path / "empty"), silent=True, store_directory=store_path
+    )
+    series = client.load_series("Chelsea Bridge", [CalendarQuarter(2024, 2)])
+    assert not series.heights.flags.writeable
+    client.store.close()
+    TideStore(store_path).teardown()
+
+
+def test_attached_arrays_are_contiguous(store_path):
+    store = TideStore(store_path)
+    series = store.attach("Chelsea Bridge", CalendarQuarter(2024, 1))
+    for array in (series.times, series.heights, series.is_high):
+        assert array.flags.c_contiguous and array.flags.aligned
+    store.close()
+
+
+def test_publishing_an_empty_cache(tmp_path):
+    cache = tmp_path / "cache"
+    os.mkdir(cache)
+    store_path = str(tmp_path / "store")
+    assert publish_cache(str(cache), store_path)["published"] == []
+    assert TideStore(store_path).ready
@@ -0,0 +1,117 @@
+import os
+import threading
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.integrity import check_file
+from thames_tidal_helper.load_test import run_load_test
+from thames_tidal_helper.schema import CalendarQuarter, DataPackage
+from thames_tidal_helper.stub_server import (
+    DEFAULT_EXAMPLES_DIRECTORY,
+    SPRING_NEAP_SECONDS,
+    PayloadGenerator,
+    StubServer,
+    load_template,
+)
+
+
+@pytest.fixture(scope="module")
+def generator():
+    return PayloadGenerator(load_template())
+
+
+@pytest.fixture
+def stub(generator):
+    def start(**options):
+        server = StubServer(generator, port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        API.set_root(server.url)
+        return server
+
+    servers = []
+    previous_root = API.root
+    yield start
+    API.root = previous_root
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_template_is_whole_cycles(generator):
+    template = generator.template
+    assert generator.period % SPRING_NEAP_SECONDS == 0
+    assert template.times[-1] - template.times[0] < generator.period
+    assert np.all(np.diff(template.times) > 0)
+
+
+def test_payload_is_schema_correct(generator, tmp_path):
+    payload = generator.payload(2031, 4, 1)
+    DataManager.check_response(
+        DataPackage(payload), CalendarQuarter(2031, 2).index() * 3
+    )
+    path = tmp_path / "0113A_2031_Q2.json"
+    path.write_text(payload)
+    assert check_file(str(tmp_path), path.name, None)["problems"] == []
+
+
+def test_examples_are_found_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert os.path.isabs(DEFAULT_EXAMPLES_DIRECTORY)
+    assert len(load_template().times) > 0
+
+
+def test_prepared_payloads_are_served(stub, generator, tmp_path):
+    server = stub()
+    server.prepare([(2031, 4, 1)])
+    with patch.object(generator, "payload") as payload:
+        DataManager(str(tmp_path)).get_quarters(
+            "Chelsea Bridge", [CalendarQuarter(2031, 2)]
+        )
+    payload.assert_not_called()
+    assert os.path.exists(tmp_path / "0113A_2031_Q2.json")
+
+
+def test_set_root_adds_slash(stub):
+    API.set_root("http://127.0.0.1:1/gauge_data")
+    assert API.root == "http://127.0.0.1:1/gauge_data/"
+
+
+def test_fetch_from_stub(stub, tmp_path):
+    server = stub()
+    data_manager = DataManager(str(tmp_path))
+    data_manager.get_quarters("Chelsea Bridge", [CalendarQuarter(2031, 2)])
+    assert os.path.exists(tmp_path / "0113A_2031_Q2.json")
+    assert server.stats()["ok"] == 1
+
+
+def test_failed_fetch_is_not_cached(stub, tmp_path):
+    stub(error_rate=1.0)
+    data_manager = DataManager(str(tmp_path))
+    # the error page is rejected before anything is cached
+    with pytest.raises(ValueError):
+        data_manager.get_quarters("Chelsea Bridge", [CalendarQuarter(2031, 2)])
+    assert not os.path.exists(tmp_path / "0113A_2031_Q2.json")
+
+
+def test_load_test():
+    previous_root = API.root
+    # every level is served from payloads built before timing
+    build = PayloadGenerator.payload
+    with patch.object(
+        PayloadGenerator, "payload", autospec=True, side_effect=build
+    ) as payload:
+        report = run_load_test(
+            quarters=2, concurrency=(1, 2), truncate_rate=0.3, seed=1
+        )
+    assert payload.call_count == 2
+    assert API.root == previous_root
+    assert [level["workers"] for level in report["levels"]] == [1, 2]
+    for level in report["levels"]:
+        assert level["fetched"] == 2
+        assert level["failed"] == []
+        assert level["cache_ok"]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from conftest import EXAMPLE_FILE
+from thames_tidal_helper.schema import (
+    DataPackage,
+    TideSeries,
+    parse_data_package,
+    parse_data_package_series,
+)
+from thames_tidal_helper.timezones import to_utc, uk_offsets, uk_to_utc, utc_to_uk
+
+
+def test_bst_transitions():
+    # 2024: BST from 01:00 UTC on 31 March to 01:00 UTC on 27 October
+    utc = np.array(
+        [
+            "2024-03-31T00:59:59",
+            "2024-03-31T01:00:00",
+            "2024-10-27T00:59:59",
+            "2024-10-27T01:00:00",
+            "1999-07-01T00:00:00",
+        ],
+        dtype="datetime64[s]",
+    )
+    assert uk_offsets(utc.view(np.int64)).tolist() == [0, 3600, 3600, 0, 3600]
+    # the hour after the clocks go back is ambiguous in UK time, so is read as BST
+    round_trip = uk_to_utc(utc_to_uk(utc))
+    assert np.array_equal(round_trip[[0, 1, 2, 4]], utc[[0, 1, 2, 4]])
+    assert round_trip[3] == utc[3] - np.timedelta64(1, "h")
+
+
+def test_uk_to_utc_edge_cases():
+    local = np.array(
+        ["2024-07-01T12:00", "2024-10-27T01:30", "2024-03-31T01:30"],
+        dtype="datetime64[s]",
+    )
+    expected = np.array(
+        ["2024-07-01T11:00", "2024-10-27T00:30", "2024-03-31T01:30"],
+        dtype="datetime64[s]",
+    )
+    assert np.array_equal(uk_to_utc(local), expected)
+    assert np.array_equal(to_utc(local, "utc"), local)
+    with pytest.raises(ValueError):
+        to_utc(local, "wibble")
+
+
+def test_series_parsing_matches_entries():
+    with open(EXAMPLE_FILE, "r") as file:
+        data_package = DataPackage(file.read())
+    expected = TideSeries.from_entries(parse_data_package(data_package))
+    series = parse_data_package_series(data_package)
+    assert np.array_equal(series.times, expected.times)
+    assert np.array_equal(series.heights, expected.heights)
+    assert np.array_equal(series.is_high, expected.is_high)
+
+    data_package.json_data["TimeOffset"] = "1"
+    shifted = parse_data_package_series(data_package)
+    assert np.array_equal(shifted.times, expected.times - 3600)
+
+
+def test_series_parsing_from_uk_time():
+    with open(EXAMPLE_FILE, "r") as file:
+        data_package = DataPackage(file.read())
+    # rename the January to March table to July to September, inside BST
+    for month_data, name in zip(
+        data_package.table.values(), ["July 2014", "August 2014", "September 2014"]
+    ):
+        month_data["name"] = name
+    local = parse_data_package_series(data_package)
+    utc = parse_data_package_series(data_package, table_timezone="uk")
+    assert np.array_equal(utc.times, local.times - 3600)
@@ -0,0 +1,162 @@
+import gc
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from conftest import EXAMPLES_2014, EXAMPLES_2024, copy_examples
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.schema import CalendarQuarter
+from thames_tidal_helper.usage import (
+    INDEX_FILENAME,
+    PINS_DIRECTORY,
+    CacheUsage,
+    cache_stats,
+    live_pins,
+    parse_size,
+    prune_cache,
+)
+
+
+@pytest.fixture
+def examples():
+    return EXAMPLES_2024 + EXAMPLES_2014
+
+
+def file_size(cache_path, filename):
+    return os.path.getsize(os.path.join(cache_path, filename))
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("1.5K") == 1536
+    assert parse_size("2G") == 2 * 2**30
+    assert parse_size("10mb") == 10 * 2**20
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_cache_stats(cache_path):
+    stats = cache_stats(cache_path)
+    years = stats["sites"]["Chelsea Bridge"]
+    assert years["2024"]["quarters"] == 3
+    assert years["2014"]["bytes"] == file_size(cache_path, "0113A_2014_Q1.json")
+    assert stats["total_bytes"] == sum(year["bytes"] for year in years.values())
+
+
+def test_accesses_are_recorded(cache_path):
+    data_manager = DataManager(cache_path)
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 2))
+    with open(os.path.join(cache_path, INDEX_FILENAME)) as file:
+        index = json.load(file)
+    assert list(index) == ["0113A_2024_Q2"]
+    assert index["0113A_2024_Q2"]["accessed"] == pytest.approx(time.time(), abs=60)
+    assert live_pins(cache_path) == {"0113A_2024_Q2"}
+    data_manager.usage.close()
+    assert live_pins(cache_path) == set()
+
+
+def test_recording_is_best_effort(cache_path):
+    data_manager = DataManager(cache_path)
+    # as for a read-only cache
+    with patch(
+        "thames_tidal_helper.usage.write_json", side_effect=PermissionError("read-only")
+    ):
+        assert data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 1))
+    assert not os.path.exists(os.path.join(cache_path, INDEX_FILENAME))
+
+
+def test_concurrent_recording_keeps_every_entry(cache_path):
+    usages = [CacheUsage(cache_path) for _ in range(4)]
+    entries = [
+        f"0113A_{year}_Q{quarter}"
+        for year in range(2000, 2004)
+        for quarter in (1, 2, 3, 4)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(
+            pool.map(
+                lambda i: usages[i % 4].record(f"{entries[i]}.json"),
+                range(len(entries)),
+            )
+        )
+    with open(os.path.join(cache_path, INDEX_FILENAME)) as file:
+        assert sorted(json.load(file)) == sorted(entries)
+
+
+def test_pins_are_released_when_collected(cache_path):
+    usage = CacheUsage(cache_path)
+    usage.record("0113A_2024_Q1.json")
+    assert live_pins(cache_path) == {"0113A_2024_Q1"}
+    del usage
+    gc.collect()
+    assert live_pins(cache_path) == set()
+
+
+def test_pins_are_checked_without_signals_on_windows(cache_path):
+    data_manager = DataManager(cache_path)
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 2))
+    # on Windows, os.kill would terminate the process holding the pin
+    with patch("thames_tidal_helper.files.sys.platform", "win32"), patch(
+        "thames_tidal_helper.files.windows_pid_alive", return_value=True
+    ) as alive, patch("os.kill", side_effect=AssertionError("signalled")):
+        assert live_pins(cache_path) == {"0113A_2024_Q2"}
+    alive.assert_called_once_with(os.getpid())
+    data_manager.usage.close()
+
+
+def test_prune_evicts_least_recently_used(cache_path):
+    data_manager = DataManager(cache_path)
+    # use the oldest files, so only the index makes them recent
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 1))
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 2))
+    data_manager.usage.close()
+
+    max_size = file_size(cache_path, "0113A_2024_Q1.json") * 2 + 1024
+    report = prune_cache(cache_path, max_size)
+    assert report["removed"] == ["0113A_2024_Q3", "0113A_2014_Q1"]
+    assert report["after_bytes"] <= max_size
+    remaining = sorted(f for f in os.listdir(cache_path) if f.endswith(".json"))
+    assert remaining == ["0113A_2024_Q1.json", "0113A_2024_Q2.json", INDEX_FILENAME]
+
+
+def test_prune_keeps_quarters_in_use(cache_path):
+    data_manager = DataManager(cache_path)
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2014, 1))
+    # a pin left behind by a job that has died is ignored and cleaned up
+    dead_pin = os.path.join(cache_path, PINS_DIRECTORY, "999999999.1.pin")
+    with open(dead_pin, "w") as file:
+        json.dump(["0113A_2024_Q1"], file)
+
+    report = prune_cache(cache_path, 0)
+    assert report["pinned"] == ["0113A_2014_Q1"]
+    assert sorted(report["removed"]) == [f"0113A_2024_Q{q}" for q in (1, 2, 3)]
+    assert report["after_bytes"] == file_size(cache_path, "0113A_2014_Q1.json")
+    assert not os.path.exists(dead_pin)
+
+
+def test_max_size_enforced_after_fetch(cache_path):
+    with open("test/example_data/2024_Q3.json") as file:
+        response = MagicMock(text=file.read())
+    os.remove(os.path.join(cache_path, "0113A_2024_Q3.json"))
+    max_size = file_size(cache_path, "0113A_2024_Q1.json") * 2 + 1024
+    data_manager = DataManager(cache_path, max_size=max_size)
+    data_manager.get_from_cache("Chelsea Bridge", CalendarQuarter(2024, 1))
+
+    with patch("thames_tidal_helper.data_manager.req_get", return_value=response):
+        data_manager.get_quarters("Chelsea Bridge", [CalendarQuarter(2024, 3)])
+
+    assert data_manager.contents == {
+        ("Chelsea Bridge", CalendarQuarter(2024, 1)),
+        ("Chelsea Bridge", CalendarQuarter(2024, 3)),
+    }
+    assert cache_stats(cache_path)["total_bytes"] <= max_size
+
+
+def test_four_character_codes_are_counted(cache_path):
+    copy_examples(cache_path, ["2024_Q3"], code="0110")
+    stats = cache_stats(cache_path)
+    assert stats["sites"]["Southend"]["2024"]["quarters"] == 1
@@ -0,0 +1,143 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import requests
+
+from conftest import EXAMPLES_2014, EXAMPLES_2024
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.interpolation import INTERPOLATION_METHODS, TideInterpolator
+from thames_tidal_helper.schema import TideSeries
+from thames_tidal_helper.windows import find_windows, summarise_windows
+
+HOUR = 3600
+
+
+@pytest.fixture
+def examples():
+    return EXAMPLES_2014
+
+
+def seconds(value) -> np.datetime64:
+    return np.datetime64(value, "s")
+
+
+def sawtooth() -> TideSeries:
+    # low waters of 0 m and high waters of 4 m, six hours apart
+    return TideSeries(
+        np.arange(5) * 6 * HOUR,
+        np.array([0.0, 4.0, 0.0, 4.0, 0.0]),
+        np.array([False, True, False, True, False]),
+    )
+
+
+@pytest.mark.parametrize(
+    "method, offset",
+    # a quarter of the rise is reached a quarter of the way (linear), or a third of the
+    # way (cosine), through the interval
+    [("linear", 1.5 * HOUR), ("cosine", 2 * HOUR)],
+)
+def test_crossings_are_solved_analytically(method, offset):
+    interpolator = TideInterpolator(sawtooth(), method)
+    times, rising = interpolator.crossings(1.0)
+    expected = [offset, 12 * HOUR - offset, 12 * HOUR + offset, 24 * HOUR - offset]
+    np.testing.assert_allclose(times, expected)
+    assert rising.tolist() == [True, False, True, False]
+    np.testing.assert_allclose(
+        interpolator(np.rint(times).astype(np.int64).view("datetime64[s]")),
+        1.0,
+        atol=1e-3,
+    )
+
+
+def test_pchip_crossings_are_on_the_curve():
+    series = TideSeries(
+        np.array([0, 5, 11, 18, 24]) * HOUR,
+        np.array([0.5, 6.2, -0.3, 5.8, 0.1]),
+        np.array([False, True, False, True, False]),
+    )
+    interpolator = TideInterpolator(series, "pchip")
+    times, rising = interpolator.crossings(3.0)
+    assert len(times) == 4 and rising.tolist() == [True, False, True, False]
+    heights = interpolator(np.rint(times).astype(np.int64).view("datetime64[s]"))
+    np.testing.assert_allclose(heights, 3.0, atol=1e-3)
+
+
+def test_find_windows():
+    interpolator = TideInterpolator(sawtooth(), "linear")
+    windows = find_windows(interpolator, 2.0, seconds(0), seconds(7 * HOUR))
+    # the period ends within the second window, which is closed at the end
+    assert windows["start"].view(np.int64).tolist() == [3 * HOUR]
+    assert windows["end"].view(np.int64).tolist() == [7 * HOUR]
+    assert windows["extreme_time"].view(np.int64).tolist() == [6 * HOUR]
+    assert windows["extreme_height"].tolist() == [4.0]
+
+    windows = find_windows(
+        interpolator, 2.0, seconds(HOUR), seconds(24 * HOUR), below=True
+    )
+    assert (windows["start"].view(np.int64) // HOUR).tolist() == [1, 9, 21]
+    assert (windows["end"].view(np.int64) // HOUR).tolist() == [3, 15, 24]
+    assert windows["extreme_height"].tolist() == [1 / 3 * 2, 0.0, 0.0]
+
+
+def test_windows_with_crossings_on_the_bounds():
+    interpolator = TideInterpolator(sawtooth(), "linear")
+    # the tide rises through 2 m at 03:00 and falls through it at 09:00
+    windows = find_windows(interpolator, 2.0, seconds(3 * HOUR), seconds(7 * HOUR))
+    assert windows["start"].view(np.int64).tolist() == [3 * HOUR]
+    assert windows["end"].view(np.int64).tolist() == [7 * HOUR]
+
+    windows = find_windows(interpolator, 2.0, seconds(0), seconds(9 * HOUR))
+    assert windows["start"].view(np.int64).tolist() == [3 * HOUR]
+    assert windows["end"].view(np.int64).tolist() == [9 * HOUR]
+
+    # below the threshold until it is reached again at the end
+    windows = find_windows(interpolator, 2.0, seconds(9 * HOUR), seconds(15 * HOUR))
+    assert len(windows) == 0
+
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_windows_match_per_minute_heights(cache_path, method):
+    client = Client(cache_path=cache_path, silent=True)
+    windows = client.windows(
+        "Chelsea Bridge", "2014-01-05", "2014-02-05", 5.0, method=method
+    )
+    minutes = np.arange(
+        seconds("2014-01-05"), seconds("2014-02-05"), np.timedelta64(60, "s")
+    )
+    above = client.heights("Chelsea Bridge", minutes, method=method) > 5.0
+    assert len(windows) == np.count_nonzero(np.diff(above.astype(int)) == 1)
+    in_windows = np.zeros(len(minutes), dtype=bool)
+    for window in windows:
+        in_windows |= (minutes >= window["start"]) & (minutes <= window["end"])
+    # the brute-force answer differs by at most a minute at each end of each window
+    assert np.count_nonzero(in_windows != above) <= 2 * len(windows)
+    heights = client.heights("Chelsea Bridge", windows["extreme_time"], method=method)
+    np.testing.assert_allclose(heights, windows["extreme_height"])
+    assert len(summarise_windows(windows)) == len(windows)
+
+
+def test_windows_in_uk_time(cache_path):
+    client = Client(cache_path=cache_path, silent=True)
+    utc = client.windows("Chelsea Bridge", "2014-03-20", "2014-03-31", 5.0)
+    # the same period, as BST starts on 30 March 2014
+    uk = client.windows(
+        "Chelsea Bridge", "2014-03-20", "2014-03-31T01:00", 5.0, timezone="uk"
+    )
+    offsets = (uk["start"] - utc["start"]).view(np.int64)
+    assert set(offsets[utc["start"] < seconds("2014-03-30T01:00")].tolist()) == {0}
+    assert set(offsets[utc["start"] > seconds("2014-03-30T01:00")].tolist()) == {HOUR}
+
+
+@pytest.mark.parametrize("examples", [EXAMPLES_2024[:1]])
+def test_period_end_is_exclusive(cache_path):
+    client = Client(cache_path=cache_path, silent=True)
+    # the period ends as Q2 starts, so Q2 is not needed and nothing is fetched
+    with patch(
+        "thames_tidal_helper.data_manager.req_get",
+        side_effect=requests.ConnectionError("offline"),
+    ) as mock_get:
+        windows = client.windows("Chelsea Bridge", "2024-03-01", "2024-04-01", 5.0)
+    mock_get.assert_not_called()
+    assert len(windows) > 0
+    assert windows["end"][-1] <= seconds("2024-04-01")
@@ -1,15 +1,38 @@
 import argparse
+import cProfile
+import json
+import sys
 
+from thames_tidal_helper.api_adapter import API
 from thames_tidal_helper.client import Client
+from thames_tidal_helper.data_manager import FETCH_GRANULARITIES
+from thames_tidal_helper.interpolation import INTERPOLATION_METHODS
+from thames_tidal_helper.profiling import Profiler
+from thames_tidal_helper.timezones import TIMEZONES
+from thames_tidal_helper.config import (
+    API_ROOT_VARIABLE,
+    DEFAULT_SERVER_HOST,
+    DEFAULT_SERVER_PORT,
+    DEFAULT_STUB_PORT,
+)
+from thames_tidal_helper.grid import GRID_SOURCES
+from thames_tidal_helper.store import DEFAULT_STORE_DIRECTORY
+from thames_tidal_helper.usage import EVICTION_POLICIES, parse_size
 
 
 def define_parser():
     parser = argparse.ArgumentParser(description="Thames Tidal Data Helper")
     parser.add_argument(
-        "--input", type=str, default="input.txt", help="Path to the input file"
+        "--input",
+        type=str,
+        default="input.txt",
+        help="Path to the input file: text lines, a .npy array, or '-' for stdin",
     )
     parser.add_argument(
-        "--output", type=str, default="output.txt", help="Path to the output file"
+        "--output",
+        type=str,
+        default="output.txt",
+        help="Path to the output file: text lines, or a .npy array of heights",
     )
     parser.add_argument(
         "--site",
@@ -17,27 +40,654 @@ def define_parser():
         default="Chelsea Bridge",
         help="Site name for tidal data. See the README for options.",
     )
+    parser.add_argument(
+        "--chainage",
+        type=float,
+        default=None,
+        help="Position along the river, in km downstream of Teddington Lock, instead of a site",
+    )
+    parser.add_argument(
+        "--position",
+        type=str,
+        default=None,
+        help="Position as 'LAT,LON', projected onto the river, instead of a site",
+    )
+    parser.add_argument(
+        "--phase-lag",
+        type=float,
+        default=None,
+        help="Seconds for high water to travel between the gauges either side of the position",
+    )
+    parser.add_argument(
+        "--amplitude-weight",
+        type=float,
+        default=None,
+        help="Weight of the downstream gauge, from 0 to 1 (default: by distance)",
+    )
     parser.add_argument(
         "--cache", type=str, default="./.cache/", help="Path to the cache directory"
     )
+    parser.add_argument(
+        "--cache-max-size",
+        type=parse_size,
+        default=None,
+        help="Keep the cache under this size (e.g. 2G), evicting quarters not in use",
+    )
+    parser.add_argument(
+        "--eviction-policy",
+        type=str,
+        default="lru",
+        choices=EVICTION_POLICIES,
+        help="Evict the least recently used, or least recently fetched, quarters first",
+    )
+    parser.add_argument(
+        "--fetch-granularity",
+        type=str,
+        default="quarter",
+        choices=FETCH_GRANULARITIES,
+        help="Fetch whole quarters, only the windows of months the input needs, or whichever needs fewer requests",
+    )
+    parser.add_argument(
+        "--method",
+        type=str,
+        default="linear",
+        choices=INTERPOLATION_METHODS,
+        help="Curve used between high and low waters",
+    )
+    parser.add_argument(
+        "--timezone",
+        type=str,
+        default="utc",
+        choices=TIMEZONES,
+        help="Timezone of the input times: UTC, or UK civil time (GMT/BST)",
+    )
+    parser.add_argument(
+        "--table-timezone",
+        type=str,
+        default="utc",
+        choices=TIMEZONES,
+        help="Timezone of the PLA tables: UTC, or UK civil time (GMT/BST)",
+    )
+    parser.add_argument(
+        "--grid-step",
+        type=int,
+        default=None,
+        help="Look heights up in cached grids sampled every this many seconds",
+    )
+    parser.add_argument(
+        "--grid-source",
+        type=str,
+        default="interpolated",
+        choices=GRID_SOURCES,
+        help="Build grids from the interpolated curve, or from the payload listing where available",
+    )
+    parser.add_argument(
+        "--grid-nearest",
+        action="store_true",
+        help="Take the nearest grid sample instead of refining linearly between samples",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=None,
+        help="Process the input out of core, within about this many MB of working memory",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        type=str,
+        default=None,
+        help="Directory for the temporary files of --memory-limit (default: the system temp directory)",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        nargs="?",
+        const=DEFAULT_STORE_DIRECTORY,
+        default=None,
+        help=f"Attach to quarters published in a shared store (default: {DEFAULT_STORE_DIRECTORY})",
+    )
+    parser.add_argument(
+        "--harmonic-fallback",
+        action="store_true",
+        help="Predict quarters that cannot be fetched from a harmonic model of the cache",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Write a JSON report of per-stage timings and counters to this path ('-' for stderr)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=str,
+        default=None,
+        help="Dump cProfile statistics for the run to this path",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a server holding all cached quarters in memory",
+    )
+    parser.add_argument(
+        "--host", type=str, default=DEFAULT_SERVER_HOST, help="Host for --serve to bind"
+    )
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_SERVER_PORT, help="Port for --serve to bind"
+    )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help="URL of a running server (e.g. http://127.0.0.1:8765) to send queries to",
+    )
+    parser.add_argument(
+        "--api-root",
+        type=str,
+        default=None,
+        help=f"Root URL of the PLA API, e.g. a stub server's (default: ${API_ROOT_VARIABLE} or the PLA's)",
+    )
     parser.add_argument(
         "--silent", action="store_true", help="Suppress output to console"
     )
 
+    commands = parser.add_subparsers(dest="command")
+    cache = commands.add_parser("cache", help="Maintain the cache")
+    cache_commands = cache.add_subparsers(dest="cache_command", required=True)
+    for name, description in (
+        ("verify", "Check every cache file and report any problems"),
+        ("repair", "Check every cache file, quarantining and fetching bad ones again"),
+        ("stats", "Show the bytes cached per site and year, and when they were used"),
+        ("prune", "Evict the least recently used quarters down to a size limit"),
+    ):
+        cache_command = cache_commands.add_parser(name, help=description)
+        cache_command.add_argument(
+            "--cache",
+            type=str,
+            default=argparse.SUPPRESS,
+            help="Path to the cache directory",
+        )
+        cache_command.add_argument(
+            "--report",
+            type=str,
+            default=None,
+            help="Write the full report as JSON to this path ('-' for stdout)",
+        )
+        if name in ("verify", "repair"):
+            cache_command.add_argument(
+                "--workers",
+                type=int,
+                default=None,
+                help="Number of processes checking files (default: one per CPU)",
+            )
+        if name == "repair":
+            cache_command.add_argument(
+                "--no-fetch",
+                action="store_true",
+                help="Only quarantine bad files, without fetching them again",
+            )
+        if name == "prune":
+            cache_command.add_argument(
+                "--max-size",
+                type=parse_size,
+                required=True,
+                help="Size to prune the cache down to, e.g. 500M or 2G",
+            )
+            cache_command.add_argument(
+                "--policy",
+                type=str,
+                default="lru",
+                choices=EVICTION_POLICIES,
+                help="Evict the least recently used, or least recently fetched, quarters first",
+            )
+
+    windows = commands.add_parser(
+        "windows",
+        help="Find the windows in a period when the height is above, or below, a level",
+    )
+    threshold = windows.add_mutually_exclusive_group(required=True)
+    threshold.add_argument(
+        "--above", type=float, help="Find when the height is above this many metres"
+    )
+    threshold.add_argument(
+        "--below",
+        type=float,
+        help="Find when the height is at or below this many metres",
+    )
+    windows.add_argument(
+        "--start", type=str, required=True, help="Start of the period, e.g. 2024-01-01"
+    )
+    windows.add_argument(
+        "--end", type=str, required=True, help="End of the period, e.g. 2024-04-01"
+    )
+    windows.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the windows to this file as well as printing them",
+    )
+    # as for a normal run, but also accepted after the command
+    for name, choices, description in (
+        ("--site", None, "Site name for tidal data"),
+        ("--cache", None, "Path to the cache directory"),
+        ("--method", INTERPOLATION_METHODS, "Curve used between high and low waters"),
+        ("--timezone", TIMEZONES, "Timezone of the period and of the windows"),
+        ("--table-timezone", TIMEZONES, "Timezone of the PLA tables"),
+    ):
+        windows.add_argument(
+            name,
+            type=str,
+            choices=choices,
+            default=argparse.SUPPRESS,
+            help=description,
+        )
+
+    harmonics = commands.add_parser(
+        "harmonics", help="Fit and test the harmonic models used offline"
+    )
+    harmonics_commands = harmonics.add_subparsers(
+        dest="harmonics_command", required=True
+    )
+    for name, description in (
+        ("fit", "Fit a site's harmonic model to its cached quarters and save it"),
+        ("report", "Test the model on each cached quarter, fitted to the others"),
+    ):
+        harmonics_command = harmonics_commands.add_parser(name, help=description)
+        for option, option_help in (
+            ("--site", "Site name for tidal data"),
+            ("--cache", "Path to the cache directory"),
+        ):
+            harmonics_command.add_argument(
+                option, type=str, default=argparse.SUPPRESS, help=option_help
+            )
+        harmonics_command.add_argument(
+            "--report",
+            type=str,
+            default=None,
+            help="Write the full report as JSON to this path ('-' for stdout)",
+        )
+
+    stub = commands.add_parser(
+        "stub", help="Serve synthetic PLA payloads locally, for testing fetches"
+    )
+    stub.add_argument(
+        "--port", type=int, default=DEFAULT_STUB_PORT, help="Port for the stub to bind"
+    )
+    load_test = commands.add_parser(
+        "load-test",
+        help="Measure fetch throughput and resilience against a stub server",
+    )
+    load_test.add_argument(
+        "--quarters", type=int, default=8, help="Number of quarters to fetch per run"
+    )
+    load_test.add_argument(
+        "--concurrency",
+        type=lambda value: tuple(int(part) for part in value.split(",")),
+        default=(1, 2, 4, 8),
+        help="Comma-separated numbers of fetching threads to run with (default: 1,2,4,8)",
+    )
+    load_test.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Times to try a failed quarter again before giving up",
+    )
+    load_test.add_argument(
+        "--report",
+        type=str,
+        default=None,
+        help="Write the full report as JSON to this path ('-' for stdout)",
+    )
+    for stub_command in (stub, load_test):
+        stub_command.add_argument(
+            "--examples",
+            type=str,
+            default=None,
+            help="Directory of example payloads whose tides the stub repeats (default: test/example_data)",
+        )
+        stub_command.add_argument(
+            "--latency", type=float, default=0.0, help="Seconds to delay each response"
+        )
+        stub_command.add_argument(
+            "--jitter",
+            type=float,
+            default=0.0,
+            help="Up to this many more seconds of random delay per response",
+        )
+        stub_command.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests answered with a 503 error",
+        )
+        stub_command.add_argument(
+            "--truncate-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of responses cut off halfway through",
+        )
+        stub_command.add_argument(
+            "--graph-days",
+            type=int,
+            default=2,
+            help="Days of per-minute graphs per payload; 59 makes payloads of about 3 MB",
+        )
+        stub_command.add_argument(
+            "--listing-days",
+            type=int,
+            default=2,
+            help="Days of per-minute listing per payload",
+        )
+        stub_command.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed for the random delays and failures",
+        )
+
+    store = commands.add_parser(
+        "store", help="Manage the shared store of parsed quarters on this host"
+    )
+    store_commands = store.add_subparsers(dest="store_command", required=True)
+    for name, description in (
+        ("publish", "Parse every cached quarter once and publish it to the store"),
+        ("status", "Show the published quarters and how many processes use each"),
+        ("teardown", "Remove the store once the processes using it have finished"),
+    ):
+        store_command = store_commands.add_parser(name, help=description)
+        store_command.add_argument(
+            "--store",
+            type=str,
+            default=DEFAULT_STORE_DIRECTORY,
+            help="Path to the store directory",
+        )
+        if name == "publish":
+            store_command.add_argument(
+                "--cache",
+                type=str,
+                default=argparse.SUPPRESS,
+                help="Path to the cache directory",
+            )
+            store_command.add_argument(
+                "--table-timezone",
+                type=str,
+                default=argparse.SUPPRESS,
+                choices=TIMEZONES,
+                help="Timezone of the PLA tables, as for runs attaching to the store",
+            )
+        if name == "teardown":
+            store_command.add_argument(
+                "--timeout",
+                type=float,
+                default=0.0,
+                help="Seconds to wait for processes to release the store first",
+            )
+
     return parser
 
 
+def run_cache_command(args) -> int:
+    if args.cache_command == "stats":
+        from thames_tidal_helper.usage import cache_stats, summarise_stats
+
+        report = cache_stats(args.cache)
+        summary, status = summarise_stats(report), 0
+    elif args.cache_command == "prune":
+        from thames_tidal_helper.usage import prune_cache, summarise_prune
+
+        report = prune_cache(args.cache, args.max_size, args.policy)
+        summary = summarise_prune(report)
+        status = 1 if report["after_bytes"] > report["max_bytes"] else 0
+    else:
+        from thames_tidal_helper.integrity import summarise, verify_cache
+
+        repair = args.cache_command == "repair"
+        report = verify_cache(
+            args.cache,
+            repair=repair,
+            fetch=repair and not args.no_fetch,
+            workers=args.workers,
+        )
+        summary = summarise(report)
+        # fail if anything bad is left in the cache
+        status = 1 if report["refetch_failed" if repair else "bad"] else 0
+
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        if args.report:
+            with open(args.report, "w") as file:
+                file.write(json.dumps(report, indent=2) + "\n")
+        if not args.silent:
+            print(summary)
+    return status
+
+
+def run_windows_command(args) -> int:
+    from thames_tidal_helper.windows import WINDOWS_HEADER, summarise_windows
+
+    client = Client(
+        cache_path=args.cache,
+        site=args.site,
+        silent=args.silent,
+        method=args.method,
+        timezone=args.timezone,
+        table_timezone=args.table_timezone,
+        fetch_granularity=args.fetch_granularity,
+    )
+    below = args.below is not None
+    windows = client.windows(
+        args.site,
+        args.start,
+        args.end,
+        args.below if below else args.above,
+        below=below,
+    )
+    lines = summarise_windows(windows)
+    if not args.silent:
+        for line in [WINDOWS_HEADER, *lines]:
+            print(line)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write("\n".join([WINDOWS_HEADER, *lines]) + "\n")
+    return 0
+
+
+def run_harmonics_command(args) -> int:
+    from thames_tidal_helper.data_manager import DataManager
+    from thames_tidal_helper.files import write_atomic
+    from thames_tidal_helper.harmonics import (
+        fit_cached,
+        holdout_report,
+        model_path,
+        summarise_holdout,
+    )
+
+    data_manager = DataManager(args.cache)
+    if args.harmonics_command == "fit":
+        model = fit_cached(data_manager, args.site, table_timezone=args.table_timezone)
+        path = model_path(args.cache, args.site, args.table_timezone)
+        write_atomic(path, json.dumps(model.to_dict(), indent=2))
+        report = model.to_dict()
+        summary = (
+            f"Fitted {len(model.constituents)} constituents to {len(model.quarters)} "
+            f"quarters for {model.site}, saved to {path}"
+        )
+    else:
+        report = holdout_report(data_manager, args.site, args.table_timezone)
+        summary = summarise_holdout(report)
+    data_manager.usage.close()
+
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        if args.report:
+            with open(args.report, "w") as file:
+                file.write(json.dumps(report, indent=2) + "\n")
+        if not args.silent:
+            print(summary)
+    return 0
+
+
+def run_stub_command(args) -> int:
+    from thames_tidal_helper.stub_server import DEFAULT_EXAMPLES_DIRECTORY
+
+    stub_options = {
+        "examples_directory": args.examples or DEFAULT_EXAMPLES_DIRECTORY,
+        "graph_days": args.graph_days,
+        "listing_days": args.listing_days,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "truncate_rate": args.truncate_rate,
+        "seed": args.seed,
+    }
+    if args.command == "stub":
+        from thames_tidal_helper.stub_server import serve_stub
+
+        serve_stub(args.host, args.port, silent=args.silent, **stub_options)
+        return 0
+
+    from thames_tidal_helper.load_test import run_load_test, summarise_load_test
+
+    report = run_load_test(
+        site=args.site,
+        quarters=args.quarters,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        api_root=args.api_root,
+        **stub_options,
+    )
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        if args.report:
+            with open(args.report, "w") as file:
+                file.write(json.dumps(report, indent=2) + "\n")
+        if not args.silent:
+            print(summarise_load_test(report))
+    # fail if any quarter could not be fetched, or the cache was left bad
+    failed = any(level["failed"] or not level["cache_ok"] for level in report["levels"])
+    return 1 if failed else 0
+
+
+def run_store_command(args) -> int:
+    from thames_tidal_helper.store import TideStore, publish_cache
+
+    if args.store_command == "publish":
+        report = publish_cache(args.cache, args.store, args.table_timezone)
+        summary = (
+            f"Published {len(report['published'])} quarters to {report['store']} "
+            f"({report['seconds']:.2f}s)"
+        )
+        status = 0
+    elif args.store_command == "status":
+        report = TideStore(args.store).status()
+        in_use = sum(1 for count in report["refcounts"].values() if count)
+        summary = (
+            f"{report['store']}: {report['quarters']} quarters, "
+            f"{report['bytes']} bytes, {in_use} in use"
+            f"{'' if report['ready'] else ', not ready'}"
+        )
+        status = 0 if report["ready"] else 1
+    else:
+        report = TideStore(args.store).teardown(args.timeout)
+        summary = f"Removed {report['removed']} quarters from {report['store']}"
+        if report["in_use"]:
+            summary += f", {len(report['in_use'])} still mapped by running processes"
+        status = 0
+    if not args.silent:
+        print(summary)
+    return status
+
+
 def main():
     parser = define_parser()
     args = parser.parse_args()
+    if args.api_root and args.command != "load-test":
+        API.set_root(args.api_root)
+    if args.command == "cache":
+        sys.exit(run_cache_command(args))
+    if args.command == "windows":
+        if args.harmonic_fallback:
+            parser.error("--harmonic-fallback cannot be used with windows")
+        sys.exit(run_windows_command(args))
+    if args.command == "harmonics":
+        sys.exit(run_harmonics_command(args))
+    if args.command in ("stub", "load-test"):
+        sys.exit(run_stub_command(args))
+    if args.command == "store":
+        sys.exit(run_store_command(args))
+    # the server module (and http.server) is only imported when it is used
+    if args.serve:
+        from thames_tidal_helper.server import serve
+
+        serve(
+            args.cache,
+            args.host,
+            args.port,
+            args.method,
+            args.silent,
+            args.table_timezone,
+        )
+        return
+
+    chainage = args.chainage
+    if args.position:
+        from thames_tidal_helper.spatial import chainage_from_position
+
+        latitude, longitude = (float(value) for value in args.position.split(","))
+        chainage = chainage_from_position(latitude, longitude)
+
+    profiler = Profiler() if args.profile else None
+    cprofiler = cProfile.Profile() if args.cprofile else None
+    if args.harmonic_fallback and args.grid_step:
+        parser.error("--harmonic-fallback cannot be used with --grid-step")
+    if cprofiler:
+        cprofiler.enable()
     client = Client(
         input_file=args.input,
         output_file=args.output,
         site=args.site,
-        cache_path=args.cache,
+        # a server owns the cache, so none is opened locally
+        cache_path=None if args.server else args.cache,
+        silent=args.silent,
+        method=args.method,
+        profiler=profiler,
+        grid_step=args.grid_step,
+        grid_source=args.grid_source,
+        grid_refine=not args.grid_nearest,
+        timezone=args.timezone,
+        table_timezone=args.table_timezone,
+        chainage=chainage,
+        phase_lag=args.phase_lag,
+        amplitude_weight=args.amplitude_weight,
+        fetch_granularity=args.fetch_granularity,
+        memory_limit=args.memory_limit and args.memory_limit * 2**20,
+        spill_directory=args.spill_dir,
+        cache_max_size=args.cache_max_size,
+        eviction_policy=args.eviction_policy,
+        store_directory=args.store,
+        harmonic_fallback=args.harmonic_fallback,
     )
+    if args.server:
+        from thames_tidal_helper.server import RemoteClient
+
+        if args.cache_max_size is not None:
+            # the server owns the cache, so no local cache is opened to cap
+            parser.error("Not supported when querying a server: cache_max_size.")
+
+        try:
+            client = RemoteClient(args.server, client)
+        except ValueError as e:
+            parser.error(str(e))
     client.run()
 
+    if cprofiler:
+        cprofiler.disable()
+        cprofiler.dump_stats(args.cprofile)
+    if profiler:
+        profiler.write_report(args.profile)
+
 
 if __name__ == "__main__":
     main()
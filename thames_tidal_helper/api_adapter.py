@@ -1,48 +1,123 @@
 """Module to interact with the PLA Tidal Predictions API"""
 
+import os
+
+from thames_tidal_helper.config import API_ROOT_VARIABLE, DEFAULT_API_ROOT
+
+# PLA site codes, e.g. "0113A" or "0110", as they appear in cache filenames
+SITE_CODE_PATTERN = r"[A-Za-z0-9]{4,5}"
+
 
 class API:
-    root = "https://tidepredictions.pla.co.uk/gauge_data/"
+    root = os.environ.get(API_ROOT_VARIABLE) or DEFAULT_API_ROOT
 
     class TidalGauge:
-        def __init__(self, name: str, code: str):
+        def __init__(
+            self,
+            name: str,
+            code: str,
+            aliases: tuple[str, ...] = (),
+            chainage: float | None = None,
+            latitude: float | None = None,
+            longitude: float | None = None,
+        ):
             self.name = name
             self.code = code
+            self.aliases = aliases
+            # approximate km downstream of Teddington Lock, for gauges on the river's course
+            self.chainage = chainage
+            self.latitude = latitude
+            self.longitude = longitude
+
+        def __repr__(self) -> str:
+            return f"{self.name} ({self.code})"
+
+    class GaugeRegistry:
+        """
+        Gauges indexed by name, alias and code for O(1) lookups in either direction.
+
+        Names and aliases are matched ignoring case and repeated whitespace.
+        """
+
+        def __init__(self, gauges: set["API.TidalGauge"]):
+            self.gauges = sorted(gauges, key=lambda gauge: gauge.code)
+            self.by_code: dict[str, API.TidalGauge] = {}
+            self.by_label: dict[str, API.TidalGauge] = {}
+            for gauge in self.gauges:
+                self.by_code[gauge.code.upper()] = gauge
+                for label in (gauge.name, gauge.code, *gauge.aliases):
+                    key = self.normalise(label)
+                    if self.by_label.setdefault(key, gauge) is not gauge:
+                        raise ValueError(f"Gauge label {label} is not unique.")
+            # gauges on the river's course, from upstream to downstream
+            self.by_chainage = sorted(
+                (gauge for gauge in self.gauges if gauge.chainage is not None),
+                key=lambda gauge: gauge.chainage,
+            )
+
+        @staticmethod
+        def normalise(label: str) -> str:
+            return " ".join(label.split()).casefold()
+
+        def find(self, site: str) -> "API.TidalGauge | None":
+            """Return the gauge for a name, alias or code, or None"""
+            return self.by_label.get(self.normalise(site))
+
+        def find_code(self, code: str) -> "API.TidalGauge | None":
+            """Return the gauge for a site code, or None"""
+            return self.by_code.get(code.strip().upper())
 
     TIDAL_GAUGES = {
-        TidalGauge("Margate", "0103"),
-        TidalGauge("Southend", "0110"),
-        TidalGauge("Coryton", "0110A"),
-        TidalGauge("Tilbury", "0111"),
-        TidalGauge("North Woolwich", "0112"),
-        TidalGauge("London Bridge", "0113"),
-        TidalGauge("Chelsea Bridge", "0113A"),
-        TidalGauge("Richmond", "0116"),
-        TidalGauge("Shivering Sand", "0116A"),
-        TidalGauge("Walton on the Naze", "0129"),
+        TidalGauge("Margate", "0103", (), 127.0, 51.3906, 1.3838),
+        TidalGauge("Southend", "0110", ("Southend-on-Sea",), 95.0, 51.5072, 0.7167),
+        TidalGauge("Coryton", "0110A", (), 82.0, 51.5067, 0.5150),
+        TidalGauge("Tilbury", "0111", (), 72.0, 51.4553, 0.3519),
+        TidalGauge("North Woolwich", "0112", ("Woolwich",), 47.0, 51.4993, 0.0640),
+        TidalGauge("London Bridge", "0113", (), 31.0, 51.5075, -0.0877),
+        TidalGauge("Chelsea Bridge", "0113A", ("Chelsea",), 21.0, 51.4846, -0.1497),
+        TidalGauge("Richmond", "0116", (), 4.0, 51.4596, -0.3084),
+        TidalGauge("Shivering Sand", "0116A", (), 110.0, 51.4989, 1.0755),
+        TidalGauge(
+            "Walton on the Naze",
+            "0129",
+            ("Walton-on-the-Naze", "Walton"),
+            None,
+            51.8470,
+            1.2740,
+        ),
     }
 
+    GAUGES = GaugeRegistry(TIDAL_GAUGES)
+
     @staticmethod
     def site_to_code(site: str) -> str:
         """Return the site code for a named site"""
-        try:
-            gauge = next(gauge for gauge in API.TIDAL_GAUGES if gauge.name == site)
-            return gauge.code
-        except StopIteration:
+        gauge = API.GAUGES.find(site)
+        if gauge is None:
             raise ValueError(
                 f"Site code for {site} not found. Please add it to the API.SITES list."
             )
+        return gauge.code
 
     @staticmethod
     def code_to_site(code: str) -> str:
         """Return the site name for a site code"""
-        try:
-            gauge = next(gauge for gauge in API.TIDAL_GAUGES if gauge.code == code)
-            return gauge.name
-        except StopIteration:
+        gauge = API.GAUGES.find_code(code)
+        if gauge is None:
             raise ValueError(
                 f"Site name for {code} not found. Please add it to the API.SITES list."
             )
+        return gauge.name
+
+    @staticmethod
+    def canonical_site(site: str) -> str:
+        """Return the canonical name for a site name, alias or code"""
+        return API.code_to_site(API.site_to_code(site))
+
+    @staticmethod
+    def set_root(root: str) -> None:
+        """Send queries to another API root, such as a local stub server"""
+        API.root = root if root.endswith("/") else f"{root}/"
 
     @staticmethod
     def query_url(site: str, year: int, month: int, day: int):
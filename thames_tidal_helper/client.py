@@ -1,28 +1,145 @@
 """Client module for the Thames Tidal Helper package."""
 
+import io
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
 from datetime import datetime
+from typing import Sequence
 
-from thames_tidal_helper.data_manager import DataManager
-from thames_tidal_helper.schema import TideEntry, CalendarQuarter, parse_data_package
-from thames_tidal_helper.interpolation import interpolate_tidal_heights
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.data_manager import DataManager, ResponseError
+from thames_tidal_helper.schema import (
+    TideEntry,
+    TideSeries,
+    CalendarQuarter,
+    parse_data_package,
+    parse_data_package_series,
+    parse_reference_heights,
+)
+from thames_tidal_helper.grid import GRID_SOURCES, HeightGrid
+from thames_tidal_helper.harmonics import HarmonicModel, load_model
+from thames_tidal_helper.interpolation import TideInterpolator
 from thames_tidal_helper.config import DEFAULT_CACHE_PATH
+from thames_tidal_helper.out_of_core import (
+    QuarterBuckets,
+    chunk_size_for,
+    iter_input_chunks,
+)
+from thames_tidal_helper.profiling import NullProfiler
+from thames_tidal_helper.store import TideStore
+from thames_tidal_helper.spatial import (
+    blend_heights,
+    bracketing_gauges,
+    estimate_phase_lag,
+)
+from thames_tidal_helper.timezones import TIMEZONES, to_utc, utc_to_uk
+from thames_tidal_helper.windows import find_windows
+
+NPY_MAGIC = b"\x93NUMPY"
+# Seconds before a quarter that could not be fetched is tried again, with harmonic_fallback
+UNAVAILABLE_RETRY_SECONDS = 600
+# Events taken from each neighbouring quarter, enough for PCHIP's slopes at a boundary
+EDGE_EVENTS = 2
 
 
 class Client:
     def __init__(
         self,
-        cache_path: str = DEFAULT_CACHE_PATH,
+        cache_path: str | None = DEFAULT_CACHE_PATH,
         site: str = "Chelsea Bridge",
         silent: bool = False,
         input_file: str = "input.txt",
         output_file: str = "output.txt",
+        method: str = "linear",
+        profiler: NullProfiler | None = None,
+        grid_step: int | None = None,
+        grid_source: str = "interpolated",
+        grid_refine: bool = True,
+        timezone: str = "utc",
+        table_timezone: str = "utc",
+        chainage: float | None = None,
+        phase_lag: float | None = None,
+        amplitude_weight: float | None = None,
+        fetch_granularity: str = "quarter",
+        memory_limit: int | None = None,
+        spill_directory: str | None = None,
+        cache_max_size: int | None = None,
+        eviction_policy: str = "lru",
+        store_directory: str | None = None,
+        harmonic_fallback: bool = False,
     ):
-        self.cache = DataManager(cache_directory=cache_path)
+        if grid_source not in GRID_SOURCES:
+            raise ValueError(
+                f"Grid source {grid_source} not found. Choose from {GRID_SOURCES}."
+            )
+        if timezone not in TIMEZONES or table_timezone not in TIMEZONES:
+            raise ValueError(f"Timezones must be one of {TIMEZONES}.")
+        if harmonic_fallback and grid_step:
+            raise ValueError("A harmonic fallback cannot be used with a height grid.")
+        self.profiler = profiler or NullProfiler()
+        # without a cache path nothing is loaded locally, e.g. when a server answers queries
+        self.cache = (
+            DataManager(
+                cache_directory=cache_path,
+                profiler=self.profiler,
+                fetch_granularity=fetch_granularity,
+                max_size=cache_max_size,
+                eviction_policy=eviction_policy,
+            )
+            if cache_path is not None
+            else None
+        )
+        self.fetch_granularity = fetch_granularity
         self.site = site
         self.entry_list: list[TideEntry] = []
         self.input_file = input_file
         self.output_file = output_file
         self.silent = silent
+        self.method = method
+        # Timezone of the query times, and of the PLA tables; series are stored in UTC
+        self.timezone = timezone
+        self.table_timezone = table_timezone
+        # Parsed quarters, kept across calls, and the last series merged from them per site,
+        # with the (series, slice) pieces it was merged from
+        self.quarter_series: dict[tuple[str, CalendarQuarter], TideSeries] = {}
+        self.site_series: dict[
+            str, tuple[tuple[tuple[TideSeries, slice], ...], TideSeries]
+        ] = {}
+        # Months (since 1970-01) held by each parsed quarter, which may be partial
+        self.loaded_months: dict[tuple[str, CalendarQuarter], set[int]] = {}
+        # Interpolators keyed by (site, method), with the series they were built from
+        self.interpolators: dict[
+            tuple[str, str], tuple[TideSeries, TideInterpolator]
+        ] = {}
+        # Regular-interval height tables, used instead of the interpolators if grid_step is set
+        self.grid_step = grid_step
+        self.grid_source = grid_source
+        self.grid_refine = grid_refine
+        self.grids: dict[tuple[str, CalendarQuarter, str], HeightGrid] = {}
+        # A position along the river, used instead of the site if set
+        self.chainage = chainage
+        self.phase_lag = phase_lag
+        self.amplitude_weight = amplitude_weight
+        # Process the input out of core, in chunks within this many bytes, if set
+        self.memory_limit = memory_limit
+        self.spill_directory = spill_directory
+        # A node-local store of published quarters, attached to instead of parsing
+        self.store = TideStore(store_directory) if store_directory else None
+        # Predict quarters that cannot be fetched from a harmonic model of the cached ones
+        self.harmonic_fallback = harmonic_fallback
+        self.harmonic_models: dict[str, HarmonicModel] = {}
+        # One lock per site, so a model is fitted once without holding up other sites
+        self.model_locks: dict[str, threading.Lock] = {}
+        # Quarters that could not be fetched, and when to try them again (monotonic time)
+        self.unavailable: dict[tuple[str, CalendarQuarter], float] = {}
+        self.lock = threading.Lock()
+        # One lock per (site, quarter), so concurrent misses for a key parse it once
+        self.load_locks: dict[tuple[str, CalendarQuarter], threading.Lock] = {}
 
     def populate_entry_list(self, quarters: list[CalendarQuarter]) -> None:
         for quarter in quarters:
@@ -33,28 +150,582 @@ class Client:
             assert len(entries) > 0, f"No entries found for {quarter}."
             self.entry_list.extend(entries)
 
-    def print_results(self, results: dict[datetime, float]) -> None:
-        for dt, height in results.items():
-            print(f"{dt}, {height}")
+    def load_series(
+        self,
+        site: str,
+        quarters: list[CalendarQuarter],
+        months: np.ndarray | None = None,
+    ) -> TideSeries:
+        """
+        Return a series covering the given quarters of a site, loading them from the cache
+        (fetching them if needed) if they are not already in memory.
+        Unless fetching whole quarters, only the given months (since 1970-01) are required.
+        The edge events of neighbouring quarters are included where they are held locally,
+        so the curve near a boundary does not depend on which quarters were asked for.
 
-    def run(self):
-        """Parse input, get the DataManager to run any queries, load the data, interpolate tidal heights, print/save results."""
-        datetimes = self.load_input_datetimes(self.input_file)
-        # convert to quarters, remove duplicates
-        quarters_to_query = list(
-            set([CalendarQuarter.from_datetime(dt) for dt in datetimes])
+        The client lock is only held while memory is looked up or updated, so a slow fetch
+        does not hold up queries for other quarters or sites. Per-quarter locks make sure
+        each quarter is still fetched and parsed once.
+        """
+        quarters = sorted(set(quarters))
+        needed = {quarter: set(quarter.month_indices()) for quarter in quarters}
+        if months is not None and self.fetch_granularity != "quarter":
+            for quarter in quarters:
+                needed[quarter].intersection_update(months.tolist())
+        parts = self.loaded_parts(site, quarters, needed)
+        missing = [q for q in quarters if q not in parts]
+        with ExitStack() as stack:
+            # locks are always taken in quarter order, so loads cannot deadlock
+            for quarter in missing:
+                stack.enter_context(self.load_lock(site, quarter))
+            # another thread may have loaded them while we waited
+            parts.update(self.loaded_parts(site, missing, needed))
+            missing = [q for q in quarters if q not in parts]
+            if missing and self.store is not None:
+                parts.update(self.attach_quarters(site, missing))
+                missing = [q for q in missing if q not in parts]
+            if missing:
+                self.load_quarters(site, missing, needed, parts)
+
+        pieces = self.series_pieces(site, quarters, parts)
+        if len(pieces) == 1:
+            # used as it is, so a quarter attached from a store is not copied
+            return pieces[0][0]
+        with self.lock:
+            cached = self.site_series.get(site)
+            if (
+                cached is not None
+                and len(cached[0]) == len(pieces)
+                and all(a is b and i == j for (a, i), (b, j) in zip(cached[0], pieces))
+            ):
+                return cached[1]
+        series = TideSeries(
+            np.concatenate([series.times[part] for series, part in pieces]),
+            np.concatenate([series.heights[part] for series, part in pieces]),
+            np.concatenate([series.is_high[part] for series, part in pieces]),
+        )
+        with self.lock:
+            # the last merged series per site, so repeated queries reuse its interpolator
+            self.site_series[site] = (tuple(pieces), series)
+        return series
+
+    def series_pieces(
+        self,
+        site: str,
+        quarters: list[CalendarQuarter],
+        parts: dict[CalendarQuarter, TideSeries],
+    ) -> list[tuple[TideSeries, slice]]:
+        """
+        Return the (series, slice) pieces of the sorted quarters' merged series, in time
+        order: each quarter whole, with EDGE_EVENTS events from each neighbouring quarter
+        that was not asked for but is held locally.
+        """
+        indices = {quarter.index() for quarter in quarters}
+        pieces = []
+        for quarter in quarters:
+            index = quarter.index()
+            if index - 1 not in indices:
+                previous = CalendarQuarter.from_index(index - 1)
+                series = self.neighbour_series(
+                    site, previous, previous.month_indices()[-1]
+                )
+                if series is not None:
+                    pieces.append((series, slice(-EDGE_EVENTS, None)))
+            pieces.append((parts[quarter], slice(None)))
+            if index + 1 not in indices:
+                following = CalendarQuarter.from_index(index + 1)
+                series = self.neighbour_series(
+                    site, following, following.month_indices()[0]
+                )
+                if series is not None:
+                    pieces.append((series, slice(EDGE_EVENTS)))
+        return pieces
+
+    def neighbour_series(
+        self, site: str, quarter: CalendarQuarter, month: int
+    ) -> TideSeries | None:
+        """
+        Return the series of a quarter holding the given month (since 1970-01) if it is in
+        memory, the store or the cache, or None. Nothing is fetched for a neighbour.
+        """
+        with self.lock:
+            if month in self.loaded_months.get((site, quarter), set()):
+                return self.quarter_series[(site, quarter)]
+        if self.cache is None:
+            return None
+        with self.load_lock(site, quarter):
+            with self.lock:
+                if month in self.loaded_months.get((site, quarter), set()):
+                    return self.quarter_series[(site, quarter)]
+            if self.store is not None:
+                attached = self.attach_quarters(site, [quarter])
+                if attached:
+                    return attached[quarter]
+            months = self.cache.cached_months(site, quarter)
+            if month not in months:
+                return None
+            series = self.parse_quarter(site, quarter)
+            with self.lock:
+                self.quarter_series[(site, quarter)] = series
+                self.loaded_months[(site, quarter)] = months
+            return series
+
+    def parse_quarter(self, site: str, quarter: CalendarQuarter) -> TideSeries:
+        """Parse a cached quarter into a series"""
+        data = self.cache.get_from_cache(site, quarter)
+        if not data:
+            raise ValueError(f"Data for {quarter} not found in cache.")
+        with self.profiler.stage("parse_data_package"):
+            series = parse_data_package_series(data, self.table_timezone)
+        assert len(series) > 0, f"No entries found for {quarter}."
+        self.profiler.count("entries", len(series))
+        return series
+
+    def load_quarters(
+        self,
+        site: str,
+        missing: list[CalendarQuarter],
+        needed: dict[CalendarQuarter, set[int]],
+        parts: dict[CalendarQuarter, TideSeries],
+    ) -> None:
+        """Fetch if needed and parse quarters, adding them to memory and to parts"""
+        if self.fetch_granularity == "quarter":
+            self.cache.get_quarters(site, missing)
+        else:
+            self.cache.get_months(site, [month for q in missing for month in needed[q]])
+        loaded_months = {}
+        for quarter in missing:
+            parts[quarter] = self.parse_quarter(site, quarter)
+            if self.fetch_granularity == "quarter":
+                loaded_months[quarter] = needed[quarter]
+            else:
+                loaded_months[quarter] = self.cache.cached_months(site, quarter)
+        with self.lock:
+            for quarter in missing:
+                self.quarter_series[(site, quarter)] = parts[quarter]
+                self.loaded_months[(site, quarter)] = loaded_months[quarter]
+
+    def loaded_parts(
+        self,
+        site: str,
+        quarters: list[CalendarQuarter],
+        needed: dict[CalendarQuarter, set[int]],
+    ) -> dict[CalendarQuarter, TideSeries]:
+        """Return the series of the quarters already in memory with their needed months"""
+        with self.lock:
+            return {
+                q: self.quarter_series[(site, q)]
+                for q in quarters
+                if needed[q] <= self.loaded_months.get((site, q), set())
+            }
+
+    def load_lock(self, site: str, quarter: CalendarQuarter) -> threading.Lock:
+        """Return the lock guarding the parsing of a (site, quarter) key"""
+        with self.lock:
+            return self.load_locks.setdefault((site, quarter), threading.Lock())
+
+    def attach_quarters(
+        self, site: str, quarters: list[CalendarQuarter]
+    ) -> dict[CalendarQuarter, TideSeries]:
+        """Map the quarters published in the shared store, returning their series"""
+        attached = {}
+        for quarter in quarters:
+            series = self.store.attach(site, quarter, self.table_timezone)
+            if series is not None:
+                self.profiler.count("store_attaches")
+                attached[quarter] = series
+        with self.lock:
+            for quarter, series in attached.items():
+                self.quarter_series[(site, quarter)] = series
+                self.loaded_months[(site, quarter)] = set(quarter.month_indices())
+        return attached
+
+    def loaded_sites(self) -> list[str]:
+        """Return the sites with quarters in memory"""
+        with self.lock:
+            return sorted({site for site, _ in self.quarter_series})
+
+    def preload(self) -> None:
+        """Load every quarter in the cache into memory, for all sites"""
+        quarters_by_site: dict[str, list[CalendarQuarter]] = {}
+        months_by_site: dict[str, list[int]] = {}
+        for site, quarter in self.cache.contents | set(self.cache.partial):
+            quarters_by_site.setdefault(site, []).append(quarter)
+            months = self.cache.cached_months(site, quarter)
+            months_by_site.setdefault(site, []).extend(months)
+        for site, quarters in quarters_by_site.items():
+            # partial quarters are loaded as they are, without fetching the other months
+            months = np.array(months_by_site[site], dtype=np.int64)
+            self.load_series(site, sorted(quarters), months)
+
+    def evict(self, keep: set[CalendarQuarter]) -> None:
+        """Drop the parsed quarters, interpolators and grids outside the given quarters"""
+        with self.lock:
+            for key in [key for key in self.quarter_series if key[1] not in keep]:
+                del self.quarter_series[key]
+                self.loaded_months.pop(key, None)
+            # merged series and interpolators are rebuilt on the next load
+            kept = {id(series) for series in self.quarter_series.values()}
+            self.site_series = {
+                site: merged
+                for site, merged in self.site_series.items()
+                if all(id(piece[0]) in kept for piece in merged[0])
+            }
+            in_use = kept | {id(merged[1]) for merged in self.site_series.values()}
+            self.interpolators = {
+                key: value
+                for key, value in self.interpolators.items()
+                if id(value[0]) in in_use
+            }
+            self.grids = {
+                key: grid for key, grid in self.grids.items() if key[1] in keep
+            }
+
+    def load_interpolator(
+        self,
+        site: str,
+        quarters: list[CalendarQuarter],
+        method: str,
+        months: np.ndarray | None = None,
+    ) -> TideInterpolator:
+        """Return an interpolator over the given quarters, reusing its coefficients"""
+        series = self.load_series(site, quarters, months)
+        with self.lock:
+            cached = self.interpolators.get((site, method))
+            if cached is None or cached[0] is not series:
+                with self.profiler.stage("interpolator_build"):
+                    cached = (series, TideInterpolator(series, method))
+                self.interpolators[(site, method)] = cached
+            return cached[1]
+
+    def load_grid(self, site: str, quarter: CalendarQuarter, method: str) -> HeightGrid:
+        """
+        Return the height grid for a site and quarter, from memory, from the cache, or
+        built from the quarter's data and saved to the cache for later runs.
+        The grid samples the same curve as the interpolators, carried into the edge events
+        of the neighbouring quarters, so it is rebuilt when either neighbour is cached.
+        """
+        name = (
+            f"grid-{self.grid_source}-{method}-{self.table_timezone}-{self.grid_step}s"
+        )
+        with self.lock:
+            grid = self.grids.get((site, quarter, name))
+        if grid is not None:
+            return grid
+
+        start = int(quarter.bounds()[0].astype(np.int64))
+        neighbours = [CalendarQuarter.from_index(quarter.index() + i) for i in (-1, 1)]
+        heights = self.cache.read_array(site, quarter, name, neighbours)
+        if heights is not None:
+            grid = HeightGrid(start, self.grid_step, heights)
+        else:
+            interpolator = TideInterpolator(self.load_series(site, [quarter]), method)
+            reference = None
+            if self.grid_source == "listing":
+                reference = parse_reference_heights(
+                    self.cache.get_from_cache(site, quarter)
+                )
+            with self.profiler.stage("grid_build"):
+                grid = HeightGrid.build(
+                    quarter, self.grid_step, interpolator, reference
+                )
+            self.cache.write_array(site, quarter, name, grid.heights)
+        with self.lock:
+            return self.grids.setdefault((site, quarter, name), grid)
+
+    def grid_heights(self, site: str, times: np.ndarray, method: str) -> np.ndarray:
+        """Look up heights in the per-quarter grids"""
+        quarter_indices = CalendarQuarter.index_datetime64(times)
+        heights = np.empty(len(times), dtype=np.float64)
+        for index in np.unique(quarter_indices):
+            grid = self.load_grid(site, CalendarQuarter.from_index(int(index)), method)
+            in_quarter = quarter_indices == index
+            with self.profiler.stage("grid_lookup"):
+                heights[in_quarter] = grid(times[in_quarter], self.grid_refine)
+        return heights
+
+    def heights(
+        self,
+        site: str,
+        times: Sequence | np.ndarray,
+        method: str | None = None,
+        timezone: str | None = None,
+        quarters: list[CalendarQuarter] | None = None,
+    ) -> np.ndarray:
+        """
+        Return the tidal heights at a site for a sequence or array of times.
+
+        Times may be datetimes, datetime64 values, 'YYYY-MM-DD HH:MM:SS' strings or epoch
+        seconds. Quarters are loaded once and reused across calls, and calls may be made
+        from multiple threads. No files are touched other than the cache.
+        The method and timezone ("utc" or "uk" civil time) default to the Client's.
+        The curve is built from the quarters of the times, unless quarters are given, and
+        the edge events of their neighbours, so a time's height does not depend on the batch.
+        """
+        site = API.canonical_site(site)
+        query_times = to_utc(self.as_query_times(times), timezone or self.timezone)
+        if len(query_times) == 0:
+            return np.empty(0, dtype=np.float64)
+        method = method or self.method
+        if self.grid_step:
+            heights = self.grid_heights(site, query_times, method)
+        elif self.harmonic_fallback:
+            heights = self.heights_with_fallback(site, query_times, method)
+        else:
+            quarters = quarters or CalendarQuarter.from_datetime64(query_times)
+            months = np.unique(query_times.astype("datetime64[M]").astype(np.int64))
+            interpolator = self.load_interpolator(site, quarters, method, months)
+            with self.profiler.stage("interpolation"):
+                heights = interpolator(query_times)
+        self.profiler.count("queries", len(query_times))
+        return heights
+
+    def heights_with_fallback(
+        self, site: str, times: np.ndarray, method: str
+    ) -> np.ndarray:
+        """
+        Interpolate heights in the quarters that can be loaded, and predict them from the
+        site's harmonic model in quarters that cannot be fetched.
+        """
+        from requests import RequestException
+
+        quarters = CalendarQuarter.from_datetime64(times)
+        months = np.unique(times.astype("datetime64[M]").astype(np.int64))
+        available = []
+        for quarter in quarters:
+            if self.unavailable.get((site, quarter), 0.0) > time.monotonic():
+                continue
+            # one quarter at a time, so a failed fetch only loses its own quarter. Only
+            # fetch failures are predicted; a corrupt cache file is still an error.
+            try:
+                self.load_series(site, [quarter], months)
+            except (RequestException, ResponseError) as e:
+                self.unavailable[(site, quarter)] = (
+                    time.monotonic() + UNAVAILABLE_RETRY_SECONDS
+                )
+                if not self.silent:
+                    # kept out of the results, which may be going to stdout
+                    print(f"Predicting {quarter} from harmonics: {e}", file=sys.stderr)
+                continue
+            available.append(quarter)
+
+        offline = ~np.isin(
+            CalendarQuarter.index_datetime64(times), [q.index() for q in available]
         )
-        self.cache.get_quarters(self.site, quarters_to_query)
-        self.populate_entry_list(quarters_to_query)
-        results = interpolate_tidal_heights(self.entry_list, datetimes)
+        heights = np.empty(len(times), dtype=np.float64)
+        if not offline.all():
+            interpolator = self.load_interpolator(site, available, method, months)
+            with self.profiler.stage("interpolation"):
+                heights[~offline] = interpolator(times[~offline])
+        if offline.any():
+            model = self.load_harmonic_model(site)
+            with self.profiler.stage("harmonic_prediction"):
+                heights[offline] = model(times[offline])
+            self.profiler.count("harmonic_queries", int(np.count_nonzero(offline)))
+        return heights
 
-        if not self.silent:
-            self.print_results(results)
+    def load_harmonic_model(self, site: str) -> HarmonicModel:
+        """
+        Return the site's harmonic model, fitting it to the cache if it is out of date.
+        Only the site's own lock is held while fitting, so other sites are not held up.
+        """
+        with self.lock:
+            model = self.harmonic_models.get(site)
+            lock = self.model_locks.setdefault(site, threading.Lock())
+        if model is not None:
+            return model
+        with lock:
+            with self.lock:
+                model = self.harmonic_models.get(site)
+            if model is None:
+                with self.profiler.stage("harmonic_fit"):
+                    model = load_model(self.cache, site, self.table_timezone)
+                with self.lock:
+                    self.harmonic_models[site] = model
+            return model
 
+    def windows(
+        self,
+        site: str,
+        start,
+        end,
+        threshold: float,
+        below: bool = False,
+        method: str | None = None,
+        timezone: str | None = None,
+    ) -> np.ndarray:
+        """
+        Return the windows between start and end when the height at a site is above the
+        threshold (or at or below it, if below is set), with the extreme of each.
+
+        The result is a WINDOW_DTYPE array, with times in the given timezone. Only the
+        quarters of the period are loaded, so no per-minute heights are generated.
+        Windows are not predicted from harmonics, so harmonic_fallback is not supported.
+        """
+        if self.harmonic_fallback:
+            raise ValueError("Windows cannot be found with a harmonic fallback.")
+        site = API.canonical_site(site)
+        timezone = timezone or self.timezone
+        bounds = to_utc(self.as_query_times([start, end]), timezone)
+        # the end is exclusive, so a period ending at a quarter's start does not load it;
+        # the neighbouring quarters' edge events carry the curve up to the end
+        covered = np.array([bounds[0], max(bounds[0], bounds[1] - 1)])
+        first, last = CalendarQuarter.index_datetime64(covered).tolist()
+        quarters = [CalendarQuarter.from_index(q) for q in range(first, last + 1)]
+        first_month, last_month = (
+            covered.astype("datetime64[M]").astype(np.int64).tolist()
+        )
+        months = np.arange(first_month, last_month + 1)
+        interpolator = self.load_interpolator(
+            site, quarters, method or self.method, months
+        )
+        with self.profiler.stage("window_search"):
+            windows = find_windows(interpolator, threshold, bounds[0], bounds[1], below)
+        if timezone == "uk":
+            for field in ("start", "end", "extreme_time"):
+                windows[field] = utc_to_uk(windows[field])
+        self.profiler.count("windows", len(windows))
+        return windows
+
+    def heights_at_chainage(
+        self,
+        chainage: float,
+        times: Sequence | np.ndarray,
+        method: str | None = None,
+        timezone: str | None = None,
+        phase_lag: float | None = None,
+        amplitude_weight: float | None = None,
+    ) -> np.ndarray:
+        """
+        Return the tidal heights at a chainage (km downstream of Teddington Lock) between
+        two gauges.
+
+        Each gauge is sampled shifted in time by its share of the phase lag (seconds for high
+        water to travel from the downstream gauge to the upstream one), then the two are
+        weighted by distance, or by amplitude_weight (0 upstream to 1 downstream) if given.
+        The phase lag is estimated from the gauges' high waters unless given.
+        """
+        upstream, downstream, fraction = bracketing_gauges(chainage)
+        query_times = to_utc(self.as_query_times(times), timezone or self.timezone)
+        if upstream is downstream or fraction == 0.0:
+            return self.heights(upstream.name, query_times, method, "utc")
+        if fraction == 1.0:
+            return self.heights(downstream.name, query_times, method, "utc")
+        if len(query_times) == 0:
+            return np.empty(0, dtype=np.float64)
+
+        if phase_lag is None:
+            phase_lag = self.phase_lag
+        if phase_lag is None:
+            quarters = CalendarQuarter.from_datetime64(query_times)
+            phase_lag = estimate_phase_lag(
+                self.load_series(upstream.name, quarters),
+                self.load_series(downstream.name, quarters),
+            )
+        if amplitude_weight is None:
+            amplitude_weight = self.amplitude_weight
+        if amplitude_weight is None:
+            amplitude_weight = fraction
+
+        # the tide passes the position after the downstream gauge and before the upstream one
+        upstream_shift = np.timedelta64(int(round(fraction * phase_lag)), "s")
+        downstream_shift = np.timedelta64(int(round((1 - fraction) * phase_lag)), "s")
+        return blend_heights(
+            self.heights(upstream.name, query_times + upstream_shift, method, "utc"),
+            self.heights(
+                downstream.name, query_times - downstream_shift, method, "utc"
+            ),
+            amplitude_weight,
+        )
+
+    def print_results(self, times: np.ndarray, heights: np.ndarray) -> None:
+        for dt, height in zip(self.format_times(times), heights.tolist()):
+            print(f"{dt}, {height}")
+
+    def write_results(self, times: np.ndarray, heights: np.ndarray) -> None:
+        """Write heights as a .npy array aligned with the input, or as text lines"""
+        if self.output_file.endswith(".npy"):
+            np.save(self.output_file, heights)
+            return
         with open(self.output_file, "w") as file:
             file.write("Datetime, Tidal Height (m)\n")
-            for dt, height in results.items():
-                file.write(f"{dt}, {height}\n")
+            self.write_lines(file, times, heights)
+
+    def write_lines(self, file, times: np.ndarray, heights: np.ndarray) -> None:
+        for dt, height in zip(self.format_times(times), heights.tolist()):
+            file.write(f"{dt}, {height}\n")
+
+    def query_heights(
+        self, times: np.ndarray, timezone: str | None = None
+    ) -> np.ndarray:
+        """Return the heights at the Client's site, or chainage if set"""
+        if self.chainage is None:
+            return self.heights(self.site, times, timezone=timezone)
+        return self.heights_at_chainage(self.chainage, times, timezone=timezone)
+
+    def run(self):
+        """Parse input, get the DataManager to run any queries, load the data, interpolate tidal heights, print/save results."""
+        if self.memory_limit:
+            self.run_out_of_core()
+            return
+        with self.profiler.stage("run"):
+            with self.profiler.stage("input_load"):
+                times = self.load_input_times(self.input_file)
+            heights = self.query_heights(times)
+
+            with self.profiler.stage("output_write"):
+                if not self.silent:
+                    self.print_results(times, heights)
+                self.write_results(times, heights)
+
+    def run_out_of_core(self):
+        """
+        Run within memory_limit bytes of working memory, however large the input.
+
+        The input is spilled to disk by quarter, then each quarter's queries are answered
+        in chunks with only that quarter and its neighbours loaded. Heights go into a
+        memory-mapped array at their input positions, and are written out in input order.
+        """
+        chunk_size = chunk_size_for(self.memory_limit)
+        with self.profiler.stage("run"), tempfile.TemporaryDirectory(
+            prefix="spill-", dir=self.spill_directory
+        ) as directory:
+            buckets = QuarterBuckets(directory)
+            with self.profiler.stage("input_load"):
+                for times in iter_input_chunks(self.input_file, chunk_size):
+                    buckets.add(times, to_utc(times, self.timezone))
+            if buckets.total == 0:
+                empty = np.empty(0, dtype="datetime64[s]")
+                self.write_results(empty, np.empty(0, dtype=np.float64))
+                return
+
+            if self.output_file.endswith(".npy"):
+                heights = np.lib.format.open_memmap(
+                    self.output_file, "w+", np.float64, (buckets.total,)
+                )
+            else:
+                heights = np.memmap(
+                    f"{directory}/heights.bin", np.float64, "w+", shape=buckets.total
+                )
+            for index in buckets.quarters():
+                # the neighbours are kept for the edge events they lend to the quarter
+                self.evict({CalendarQuarter.from_index(index + i) for i in (-1, 0, 1)})
+                for positions, times in buckets.read(index, chunk_size):
+                    heights[positions] = self.query_heights(times, "utc")
+            self.evict(set())
+
+            with self.profiler.stage("output_write"):
+                heights.flush()
+                if not self.silent:
+                    for start, times in buckets.read_times(chunk_size):
+                        self.print_results(times, heights[start : start + len(times)])
+                if not self.output_file.endswith(".npy"):
+                    with open(self.output_file, "w") as file:
+                        file.write("Datetime, Tidal Height (m)\n")
+                        for start, times in buckets.read_times(chunk_size):
+                            chunk = heights[start : start + len(times)]
+                            self.write_lines(file, times, chunk)
+            del heights
 
     @staticmethod
     def load_input_datetimes(input_file: str) -> list[datetime]:
@@ -66,3 +737,58 @@ class Client:
                 for dstr in datetime_strings
             ]
         return datetimes
+
+    @staticmethod
+    def load_input_times(input_file: str) -> np.ndarray:
+        """
+        Load the query times as a datetime64[s] array.
+
+        Accepts a text file of 'YYYY-MM-DD HH:MM:SS' lines, a .npy array of datetime64
+        values or integer/float epoch seconds, or '-' to read either format from stdin.
+        .npy files are memory-mapped rather than read into memory.
+        """
+        if input_file == "-":
+            data = sys.stdin.buffer.read()
+            if data.startswith(NPY_MAGIC):
+                return Client._as_datetime64(np.load(io.BytesIO(data)))
+            return Client._parse_text_times(data.decode().splitlines())
+        if input_file.endswith(".npy"):
+            return Client._as_datetime64(np.load(input_file, mmap_mode="r"))
+        with open(input_file, "r") as file:
+            return Client._parse_text_times(file.readlines())
+
+    @staticmethod
+    def as_query_times(times: Sequence | np.ndarray) -> np.ndarray:
+        """Convert datetimes, strings, datetime64 values or epoch seconds to datetime64[s]"""
+        values = np.atleast_1d(np.asarray(times))
+        if values.dtype.kind in "OUS":
+            values = values.astype("datetime64[s]")
+        return Client._as_datetime64(values)
+
+    @staticmethod
+    def _parse_text_times(lines: list[str]) -> np.ndarray:
+        # numpy parses '2021-02-12 10:01:01' directly, without going via datetime
+        stripped = [line.strip() for line in lines]
+        return np.array([line for line in stripped if line], dtype="datetime64[s]")
+
+    @staticmethod
+    def _as_datetime64(values: np.ndarray) -> np.ndarray:
+        if values.ndim != 1:
+            raise ValueError(f"Input array must be 1-dimensional, got {values.shape}.")
+        if np.issubdtype(values.dtype, np.datetime64):
+            return values.astype("datetime64[s]", copy=False)
+        if np.issubdtype(values.dtype, np.integer):
+            # epoch seconds; a view keeps memory-mapped int64 input zero-copy
+            return values.astype(np.int64, copy=False).view("datetime64[s]")
+        if np.issubdtype(values.dtype, np.floating):
+            return np.rint(values).astype(np.int64).view("datetime64[s]")
+        raise ValueError(
+            f"Input array must hold datetime64 values or epoch seconds, got {values.dtype}."
+        )
+
+    @staticmethod
+    def format_times(times: np.ndarray) -> list[str]:
+        """Format datetime64 values as 'YYYY-MM-DD HH:MM:SS' strings"""
+        return np.char.replace(
+            np.datetime_as_string(times, unit="s"), "T", " "
+        ).tolist()
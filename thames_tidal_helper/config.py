@@ -1 +1,8 @@
 DEFAULT_CACHE_PATH = ".cache"
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8765
+DEFAULT_STUB_PORT = 8766
+
+# Root URL of the PLA API, which this environment variable overrides (e.g. with a stub's)
+DEFAULT_API_ROOT = "https://tidepredictions.pla.co.uk/gauge_data/"
+API_ROOT_VARIABLE = "THAMES_TIDAL_API_ROOT"
@@ -1,51 +1,153 @@
+import io
+import json
 import os
 import re
+import shutil
+import threading
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Iterable
 
-from requests import get as req_get
+import numpy as np
 
 from thames_tidal_helper.schema import DataPackage, CalendarQuarter
-from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.api_adapter import API, SITE_CODE_PATTERN
 from thames_tidal_helper.config import DEFAULT_CACHE_PATH
+from thames_tidal_helper.files import write_atomic
+from thames_tidal_helper.profiling import NullProfiler
+from thames_tidal_helper.usage import EVICTION_POLICIES, CacheUsage, prune_cache
+
+
+def req_get(url: str, **kwargs):
+    """Fetch a URL, importing requests only when a fetch actually happens"""
+    from requests import get
+
+    return get(url, **kwargs)
+
+
+class ResponseError(ValueError):
+    """A fetched response that is not the data that was requested"""
+
+
+# Whole quarters, windows of months starting at any month, or whichever needs fewer fetches
+FETCH_GRANULARITIES = ("quarter", "window", "auto")
+# Each response covers this many months, starting at the requested month
+WINDOW_MONTHS = 3
 
 
 class DataManager:
-    def __init__(self, cache_directory: str = DEFAULT_CACHE_PATH):
+    def __init__(
+        self,
+        cache_directory: str = DEFAULT_CACHE_PATH,
+        profiler: NullProfiler | None = None,
+        fetch_granularity: str = "quarter",
+        max_size: int | None = None,
+        eviction_policy: str = "lru",
+    ):
+        if fetch_granularity not in FETCH_GRANULARITIES:
+            raise ValueError(
+                f"Fetch granularity {fetch_granularity} not found. "
+                f"Choose from {FETCH_GRANULARITIES}."
+            )
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"Eviction policy {eviction_policy} not found. "
+                f"Choose from {EVICTION_POLICIES}."
+            )
         self.cache_directory = cache_directory
-        self.contents: list[tuple[str, CalendarQuarter]] = []
+        self.profiler = profiler or NullProfiler()
+        self.fetch_granularity = fetch_granularity
+        self.contents: set[tuple[str, CalendarQuarter]] = set()
+        # Quarters only some months of which have been fetched, with those months
+        self.partial: dict[tuple[str, CalendarQuarter], set[int]] = {}
+        # One lock per (site, quarter), so concurrent misses for a key trigger a single fetch
+        self.key_locks: dict[tuple[str, CalendarQuarter], threading.Lock] = {}
+        self.key_locks_lock = threading.Lock()
+        # Size cap in bytes, enforced after each fetch by evicting unused quarters
+        self.max_size = max_size
+        self.eviction_policy = eviction_policy
 
         if not os.path.exists(cache_directory):
             os.mkdir(cache_directory)
         else:
-            # load the contents of the cache
-            self.filename_pattern = re.compile(r"^[A-Za-z0-9]{5}_\d{4}_Q[1-4]\.json$")
-            for filename in os.listdir(cache_directory):
-                # check the filename is in the correct format
-                if self.filename_pattern.match(filename):
-                    site, calender_quarter = self.parse_filename(filename)
-                    self.contents.append((site, calender_quarter))
+            with self.profiler.stage("cache_scan"):
+                self.scan_cache()
+        self.usage = CacheUsage(cache_directory)
+
+    def scan_cache(self) -> None:
+        """Load the contents of the cache directory"""
+        self.filename_pattern = re.compile(
+            rf"^{SITE_CODE_PATTERN}_\d{{4}}_Q[1-4]\.json$"
+        )
+        partial_pattern = re.compile(
+            rf"^({SITE_CODE_PATTERN}_\d{{4}}_Q[1-4])\.months((?:-\d{{1,2}})+)\.json$"
+        )
+        for filename in os.listdir(self.cache_directory):
+            # check the filename is in the correct format
+            if self.filename_pattern.match(filename):
+                site, calender_quarter = self.parse_filename(filename)
+                self.contents.add((site, calender_quarter))
+            elif match := partial_pattern.match(filename):
+                site, quarter = self.parse_filename(f"{match[1]}.json")
+                start = quarter.month_indices()[0] - (quarter.quarter * 3 - 2)
+                months = {start + int(month) for month in match[2][1:].split("-")}
+                self.partial[(site, quarter)] = months
+        for key in self.contents:
+            self.partial.pop(key, None)
+
+    def key_lock(self, site: str, quarter: CalendarQuarter) -> threading.Lock:
+        """Return the lock guarding loads and fetches of a (site, quarter) key"""
+        with self.key_locks_lock:
+            return self.key_locks.setdefault((site, quarter), threading.Lock())
 
     def check_exists(self, site: str, quarter: CalendarQuarter) -> bool:
+        site = API.canonical_site(site)
         filename = self.generate_filename(site, quarter)
         filepath = os.path.join(self.cache_directory, filename)
         if (site, quarter) not in self.contents:
             return False
         if os.path.exists(filepath):
             return True
-        else:
-            raise FileNotFoundError(
-                f"File {filepath} was expected to exist but was not found."
-            )
+        # the file was removed behind our back (e.g. quarantined), so forget it and let
+        # the next get_quarters fetch it again
+        self.contents.discard((site, quarter))
+        return False
 
     def get_from_cache(self, site: str, quarter: CalendarQuarter) -> DataPackage | None:
+        site = API.canonical_site(site)
+        if (site, quarter) in self.contents:
+            return self.read_cached(site, quarter)
+        if (site, quarter) not in self.partial:
+            return None
+        # partial files are renamed as windows merge into them, and removed once the
+        # quarter is complete, so they are read under the key's lock
+        with self.key_lock(site, quarter):
+            return self.read_cached(site, quarter)
+
+    def read_cached(self, site: str, quarter: CalendarQuarter) -> DataPackage | None:
+        """Read a quarter's file, or its partial file with the key's lock held"""
         filename = self.generate_filename(site, quarter)
         filepath = os.path.join(self.cache_directory, filename)
         if (site, quarter) not in self.contents:
-            return None
-        with open(filepath, "r") as file:
-            contents = file.read()
-            return DataPackage(contents)
+            if (site, quarter) not in self.partial:
+                return None
+            filepath = self.partial_path(site, quarter, self.partial[(site, quarter)])
+        self.usage.record(filepath)
+        with self.profiler.stage("cache_read"):
+            with open(filepath, "rb") as file:
+                contents = file.read()
+        self.profiler.count("bytes_read", len(contents))
+        with self.profiler.stage("json_parse"):
+            try:
+                return DataPackage(contents.decode())
+            except (ValueError, KeyError) as e:
+                raise ValueError(
+                    f"Cache file {filepath} is corrupt ({e}). "
+                    "Run 'python -m thames_tidal_helper cache repair' to fix it."
+                ) from e
 
     def write_to_cache(self, site: str, quarter: CalendarQuarter, data: str):
+        site = API.canonical_site(site)
         filename = self.generate_filename(site, quarter)
         filepath = os.path.join(self.cache_directory, filename)
         # Call the DataPackage constructor to validate the data
@@ -54,36 +156,295 @@ class DataManager:
         except ValueError as e:
             raise ValueError(f"Data is not in the correct format: {e}")
 
-        with open(filepath, "w") as file:
-            file.write(data)
-        self.contents.append((site, quarter))
+        write_atomic(filepath, data)
+        self.contents.add((site, quarter))
+        # a complete quarter supersedes any months merged from windows
+        months = self.partial.pop((site, quarter), None)
+        if months is not None:
+            os.remove(self.partial_path(site, quarter, months))
+        self.usage.record(filepath, fetched=True)
+        self.enforce_max_size()
+
+    def enforce_max_size(self) -> None:
+        """Evict quarters not in use until the cache is within max_size, if set"""
+        if not self.max_size:
+            return
+        report = prune_cache(
+            self.cache_directory,
+            self.max_size,
+            self.eviction_policy,
+            keep=set(self.usage.pinned),
+        )
+        for entry in report["removed"]:
+            key = self.parse_filename(f"{entry}.json")
+            self.contents.discard(key)
+            self.partial.pop(key, None)
+
+    def partial_path(
+        self, site: str, quarter: CalendarQuarter, months: Iterable[int]
+    ) -> str:
+        """Return the path of a partial quarter, named by the calendar months it holds"""
+        names = "".join(f"-{month % 12 + 1}" for month in sorted(months))
+        filename = self.generate_filename(site, quarter).replace(
+            ".json", f".months{names}.json"
+        )
+        return os.path.join(self.cache_directory, filename)
+
+    def cached_months(self, site: str, quarter: CalendarQuarter) -> set[int]:
+        """Return the months of a quarter in the cache, as months since 1970-01"""
+        site = API.canonical_site(site)
+        if self.check_exists(site, quarter):
+            return set(quarter.month_indices())
+        return set(self.partial.get((site, quarter), ()))
+
+    def array_path(self, site: str, quarter: CalendarQuarter, name: str) -> str:
+        """Return the path of a named array derived from a quarter, e.g. a height grid"""
+        filename = self.generate_filename(site, quarter).replace(
+            ".json", f".{name}.npy"
+        )
+        return os.path.join(self.cache_directory, filename)
+
+    def source_path(self, site: str, quarter: CalendarQuarter) -> str | None:
+        """Return the path of the file a quarter is read from, or None if not cached"""
+        site = API.canonical_site(site)
+        if self.check_exists(site, quarter):
+            return os.path.join(
+                self.cache_directory, self.generate_filename(site, quarter)
+            )
+        if (site, quarter) in self.partial:
+            return self.partial_path(site, quarter, self.partial[(site, quarter)])
+        return None
+
+    def read_array(
+        self,
+        site: str,
+        quarter: CalendarQuarter,
+        name: str,
+        depends: Iterable[CalendarQuarter] = (),
+    ) -> np.ndarray | None:
+        """
+        Memory-map a derived array from the cache, or return None if it is absent or
+        stale: older than its quarter's file, which has since been replaced (by a refetch
+        or a repair), or without a quarter file to be derived from. It is also stale if
+        older than the file of any quarter it depends on, e.g. a neighbour cached since.
+        """
+        filepath = self.array_path(site, quarter, name)
+        source = self.source_path(site, quarter)
+        try:
+            if source is None:
+                return None
+            built = os.stat(filepath).st_mtime_ns
+            sources = [source] + [self.source_path(site, q) for q in depends]
+            if any(
+                path is not None and os.stat(path).st_mtime_ns > built
+                for path in sources
+            ):
+                return None
+        except FileNotFoundError:
+            return None
+        self.usage.record(filepath)
+        with self.profiler.stage("cache_read"):
+            array = np.load(filepath, mmap_mode="r")
+        self.profiler.count("bytes_read", array.nbytes)
+        return array
+
+    def write_array(
+        self, site: str, quarter: CalendarQuarter, name: str, array: np.ndarray
+    ) -> None:
+        """Save a derived array to the cache"""
+        filepath = self.array_path(site, quarter, name)
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        write_atomic(filepath, buffer.getvalue())
+        self.usage.record(filepath)
 
     def wipe_cache(self):
         msg = f"Are you sure you want to delete the cache at {self.cache_directory}? (y/n) "
         response = input(msg)
         if response.lower() != "y" and response.lower() != "yes":
             return
-        self.contents = []
-        for filename in os.listdir(self.cache_directory):
-            os.remove(os.path.join(self.cache_directory, filename))
-        os.rmdir(self.cache_directory)
+        self.contents = set()
+        self.partial = {}
+        self.usage.close()
+        shutil.rmtree(self.cache_directory)
 
     def get_quarters(self, site: str, quarters: list[CalendarQuarter]) -> None:
-        # for each quarter, first check the cache, then query the API for the 1st day of the quarter
-        def quarter_to_month(q: int) -> int:
-            return q * 3 - 2
-
-        # Sort the quarters by year and quarter
-        quarters.sort()
-        for quarter in quarters:
-            if self.check_exists(site, quarter):
+        """Fetch each quarter not already in the cache, one request per quarter"""
+        site = API.canonical_site(site)
+        for quarter in sorted(set(quarters)):
+            # a window starting at a quarter's first month is exactly that quarter
+            self.get_window(site, quarter.month_indices()[0])
+
+    def get_months(self, site: str, months: Iterable[int]) -> None:
+        """Make sure the given months (as months since 1970-01) are in the cache"""
+        for start in self.plan_fetches(site, months):
+            self.get_window(site, start)
+
+    def plan_fetches(self, site: str, months: Iterable[int]) -> list[int]:
+        """
+        Return the first month of each request needed to cache the given months.
+
+        Each request covers WINDOW_MONTHS months. With "quarter" granularity, one request is
+        made per quarter. With "window" granularity, the fewest windows covering the
+        missing months are requested. These may start at any month, so months either side
+        of a quarter boundary share a request. They are merged into the quarter store. Sparse
+        queries spread over many quarters need fewer downloads this way. "auto" uses
+        windows only when they need fewer requests.
+        """
+        site = API.canonical_site(site)
+        missing = sorted(
+            {
+                month
+                for month in months
+                if month not in self.cached_months(site, self.month_quarter(month))
+            }
+        )
+        quarters = sorted({self.month_quarter(month) for month in missing})
+        windows = self.plan_windows(missing)
+        if self.fetch_granularity == "quarter" or (
+            self.fetch_granularity == "auto" and len(windows) >= len(quarters)
+        ):
+            return [quarter.month_indices()[0] for quarter in quarters]
+        return windows
+
+    @staticmethod
+    def month_quarter(month: int) -> CalendarQuarter:
+        return CalendarQuarter.from_index(month // 3)
+
+    @staticmethod
+    def listing_month(date: str) -> int:
+        """Return the month since 1970-01 of a listing date, e.g. '01/07/2024'"""
+        return (int(date[6:]) - 1970) * 12 + int(date[3:5]) - 1
+
+    @staticmethod
+    def epoch_month(seconds: int) -> int:
+        """Return the month since 1970-01 of a time in epoch seconds"""
+        return int(np.datetime64(int(seconds), "s").astype("datetime64[M]").astype(int))
+
+    @staticmethod
+    def plan_windows(months: list[int]) -> list[int]:
+        """Return the first months of the fewest windows covering the sorted months"""
+        starts: list[int] = []
+        for month in months:
+            # greedily start a window at the first month the last one does not cover
+            if not starts or month >= starts[-1] + WINDOW_MONTHS:
+                starts.append(month)
+        return starts
+
+    def get_window(self, site: str, start: int) -> None:
+        """Fetch the window of months starting at a month and merge it into the cache"""
+        site = API.canonical_site(site)
+        window = range(start, start + WINDOW_MONTHS)
+        quarters = sorted({self.month_quarter(month) for month in window})
+        with ExitStack() as stack:
+            # locks are always taken in quarter order, so windows cannot deadlock
+            for quarter in quarters:
+                stack.enter_context(self.key_lock(site, quarter))
+            if all(
+                month in self.cached_months(site, self.month_quarter(month))
+                for month in window
+            ):
+                self.profiler.count("cache_hits")
+                return
+            self.profiler.count("cache_misses")
+            year, month = 1970 + start // 12, start % 12 + 1
+            url = API.query_url(site, year, month, 1)
+            with self.profiler.stage("fetch"):
+                response = req_get(url)
+            self.profiler.count("bytes_fetched", len(response.content))
+            try:
+                window = DataPackage(response.text)
+                self.check_response(window, start)
+            except ValueError as e:
+                self.profiler.count("fetches_rejected")
+                raise ResponseError(f"Bad response from {url}: {e}") from None
+            if start % 3 == 0:
+                # exactly one quarter, cached as it came
+                self.write_to_cache(site, self.month_quarter(start), response.text)
+            else:
+                self.merge_window(site, window)
+
+    @staticmethod
+    def check_response(window: DataPackage, start: int) -> None:
+        """
+        Check a response is for the window of months starting at a month, so a payload
+        for the wrong months is never cached under the requested quarter.
+        """
+        expected = f"{1970 + start // 12}-{start % 12 + 1:02d}"
+        fields = window.json_data
+        if "year" in fields and "month" in fields:
+            returned = f"{int(fields['year'])}-{int(fields['month']):02d}"
+            if returned != expected:
+                raise ValueError(f"requested {expected}, got a response for {returned}")
+        months = DataManager.table_months(window)
+        if start not in months or not set(months) <= set(
+            range(start, start + WINDOW_MONTHS)
+        ):
+            raise ValueError(
+                f"requested {WINDOW_MONTHS} months from {expected}, got a table for "
+                f"{', '.join(month_data['name'] for month_data in months.values())}"
+            )
+
+    @staticmethod
+    def table_months(data_package: DataPackage) -> dict[int, dict]:
+        """Return a payload's month tables, by month since 1970-01"""
+        months = {}
+        for month_data in data_package.table.values():
+            month_str, year_str = month_data["name"].split(" ")
+            month = datetime.strptime(month_str, "%B").month
+            months[(int(year_str) - 1970) * 12 + month - 1] = month_data
+        return months
+
+    def merge_window(self, site: str, window: DataPackage) -> None:
+        """Merge the months of a fetched window into the quarters they belong to"""
+        by_quarter: dict[CalendarQuarter, dict[int, dict]] = {}
+        for index, month_data in self.table_months(window).items():
+            by_quarter.setdefault(self.month_quarter(index), {})[index] = month_data
+
+        listing = window.json_data.get("listing") or []
+        graphs = window.json_data.get("graph_data", {}).get("graphs", {})
+        for quarter, months in by_quarter.items():
+            if (site, quarter) in self.contents:
                 continue
-            # Query the API
-            url = API.query_url(
-                site, quarter.year, quarter_to_month(quarter.quarter) * 3 - 2, 1
+            cached = self.partial.get((site, quarter), set())
+            if cached:
+                # the window's key locks are already held
+                merged = self.read_cached(site, quarter).json_data
+            else:
+                merged = {
+                    "year": quarter.year,
+                    "month": quarter.quarter * 3 - 2,
+                    "table": {},
+                    "listing": [],
+                    "graph_data": {"graphs": {}},
+                    "TimeOffset": window.json_data.get("TimeOffset", "0"),
+                }
+            first = quarter.month_indices()[0]
+            for index, month_data in months.items():
+                merged["table"][str(index - first)] = month_data
+            # keep the per-minute reference heights that fall in the new months
+            merged["listing"].extend(
+                row for row in listing if self.listing_month(row["date"]) in months
             )
-            response = req_get(url)
-            self.write_to_cache(site, quarter, response.text)
+            merged_graphs = merged["graph_data"]["graphs"]
+            for graph in graphs.values():
+                points = [p for p in graph if self.epoch_month(p["x"]) in months]
+                if points:
+                    merged_graphs[str(len(merged_graphs))] = points
+            merged["table"] = dict(sorted(merged["table"].items()))
+
+            data = json.dumps(merged)
+            complete = cached | set(months)
+            if complete >= set(quarter.month_indices()):
+                self.write_to_cache(site, quarter, data)
+                continue
+            filepath = self.partial_path(site, quarter, complete)
+            write_atomic(filepath, data)
+            if cached:
+                os.remove(self.partial_path(site, quarter, cached))
+            self.partial[(site, quarter)] = complete
+            self.usage.record(filepath, fetched=True)
+            self.enforce_max_size()
 
     @staticmethod
     def generate_filename(site: str, quarter: CalendarQuarter) -> str:
@@ -95,8 +456,9 @@ class DataManager:
 
     @staticmethod
     def parse_filename(filename: str) -> tuple[str, CalendarQuarter]:
-        filename.replace(".json", "")
-        site_code, year, quarter = filename.split("_")
+        site_code, year, quarter = filename.removesuffix(".json").split("_")
+        if len(quarter) != 2 or quarter[0] != "Q":
+            raise ValueError(f"Invalid quarter: {quarter}")
         year = int(year)
         quarter = int(quarter[1])
 
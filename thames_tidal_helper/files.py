@@ -0,0 +1,71 @@
+"""
+File and process helpers shared by the cache, its index and the store.
+
+Pins, leases and temporary files are named after the process that wrote them, and are
+reclaimed once that process has gone.
+"""
+
+import os
+import sys
+import threading
+
+# Windows process access right and exit code used to check that a process is running
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+ERROR_ACCESS_DENIED = 5
+
+
+def write_atomic(path: str, data: str | bytes, mode: int | None = None) -> None:
+    """
+    Write then rename, so readers never see a partially written file. The temporary file
+    is named per writer, so concurrent writers cannot clobber each other's. Text is stored
+    as UTF-8. If mode is given, the file has those permissions when it appears.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data.encode() if isinstance(data, str) else data)
+    if mode is not None:
+        os.chmod(temp_path, mode)
+    os.replace(temp_path, path)
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    Return whether a process is running, without signalling it. On Windows, os.kill
+    terminates the process for any signal but CTRL_C_EVENT and CTRL_BREAK_EVENT, so the
+    process is looked up instead.
+    """
+    if sys.platform == "win32":
+        return windows_pid_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # the process exists but belongs to someone else
+    return True
+
+
+def windows_pid_alive(pid: int) -> bool:  # pragma: no cover - Windows only
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # a process we may not query still exists
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
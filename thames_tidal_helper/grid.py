@@ -0,0 +1,85 @@
+"""
+Regular-interval height tables for a site and quarter.
+
+A HeightGrid samples the tidal curve every `step` seconds across a calendar quarter, so a
+lookup is index arithmetic rather than a search. Grids are saved in the cache as compact
+float32 .npy files and reused across runs.
+"""
+
+import numpy as np
+
+from thames_tidal_helper.interpolation import TideInterpolator
+from thames_tidal_helper.schema import CalendarQuarter
+
+GRID_SOURCES = ("interpolated", "listing")
+
+
+class HeightGrid:
+    """
+    Heights sampled every `step` seconds from `start` (epoch seconds).
+
+    Lookups take the nearest sample, or refine linearly between the two neighbouring
+    samples. Queries outside the grid are clamped to its first or last sample.
+    """
+
+    def __init__(self, start: int, step: int, heights: np.ndarray):
+        if step <= 0:
+            raise ValueError(
+                f"Grid step must be a positive number of seconds, got {step}."
+            )
+        if len(heights) < 2:
+            raise ValueError("A grid needs at least two samples.")
+        self.start = int(start)
+        self.step = int(step)
+        self.heights = heights
+
+    def __len__(self) -> int:
+        return len(self.heights)
+
+    def __call__(self, times: np.ndarray, refine: bool = True) -> np.ndarray:
+        seconds = times.astype("datetime64[s]", copy=False).view(np.int64)
+        position = (seconds - self.start) / self.step
+        np.clip(position, 0, len(self.heights) - 1, out=position)
+        if not refine:
+            return self.heights[np.rint(position).astype(np.intp)].astype(np.float64)
+        index = np.minimum(position.astype(np.intp), len(self.heights) - 2)
+        fraction = position - index
+        lower = self.heights[index].astype(np.float64)
+        upper = self.heights[index + 1].astype(np.float64)
+        return lower + fraction * (upper - lower)
+
+    @staticmethod
+    def sample_times(quarter: CalendarQuarter, step: int) -> np.ndarray:
+        """Return the sample times covering a quarter, both ends included"""
+        start, end = quarter.bounds()
+        count = int((end - start) // np.timedelta64(step, "s")) + 1
+        return start + np.arange(count, dtype=np.int64) * np.timedelta64(step, "s")
+
+    @staticmethod
+    def build(
+        quarter: CalendarQuarter,
+        step: int,
+        interpolator: TideInterpolator,
+        reference: tuple[np.ndarray, np.ndarray] | None = None,
+    ) -> "HeightGrid":
+        """
+        Sample a quarter from an interpolator. If reference (times, heights) from the payload
+        listing are given, they are used wherever they cover the samples: at a row, or
+        between two rows a listing step apart, so gaps in a merged listing are not bridged.
+        """
+        times = HeightGrid.sample_times(quarter, step)
+        heights = interpolator(times)
+        if reference is not None and len(reference[0]) > 1:
+            reference_seconds = reference[0].astype("datetime64[s]").view(np.int64)
+            seconds = times.view(np.int64)
+            listing_step = np.median(np.diff(reference_seconds))
+            after = np.searchsorted(reference_seconds, seconds)
+            upper = reference_seconds[np.minimum(after, len(reference_seconds) - 1)]
+            lower = reference_seconds[np.maximum(after - 1, 0)]
+            within = (after > 0) & (after < len(reference_seconds))
+            covered = (upper == seconds) | (within & (upper - lower <= listing_step))
+            heights[covered] = np.interp(
+                seconds[covered], reference_seconds, reference[1]
+            )
+        start = int(times[0].astype(np.int64))
+        return HeightGrid(start, step, heights.astype(np.float32))
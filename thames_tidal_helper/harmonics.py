@@ -0,0 +1,357 @@
+"""
+Harmonic tide prediction, for periods with no PLA data in the cache.
+
+A gauge's tide is modelled as a mean level plus a sum of constituents, cosines at fixed
+astronomical speeds (M2, S2, N2, K1, O1 and shallow-water overtides such as M4 and M6),
+with the standard nodal corrections for the 18.6-year lunar cycle. The amplitudes and
+phases are fitted by least squares to the interpolated curve of the cached quarters, and
+the compact fit is saved in the cache, one file per site.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API, SITE_CODE_PATTERN
+from thames_tidal_helper.files import write_atomic
+from thames_tidal_helper.interpolation import TideInterpolator
+from thames_tidal_helper.schema import (
+    CalendarQuarter,
+    TideSeries,
+    parse_data_package_series,
+)
+
+# Speeds in degrees per hour, in the order constituents are chosen when a record is too
+# short to separate them all
+CONSTITUENTS = {
+    "M2": 28.9841042,
+    "S2": 30.0000000,
+    "N2": 28.4397295,
+    "K1": 15.0410686,
+    "O1": 13.9430356,
+    "M4": 57.9682084,
+    "MS4": 58.9841042,
+    "MN4": 57.4238337,
+    "M6": 86.9523127,
+    "K2": 30.0821373,
+    "P1": 14.9589314,
+    "2MS6": 87.9682084,
+    "2MN6": 86.4079380,
+    "M8": 115.9364166,
+    "MU2": 27.9682084,
+    "NU2": 28.5125831,
+    "L2": 29.5284789,
+    "2N2": 27.8953548,
+    "Q1": 13.3986609,
+    "MK3": 44.0251729,
+    "MO3": 42.9271398,
+    "M3": 43.4761563,
+    "S4": 60.0000000,
+    "T2": 29.9589333,
+    "MSF": 1.0158958,
+    "MM": 0.5443747,
+}
+# Each constituent's nodal factor and angle are products and sums of these base ones
+NODAL_TERMS = {
+    "M2": {"M2": 1},
+    "N2": {"M2": 1},
+    "MU2": {"M2": 1},
+    "NU2": {"M2": 1},
+    "L2": {"M2": 1},
+    "2N2": {"M2": 1},
+    "K1": {"K1": 1},
+    "O1": {"O1": 1},
+    "Q1": {"O1": 1},
+    "K2": {"K2": 1},
+    "M4": {"M2": 2},
+    "MS4": {"M2": 1},
+    "MN4": {"M2": 2},
+    "M6": {"M2": 3},
+    "2MS6": {"M2": 2},
+    "2MN6": {"M2": 3},
+    "M8": {"M2": 4},
+    "MK3": {"M2": 1, "K1": 1},
+    "MO3": {"M2": 1, "O1": 1},
+    "M3": {"M2": 1.5},
+    "MSF": {"M2": -1},
+    "MM": {"MM": 1},
+}
+# Sampling step of the interpolated curve when fitting
+FIT_STEP = 900
+FIT_METHOD = "pchip"
+
+MODEL_PATTERN = re.compile(rf"^{SITE_CODE_PATTERN}\.harmonics\.[a-z]+\.json$")
+SECONDS_PER_HOUR = 3600.0
+# Days from 1900-01-01 to 1970-01-01, for the longitude of the moon's node
+DAYS_1900_TO_1970 = 25567
+
+
+def node_longitude(seconds: np.ndarray) -> np.ndarray:
+    """Return the longitude of the moon's ascending node, in radians, at epoch seconds"""
+    days = seconds / 86400.0 + DAYS_1900_TO_1970
+    return np.radians(259.1568 - 0.0529539 * days)
+
+
+def base_nodal_corrections(
+    node: np.ndarray,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Return the (factor, angle in radians) of the base constituents at node longitudes"""
+    cos1, cos2, cos3 = np.cos(node), np.cos(2 * node), np.cos(3 * node)
+    sin1, sin2, sin3 = np.sin(node), np.sin(2 * node), np.sin(3 * node)
+    return {
+        "M2": (1.0004 - 0.0373 * cos1 + 0.0002 * cos2, np.radians(-2.14 * sin1)),
+        "K1": (
+            1.0060 + 0.1150 * cos1 - 0.0088 * cos2 + 0.0006 * cos3,
+            np.radians(-8.86 * sin1 + 0.68 * sin2 - 0.07 * sin3),
+        ),
+        "O1": (
+            1.0089 + 0.1871 * cos1 - 0.0147 * cos2 + 0.0014 * cos3,
+            np.radians(10.80 * sin1 - 1.34 * sin2 + 0.19 * sin3),
+        ),
+        "K2": (
+            1.0241 + 0.2863 * cos1 + 0.0083 * cos2 - 0.0015 * cos3,
+            np.radians(-17.74 * sin1 + 0.68 * sin2 - 0.04 * sin3),
+        ),
+        "MM": (1.0 - 0.1300 * cos1 + 0.0013 * cos2, np.zeros_like(node)),
+    }
+
+
+def nodal_corrections(
+    name: str, base: dict[str, tuple[np.ndarray, np.ndarray]]
+) -> tuple[np.ndarray | float, np.ndarray | float]:
+    factor, angle = 1.0, 0.0
+    for term, power in NODAL_TERMS.get(name, {}).items():
+        factor = factor * base[term][0] ** abs(power)
+        angle = angle + power * base[term][1]
+    return factor, angle
+
+
+def choose_constituents(hours: float) -> list[str]:
+    """
+    Return the constituents a record of this many hours can resolve.
+
+    By the Rayleigh criterion, two constituents are only separable if the record spans a
+    full cycle of the difference in their speeds, so the less important one is left out.
+    """
+    chosen: list[str] = []
+    for name, speed in CONSTITUENTS.items():
+        if speed * hours < 360:
+            continue
+        if all(abs(speed - CONSTITUENTS[other]) * hours >= 360 for other in chosen):
+            chosen.append(name)
+    return chosen
+
+
+class HarmonicModel:
+    """A mean level and constituent amplitudes (m) and phases (degrees) for one gauge"""
+
+    def __init__(
+        self,
+        site: str,
+        mean: float,
+        constituents: dict[str, tuple[float, float]],
+        quarters: list[str] | None = None,
+    ):
+        self.site = site
+        self.mean = mean
+        self.constituents = constituents
+        # the cached quarters the model was fitted to, e.g. '2024_Q1'
+        self.quarters = quarters or []
+
+    def __call__(self, times: np.ndarray) -> np.ndarray:
+        """Return the predicted heights at an array of datetime64 values"""
+        seconds = times.astype("datetime64[s]", copy=False).view(np.int64)
+        base = base_nodal_corrections(node_longitude(seconds))
+        hours = seconds / SECONDS_PER_HOUR
+        heights = np.full(len(seconds), self.mean, dtype=np.float64)
+        for name, (amplitude, phase) in self.constituents.items():
+            factor, angle = nodal_corrections(name, base)
+            argument = np.radians(CONSTITUENTS[name]) * hours + angle
+            heights += factor * amplitude * np.cos(argument - np.radians(phase))
+        return heights
+
+    @staticmethod
+    def fit(
+        site: str,
+        series: list[TideSeries],
+        quarters: list[str] | None = None,
+        step: int = FIT_STEP,
+    ) -> "HarmonicModel":
+        """
+        Fit a model to the interpolated curves of one or more series, such as quarters.
+
+        Each series is sampled every step seconds between its first and last events, so
+        gaps between them are left out of the fit.
+        """
+        sample_times = []
+        sample_heights = []
+        for part in series:
+            if len(part) < 2:
+                continue
+            times = np.arange(part.times[0], part.times[-1] + 1, step)
+            sample_times.append(times)
+            sample_heights.append(
+                TideInterpolator(part, FIT_METHOD)(times.view("datetime64[s]"))
+            )
+        if not sample_times:
+            raise ValueError(f"No tide data to fit a harmonic model for {site}.")
+        seconds = np.concatenate(sample_times)
+        heights = np.concatenate(sample_heights)
+        names = choose_constituents(len(seconds) * step / SECONDS_PER_HOUR)
+
+        base = base_nodal_corrections(node_longitude(seconds))
+        hours = seconds / SECONDS_PER_HOUR
+        # columns: the mean, then the cosine and sine parts of each constituent
+        design = np.empty((len(seconds), 1 + 2 * len(names)))
+        design[:, 0] = 1.0
+        for i, name in enumerate(names):
+            factor, angle = nodal_corrections(name, base)
+            argument = np.radians(CONSTITUENTS[name]) * hours + angle
+            design[:, 1 + 2 * i] = factor * np.cos(argument)
+            design[:, 2 + 2 * i] = factor * np.sin(argument)
+        solution = np.linalg.lstsq(design, heights, rcond=None)[0]
+        cosines, sines = solution[1::2], solution[2::2]
+        constituents = {
+            name: (float(np.hypot(a, b)), float(np.degrees(np.arctan2(b, a)) % 360))
+            for name, a, b in zip(names, cosines, sines)
+        }
+        return HarmonicModel(site, float(solution[0]), constituents, quarters)
+
+    def to_dict(self) -> dict:
+        return {
+            "site": self.site,
+            "mean": self.mean,
+            "quarters": self.quarters,
+            "constituents": {
+                name: {"speed": CONSTITUENTS[name], "amplitude": a, "phase": g}
+                for name, (a, g) in self.constituents.items()
+            },
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "HarmonicModel":
+        return HarmonicModel(
+            data["site"],
+            data["mean"],
+            {
+                name: (values["amplitude"], values["phase"])
+                for name, values in data["constituents"].items()
+            },
+            data["quarters"],
+        )
+
+
+def quarter_label(quarter: CalendarQuarter) -> str:
+    return f"{quarter.year}_Q{quarter.quarter}"
+
+
+def model_path(cache_directory: str, site: str, table_timezone: str = "utc") -> str:
+    code = API.site_to_code(site)
+    return os.path.join(cache_directory, f"{code}.harmonics.{table_timezone}.json")
+
+
+def cached_quarters(data_manager, site: str) -> list[CalendarQuarter]:
+    """Return the site's complete quarters in the cache"""
+    site = API.canonical_site(site)
+    return sorted(q for s, q in data_manager.contents if s == site)
+
+
+def fit_cached(
+    data_manager,
+    site: str,
+    quarters: list[CalendarQuarter] | None = None,
+    table_timezone: str = "utc",
+) -> HarmonicModel:
+    """Fit a model to a site's cached quarters, or the given ones"""
+    site = API.canonical_site(site)
+    if quarters is None:
+        quarters = cached_quarters(data_manager, site)
+    series = [
+        parse_data_package_series(
+            data_manager.get_from_cache(site, quarter), table_timezone
+        )
+        for quarter in quarters
+    ]
+    return HarmonicModel.fit(site, series, [quarter_label(q) for q in quarters])
+
+
+def load_model(data_manager, site: str, table_timezone: str = "utc") -> HarmonicModel:
+    """
+    Return the site's saved model, refitted and saved again if the site's cached quarters
+    have changed since it was fitted.
+    """
+    site = API.canonical_site(site)
+    path = model_path(data_manager.cache_directory, site, table_timezone)
+    quarters = cached_quarters(data_manager, site)
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            model = HarmonicModel.from_dict(json.load(file))
+        if model.quarters == [quarter_label(q) for q in quarters]:
+            return model
+    model = fit_cached(data_manager, site, quarters, table_timezone)
+    write_atomic(path, json.dumps(model.to_dict(), indent=2))
+    return model
+
+
+def holdout_report(
+    data_manager,
+    site: str,
+    table_timezone: str = "utc",
+    step: int = FIT_STEP,
+) -> dict:
+    """
+    Measure the model's accuracy on each cached quarter in turn, fitted to all the others.
+
+    Errors are against the held-out quarter's interpolated curve, sampled every step
+    seconds, and against its high and low waters, in metres.
+    """
+    site = API.canonical_site(site)
+    quarters = cached_quarters(data_manager, site)
+    if len(quarters) < 2:
+        raise ValueError(
+            f"Need at least two cached quarters for {site} to hold one out, "
+            f"found {len(quarters)}."
+        )
+    series = {
+        quarter: parse_data_package_series(
+            data_manager.get_from_cache(site, quarter), table_timezone
+        )
+        for quarter in quarters
+    }
+    report = {"site": site, "quarters": {}}
+    for quarter in quarters:
+        others = [q for q in quarters if q != quarter]
+        model = HarmonicModel.fit(
+            site, [series[q] for q in others], [quarter_label(q) for q in others]
+        )
+        held_out = series[quarter]
+        times = np.arange(held_out.times[0], held_out.times[-1] + 1, step)
+        curve = TideInterpolator(held_out, FIT_METHOD)(times.view("datetime64[s]"))
+        errors = model(times.view("datetime64[s]")) - curve
+        event_errors = model(held_out.times.view("datetime64[s]")) - held_out.heights
+        report["quarters"][quarter_label(quarter)] = {
+            "constituents": len(model.constituents),
+            "rmse": float(np.sqrt(np.mean(errors**2))),
+            "max_abs_error": float(np.max(np.abs(errors))),
+            "high_water_rmse": float(
+                np.sqrt(np.mean(event_errors[held_out.is_high] ** 2))
+            ),
+            "low_water_rmse": float(
+                np.sqrt(np.mean(event_errors[~held_out.is_high] ** 2))
+            ),
+        }
+    return report
+
+
+def summarise_holdout(report: dict) -> str:
+    lines = [f"Harmonic model accuracy for {report['site']}, each quarter held out:"]
+    for label, result in report["quarters"].items():
+        lines.append(
+            f"  {label}  rmse {result['rmse']:.3f} m  max {result['max_abs_error']:.3f} m  "
+            f"high water {result['high_water_rmse']:.3f} m  "
+            f"low water {result['low_water_rmse']:.3f} m  "
+            f"({result['constituents']} constituents)"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,284 @@
+"""
+Verification and repair of the tide data cache.
+
+Every quarter file is checked in a process pool: its checksum against the manifest of
+previously verified files, JSON validity, that its table covers exactly the expected
+months, and that each month has a plausible number of high and low waters. Bad files can
+be moved to a quarantine directory and fetched again, and a summary report is written.
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from thames_tidal_helper.api_adapter import SITE_CODE_PATTERN
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.files import pid_alive, write_atomic
+from thames_tidal_helper.harmonics import MODEL_PATTERN
+from thames_tidal_helper.schema import DataPackage
+from thames_tidal_helper.usage import INDEX_FILENAME, INDEX_LOCK_FILENAME
+
+MANIFEST_FILENAME = "manifest.json"
+QUARANTINE_DIRECTORY = "quarantine"
+# A tidal day is about 24h50m, so most days have four high and low waters and some three
+MIN_EVENTS_PER_DAY = 3.5
+MAX_EVENTS_PER_DAY = 4.0
+
+QUARTER_PATTERN = re.compile(
+    rf"^{SITE_CODE_PATTERN}_(\d{{4}})_Q([1-4])(?:\.months((?:-\d{{1,2}})+))?\.json$"
+)
+TEMP_PATTERN = re.compile(r"^.+\.(\d+)\.(\d+)\.tmp$")
+
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def expected_months(filename: str) -> list[tuple[int, int]]:
+    """Return the (year, month) pairs a quarter or partial quarter file should hold"""
+    year, quarter, partial = QUARTER_PATTERN.match(filename).groups()
+    if partial:
+        months = [int(month) for month in partial[1:].split("-")]
+    else:
+        months = [int(quarter) * 3 - 2 + i for i in range(3)]
+    return [(int(year), month) for month in months]
+
+
+def format_months(months: list[tuple[int, int]]) -> str:
+    return "[" + ", ".join(f"{year}-{month:02d}" for year, month in months) + "]"
+
+
+def check_file(directory: str, filename: str, recorded: dict | None) -> dict:
+    """
+    Check one cache file, returning its checksum and any problems found.
+
+    A file whose size and modification time match the manifest but whose checksum does
+    not has been corrupted in place. Files that changed legitimately are checked afresh.
+    """
+    path = os.path.join(directory, filename)
+    stat = os.stat(path)
+    result = {
+        "file": filename,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": sha256(path),
+        "problems": [],
+    }
+    problems = result["problems"]
+    if (
+        recorded is not None
+        and recorded["size"] == stat.st_size
+        and recorded["mtime"] == stat.st_mtime
+        and recorded["sha256"] != result["sha256"]
+    ):
+        problems.append("checksum does not match the manifest")
+
+    try:
+        with open(path, "r") as file:
+            data_package = DataPackage(file.read())
+    except (ValueError, KeyError, TypeError) as e:
+        problems.append(f"invalid data: {e}")
+        return result
+
+    months = {}
+    for month_data in data_package.table.values():
+        try:
+            month_str, year_str = month_data["name"].split(" ")
+            key = (int(year_str), datetime.strptime(month_str, "%B").month)
+        except ValueError:
+            problems.append(f"unrecognised month {month_data['name']!r}")
+            continue
+        months[key] = month_data
+    expected = expected_months(filename)
+    if sorted(months) != expected:
+        problems.append(
+            f"covers months {format_months(sorted(months))}, "
+            f"expected {format_months(expected)}"
+        )
+
+    for (year, month), month_data in sorted(months.items()):
+        days = calendar.monthrange(year, month)[1]
+        events = sum(len(day) for day in month_data["rows"].values())
+        if not MIN_EVENTS_PER_DAY * days <= events <= MAX_EVENTS_PER_DAY * days:
+            problems.append(f"{year}-{month:02d} has {events} events over {days} days")
+        if len(month_data["rows"]) != days:
+            problems.append(
+                f"{year}-{month:02d} has {len(month_data['rows'])} days of {days}"
+            )
+    return result
+
+
+def load_manifest(directory: str) -> dict[str, dict]:
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except ValueError:
+        # the manifest is only a record of past checks, so a bad one is started afresh
+        return {}
+
+
+def write_manifest(directory: str, manifest: dict[str, dict]) -> None:
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    write_atomic(path, json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def stale_temp_files(directory: str) -> list[str]:
+    """Return temporary files left by writers that are no longer running"""
+    stale = []
+    for filename in os.listdir(directory):
+        match = TEMP_PATTERN.match(filename)
+        if match is None:
+            continue
+        if not pid_alive(int(match[1])):
+            stale.append(filename)
+    return sorted(stale)
+
+
+def verify_cache(
+    cache_directory: str,
+    repair: bool = False,
+    fetch: bool = True,
+    workers: int | None = None,
+) -> dict:
+    """
+    Check every file in the cache in parallel, and return a summary report.
+
+    With repair, bad files are moved to the quarantine directory and, if fetch is set,
+    their quarters are fetched again; stale temporary files are removed. The manifest of
+    verified checksums is updated with every file that passed.
+    """
+    started = time.perf_counter()
+    manifest = load_manifest(cache_directory)
+    filenames = sorted(
+        filename
+        for filename in os.listdir(cache_directory)
+        if QUARTER_PATTERN.match(filename)
+    )
+    others = sorted(
+        filename
+        for filename in os.listdir(cache_directory)
+        if filename not in filenames
+        and filename not in (MANIFEST_FILENAME, INDEX_FILENAME, INDEX_LOCK_FILENAME)
+        and not TEMP_PATTERN.match(filename)
+        and not MODEL_PATTERN.match(filename)
+        and os.path.isfile(os.path.join(cache_directory, filename))
+        and not filename.endswith(".npy")
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(
+            pool.map(
+                check_file,
+                [cache_directory] * len(filenames),
+                filenames,
+                [manifest.get(filename) for filename in filenames],
+            )
+        )
+
+    bad = [result for result in results if result["problems"]]
+    stale = stale_temp_files(cache_directory)
+    report = {
+        "cache": cache_directory,
+        "checked": len(results),
+        "ok": len(results) - len(bad),
+        "bad": bad,
+        "unrecognised": others,
+        "stale_temp_files": stale,
+        "quarantined": [],
+        "refetched": [],
+        "refetch_failed": [],
+    }
+    for result in results:
+        if not result["problems"]:
+            manifest[result["file"]] = {
+                key: result[key] for key in ("size", "mtime", "sha256")
+            }
+
+    if repair:
+        repair_cache(cache_directory, bad, stale, fetch, manifest, report)
+    for filename in set(manifest) - set(os.listdir(cache_directory)):
+        del manifest[filename]
+    write_manifest(cache_directory, manifest)
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def repair_cache(
+    cache_directory: str,
+    bad: list[dict],
+    stale: list[str],
+    fetch: bool,
+    manifest: dict[str, dict],
+    report: dict,
+) -> None:
+    """Quarantine bad files and fetch their quarters again, recording what was done"""
+    quarantine = os.path.join(cache_directory, QUARANTINE_DIRECTORY)
+    os.makedirs(quarantine, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    for result in bad:
+        filename = result["file"]
+        shutil.move(
+            os.path.join(cache_directory, filename),
+            os.path.join(quarantine, f"{filename}.{stamp}"),
+        )
+        manifest.pop(filename, None)
+        report["quarantined"].append(filename)
+    for filename in stale:
+        os.remove(os.path.join(cache_directory, filename))
+    if not fetch:
+        return
+
+    data_manager = DataManager(cache_directory)
+    for filename in report["quarantined"]:
+        # partial quarters are fetched whole, which supersedes them
+        site, quarter = data_manager.parse_filename(filename.split(".")[0] + ".json")
+        try:
+            data_manager.get_quarters(site, [quarter])
+        except Exception as e:
+            report["refetch_failed"].append({"file": filename, "error": str(e)})
+            continue
+        new_filename = data_manager.generate_filename(site, quarter)
+        result = check_file(cache_directory, new_filename, None)
+        if result["problems"]:
+            report["refetch_failed"].append(
+                {"file": filename, "error": "; ".join(result["problems"])}
+            )
+            continue
+        manifest[new_filename] = {
+            key: result[key] for key in ("size", "mtime", "sha256")
+        }
+        report["refetched"].append(new_filename)
+
+
+def summarise(report: dict) -> str:
+    """Return a short human-readable summary of a report"""
+    lines = [
+        f"Checked {report['checked']} files in {report['cache']}: "
+        f"{report['ok']} ok, {len(report['bad'])} bad "
+        f"({report['seconds']:.2f}s)"
+    ]
+    for result in report["bad"]:
+        lines.append(f"  {result['file']}: {'; '.join(result['problems'])}")
+    for key, label in (
+        ("unrecognised", "Unrecognised files"),
+        ("stale_temp_files", "Stale temporary files"),
+        ("quarantined", "Quarantined"),
+        ("refetched", "Fetched again"),
+    ):
+        if report[key]:
+            lines.append(f"{label}: {', '.join(report[key])}")
+    for failure in report["refetch_failed"]:
+        lines.append(f"Could not fetch {failure['file']} again: {failure['error']}")
+    return "\n".join(lines)
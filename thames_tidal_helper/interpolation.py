@@ -1,12 +1,18 @@
 """
 This module provides functions to interpolate tidal heights between known points.
 
-Currently only linear interpolation is used.
+Three curves are available between consecutive high and low waters:
+
+- "linear": straight lines, as used historically.
+- "cosine": a half-cosine between each pair of events, the smooth form of the rule of twelfths.
+- "pchip": a monotone piecewise cubic (Fritsch-Carlson), which never overshoots an event.
 """
 
 from datetime import datetime
 
-from thames_tidal_helper.schema import TideEntry
+import numpy as np
+
+from thames_tidal_helper.schema import TideEntry, TideSeries
 
 
 def interpolate_tidal_heights(
@@ -42,3 +48,176 @@ def interpolate_tidal_heights(
 
         results[dt] = height
     return results
+
+
+INTERPOLATION_METHODS = ("linear", "cosine", "pchip")
+# Halvings of an interval when solving for a pchip crossing: 2**-32 of six hours is ~5 us
+CROSSING_BISECTIONS = 32
+
+
+class TideInterpolator:
+    """
+    A tidal curve through a TideSeries, with per-interval coefficients computed once.
+
+    Each interval between consecutive events stores a cubic in the normalised time
+    s = (t - t_start) / (t_end - t_start), so evaluation is a search and a Horner step.
+    Queries outside the series are clamped to the first or last event.
+    """
+
+    def __init__(self, series: TideSeries, method: str = "linear"):
+        if method not in INTERPOLATION_METHODS:
+            raise ValueError(
+                f"Interpolation method {method} not found. Choose from {INTERPOLATION_METHODS}."
+            )
+        if len(series) == 0:
+            raise ValueError("Cannot interpolate an empty series.")
+        self.method = method
+        self.times = series.times
+        # as np.interp: duplicate times would give zero-length intervals
+        durations = np.maximum(np.diff(series.times), 1).astype(np.float64)
+        self.inverse_durations = 1.0 / durations
+        rises = np.diff(series.heights)
+
+        starts = series.heights[:-1]
+        if method == "pchip" and len(rises) > 0:
+            gradients = pchip_gradients(durations, rises / durations)
+            # a high or low water followed by the opposite kind is a turning point
+            if series.is_high[0] != series.is_high[1]:
+                gradients[0] = 0.0
+            if series.is_high[-1] != series.is_high[-2]:
+                gradients[-1] = 0.0
+            # end gradients scaled to the normalised interval
+            m0 = gradients[:-1] * durations
+            m1 = gradients[1:] * durations
+            terms = [starts, m0, 3 * rises - 2 * m0 - m1, m0 + m1 - 2 * rises]
+        else:
+            zeros = np.zeros_like(rises)
+            terms = [starts, rises, zeros, zeros]
+        # shape (intervals, 4): constant, linear, quadratic and cubic terms
+        self.coefficients = np.column_stack(terms)
+        self.last_height = series.heights[-1]
+
+    def __call__(self, times: np.ndarray) -> np.ndarray:
+        seconds = times.astype("datetime64[s]", copy=False).view(np.int64)
+        if len(self.coefficients) == 0:
+            return np.full(seconds.shape, self.last_height, dtype=np.float64)
+
+        index = np.searchsorted(self.times, seconds, side="right") - 1
+        np.clip(index, 0, len(self.coefficients) - 1, out=index)
+        s = (seconds - self.times[index]) * self.inverse_durations[index]
+        np.clip(s, 0.0, 1.0, out=s)
+        if self.method == "cosine":
+            s = 0.5 - 0.5 * np.cos(np.pi * s)
+
+        a, b, c, d = self.coefficients[index].T
+        return a + s * (b + s * (c + s * d))
+
+    def crossings(self, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the times (float epoch seconds) at which the curve passes a height, and
+        whether it is rising through it at each, in one pass over the intervals.
+
+        The curve is monotone between consecutive events, so each interval crosses at most
+        once: the linear and cosine curves are solved directly, and pchip by bisection.
+        """
+        heights = np.append(self.coefficients[:, 0], self.last_height)
+        # taken from the events, so consecutive intervals agree on which side each is
+        start_above = heights[:-1] > threshold
+        end_above = heights[1:] > threshold
+        index = np.flatnonzero(start_above != end_above)
+        a, b, c, d = self.coefficients[index].T
+        rising = end_above[index]
+        if self.method == "pchip":
+            lower = np.zeros(len(index))
+            upper = np.ones(len(index))
+            for _ in range(CROSSING_BISECTIONS):
+                s = 0.5 * (lower + upper)
+                # the crossing is later while the curve has not yet passed the threshold
+                later = (a + s * (b + s * (c + s * d)) > threshold) != rising
+                lower = np.where(later, s, lower)
+                upper = np.where(later, upper, s)
+            s = 0.5 * (lower + upper)
+        else:
+            # b is the whole rise of the interval, and is non-zero where it crosses
+            s = np.clip((threshold - a) / b, 0.0, 1.0)
+            if self.method == "cosine":
+                s = np.arccos(1.0 - 2.0 * s) / np.pi
+        times = self.times[index] + s / self.inverse_durations[index]
+        return times, rising
+
+
+def pchip_gradients(durations: np.ndarray, secants: np.ndarray) -> np.ndarray:
+    """
+    Fritsch-Carlson gradients at each event, from the interval durations and secant slopes.
+
+    Gradients are zero at turning points (where the secants change sign), so the curve
+    peaks exactly at each high water and bottoms out at each low water.
+    """
+    gradients = np.zeros(len(secants) + 1)
+    if len(secants) == 1:
+        gradients[:] = secants[0]
+        return gradients
+
+    h0, h1 = durations[:-1], durations[1:]
+    d0, d1 = secants[:-1], secants[1:]
+    w0 = 2 * h1 + h0
+    w1 = h1 + 2 * h0
+    same_sign = (np.sign(d0) * np.sign(d1)) > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w0 + w1) / (w0 / d0 + w1 / d1)
+    gradients[1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    gradients[0] = _pchip_end_gradient(
+        durations[0], durations[1], secants[0], secants[1]
+    )
+    gradients[-1] = _pchip_end_gradient(
+        durations[-1], durations[-2], secants[-1], secants[-2]
+    )
+    return gradients
+
+
+def _pchip_end_gradient(h0: float, h1: float, d0: float, d1: float) -> float:
+    # one-sided three-point estimate, kept shape-preserving
+    gradient = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+    if np.sign(gradient) != np.sign(d0):
+        return 0.0
+    if np.sign(d0) != np.sign(d1) and abs(gradient) > abs(3 * d0):
+        return 3 * d0
+    return gradient
+
+
+def interpolate_heights(
+    series: TideSeries, times: np.ndarray, method: str = "linear"
+) -> np.ndarray:
+    """
+    Interpolate tidal heights for an array of datetime64 values,
+    using a TideSeries of known high and low waters.
+
+    The times are never converted to Python datetimes, so this is suitable for large inputs.
+    Build a TideInterpolator directly to reuse the coefficients across calls.
+    """
+    return TideInterpolator(series, method)(times)
+
+
+def accuracy_report(
+    series: TideSeries, reference_times: np.ndarray, reference_heights: np.ndarray
+) -> dict[str, dict[str, float]]:
+    """
+    Compare each interpolation method against reference heights, such as the per-minute
+    listing in a PLA payload. Returns the RMS and maximum absolute errors in metres.
+    Reference points outside the span of the series are ignored.
+    """
+    seconds = reference_times.astype("datetime64[s]").view(np.int64)
+    within = (seconds >= series.times[0]) & (seconds <= series.times[-1])
+    reference_times, reference_heights = (
+        reference_times[within],
+        reference_heights[within],
+    )
+    report = {}
+    for method in INTERPOLATION_METHODS:
+        errors = TideInterpolator(series, method)(reference_times) - reference_heights
+        report[method] = {
+            "rmse": float(np.sqrt(np.mean(errors**2))),
+            "max_abs_error": float(np.max(np.abs(errors))),
+        }
+    return report
@@ -0,0 +1,180 @@
+"""
+End-to-end load tests of the fetch and cache layers, against a local stub PLA server.
+
+Each run fetches the same quarters into a fresh, empty cache at each level of concurrency,
+and reports throughput, per-quarter fetch times and how the download path coped with
+failed or truncated responses: how many retries were needed, how many quarters could not
+be fetched, and whether the cache passed verification afterwards.
+
+The payloads are built before any level is timed, so every level measures serving and
+fetching alone. A stub started here runs in this process, and shares the GIL with the
+fetching threads; to measure without that, run the stub command in another process and
+pass its root as api_root.
+"""
+
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.data_manager import DataManager
+from thames_tidal_helper.integrity import verify_cache
+from thames_tidal_helper.profiling import Profiler
+from thames_tidal_helper.schema import CalendarQuarter
+from thames_tidal_helper.stub_server import (
+    DEFAULT_EXAMPLES_DIRECTORY,
+    DEFAULT_GRAPH_DAYS,
+    DEFAULT_LISTING_DAYS,
+    PayloadGenerator,
+    StubServer,
+    load_template,
+)
+
+DEFAULT_CONCURRENCY = (1, 2, 4, 8)
+# Quarters are fetched from here on, so no real cache could already hold them
+FIRST_QUARTER = CalendarQuarter(2030, 1)
+
+
+def fetch_quarter(
+    data_manager: DataManager, site: str, quarter: CalendarQuarter, retries: int
+) -> dict:
+    """Fetch a quarter, trying again up to retries times, and time it"""
+    from requests import RequestException
+
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            data_manager.get_quarters(site, [quarter])
+        except (RequestException, ValueError) as e:
+            error = str(e)
+            continue
+        return {"seconds": time.perf_counter() - started, "attempts": attempt}
+    return {
+        "seconds": time.perf_counter() - started,
+        "attempts": retries + 1,
+        "error": error,
+    }
+
+
+def run_level(
+    site: str,
+    quarters: list[CalendarQuarter],
+    workers: int,
+    retries: int,
+    stub: StubServer | None = None,
+) -> dict:
+    """Fetch the quarters into an empty cache with a number of threads"""
+    with tempfile.TemporaryDirectory() as cache_directory:
+        profiler = Profiler()
+        data_manager = DataManager(cache_directory, profiler)
+        requests_before = stub.stats()["requests"] if stub else None
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                pool.map(
+                    lambda quarter: fetch_quarter(data_manager, site, quarter, retries),
+                    quarters,
+                )
+            )
+        seconds = time.perf_counter() - started
+        data_manager.usage.close()
+        verified = verify_cache(cache_directory, workers=1)
+
+    fetched = [result for result in results if "error" not in result]
+    times = np.array([result["seconds"] for result in fetched])
+    counters = profiler.report()["counters"]
+    return {
+        "workers": workers,
+        "seconds": seconds,
+        "quarters": len(quarters),
+        "fetched": len(fetched),
+        "failed": [
+            {"quarter": repr(quarter), "error": result["error"]}
+            for quarter, result in zip(quarters, results)
+            if "error" in result
+        ],
+        "retries": sum(result["attempts"] - 1 for result in results),
+        "rejected_responses": counters.get("fetches_rejected", 0),
+        "requests": stub.stats()["requests"] - requests_before if stub else None,
+        "bytes_fetched": counters.get("bytes_fetched", 0),
+        "quarters_per_second": len(fetched) / seconds,
+        "megabytes_per_second": counters.get("bytes_fetched", 0) / 2**20 / seconds,
+        "fetch_p50": float(np.percentile(times, 50)) if len(times) else None,
+        "fetch_p95": float(np.percentile(times, 95)) if len(times) else None,
+        "cache_ok": not verified["bad"] and verified["checked"] == len(fetched),
+    }
+
+
+def run_load_test(
+    site: str = "Chelsea Bridge",
+    quarters: int = 8,
+    concurrency: tuple[int, ...] = DEFAULT_CONCURRENCY,
+    retries: int = 2,
+    api_root: str | None = None,
+    examples_directory: str = DEFAULT_EXAMPLES_DIRECTORY,
+    graph_days: int = DEFAULT_GRAPH_DAYS,
+    listing_days: int = DEFAULT_LISTING_DAYS,
+    **stub_options,
+) -> dict:
+    """
+    Run the load test at each level of concurrency, and return a report.
+
+    A stub server is started for the test with the given options (latency, jitter,
+    error_rate, truncate_rate and seed), unless an api_root is given to test against.
+    Its payloads are prepared before the first level is timed.
+    """
+    stub = None
+    if api_root is None:
+        generator = PayloadGenerator(
+            load_template(examples_directory), graph_days, listing_days
+        )
+        stub = StubServer(generator, port=0, **stub_options)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+    previous_root = API.root
+    API.set_root(api_root or stub.url)
+    report = {
+        "api_root": API.root,
+        "site": site,
+        "stub": stub_options if stub else None,
+        "levels": [],
+    }
+    start = FIRST_QUARTER.index()
+    to_fetch = [CalendarQuarter.from_index(start + i) for i in range(quarters)]
+    try:
+        if stub:
+            # each quarter is requested from the first day of its first month
+            stub.prepare([(q.year, 3 * q.quarter - 2, 1) for q in to_fetch])
+        for workers in concurrency:
+            report["levels"].append(run_level(site, to_fetch, workers, retries, stub))
+    finally:
+        API.root = previous_root
+        if stub:
+            stub.shutdown()
+            stub.server_close()
+    baseline = report["levels"][0]["quarters_per_second"] if report["levels"] else 0
+    for level in report["levels"]:
+        level["speedup"] = level["quarters_per_second"] / baseline if baseline else None
+    return report
+
+
+def summarise_load_test(report: dict) -> str:
+    """Return a short human-readable table of a load test report"""
+    lines = [
+        f"Load test of {report['api_root']} for {report['site']}",
+        "workers  quarters/s  MB/s    p50 (s)  p95 (s)  speedup  retries  failed  cache",
+    ]
+    for level in report["levels"]:
+        p50 = f"{level['fetch_p50']:.3f}" if level["fetch_p50"] is not None else "-"
+        p95 = f"{level['fetch_p95']:.3f}" if level["fetch_p95"] is not None else "-"
+        speedup = f"{level['speedup']:.2f}" if level["speedup"] is not None else "-"
+        lines.append(
+            f"{level['workers']:>7}  {level['quarters_per_second']:>10.2f}  "
+            f"{level['megabytes_per_second']:>6.2f}  {p50:>7}  {p95:>7}  "
+            f"{speedup:>7}  {level['retries']:>7}  "
+            f"{len(level['failed']):>6}  {'ok' if level['cache_ok'] else 'BAD'}"
+        )
+    return "\n".join(lines)
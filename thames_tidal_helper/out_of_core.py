@@ -0,0 +1,126 @@
+"""
+Bounded-memory processing of inputs too large to hold in RAM.
+
+The input is read in chunks and distributed by calendar quarter into spill files on disk
+(a one-pass bucket sort), then walked quarter by quarter, so only the current quarter's
+queries and the series either side of it are resident. Heights are written straight into
+a memory-mapped array at each query's position in the input.
+"""
+
+import io
+import os
+import sys
+from itertools import islice
+from typing import Iterator
+
+import numpy as np
+
+from thames_tidal_helper.schema import CalendarQuarter
+
+# Working memory per query in a chunk: input, UTC and spilled times, positions, heights and
+# the interpolator's temporaries, with some headroom
+BYTES_PER_QUERY = 96
+# Share of the memory limit given to query chunks; the rest is left for parsing and series
+CHUNK_SHARE = 0.25
+MIN_CHUNK_SIZE = 1024
+
+# A spilled query: its position in the input and its UTC time in epoch seconds
+SPILL_DTYPE = np.dtype([("position", "<i8"), ("seconds", "<i8")])
+
+
+def chunk_size_for(memory_limit: int) -> int:
+    """Return how many queries to process at once within a memory limit in bytes"""
+    return max(MIN_CHUNK_SIZE, int(memory_limit * CHUNK_SHARE) // BYTES_PER_QUERY)
+
+
+def iter_input_chunks(input_file: str, chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    Yield the input times as datetime64[s] arrays of at most chunk_size values.
+
+    Text files and stdin are read a chunk of lines at a time, and .npy files are
+    memory-mapped and sliced. A .npy array on stdin cannot be mapped and is read whole.
+    """
+    from thames_tidal_helper.client import NPY_MAGIC, Client
+
+    if input_file.endswith(".npy"):
+        values = np.load(input_file, mmap_mode="r")
+        for start in range(0, len(values), chunk_size):
+            yield Client._as_datetime64(np.array(values[start : start + chunk_size]))
+        return
+    if input_file == "-":
+        stream = sys.stdin.buffer
+        if stream.peek(len(NPY_MAGIC)).startswith(NPY_MAGIC):
+            values = Client._as_datetime64(np.load(io.BytesIO(stream.read())))
+            for start in range(0, len(values), chunk_size):
+                yield values[start : start + chunk_size]
+            return
+        file = io.TextIOWrapper(stream)
+    else:
+        file = open(input_file, "r")
+    with file:
+        while lines := list(islice(file, chunk_size)):
+            yield Client._parse_text_times(lines)
+
+
+class QuarterBuckets:
+    """
+    Queries spilled to one file per calendar quarter, in a directory.
+
+    The input times are also kept, in input order, so results can be written out without
+    reading the input a second time.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.counts: dict[int, int] = {}
+        self.total = 0
+
+    def path(self, quarter_index: int) -> str:
+        return os.path.join(self.directory, f"quarter_{quarter_index}.bin")
+
+    @property
+    def times_path(self) -> str:
+        return os.path.join(self.directory, "times.bin")
+
+    def add(self, times: np.ndarray, utc_times: np.ndarray) -> None:
+        """Spill a chunk of input times, and the same times in UTC, to the buckets"""
+        records = np.empty(len(times), dtype=SPILL_DTYPE)
+        records["position"] = np.arange(self.total, self.total + len(times))
+        records["seconds"] = utc_times.view(np.int64)
+        quarter_indices = CalendarQuarter.index_datetime64(utc_times)
+        order = np.argsort(quarter_indices, kind="stable")
+        quarters, starts = np.unique(quarter_indices[order], return_index=True)
+        for quarter, bucket in zip(quarters.tolist(), np.split(order, starts[1:])):
+            with open(self.path(quarter), "ab") as file:
+                records[bucket].tofile(file)
+            self.counts[quarter] = self.counts.get(quarter, 0) + len(bucket)
+        with open(self.times_path, "ab") as file:
+            times.astype("datetime64[s]").view(np.int64).tofile(file)
+        self.total += len(times)
+
+    def quarters(self) -> list[int]:
+        """Return the quarters with queries, in time order"""
+        return sorted(self.counts)
+
+    def read(
+        self, quarter_index: int, chunk_size: int
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Yield (positions, datetime64[s] UTC times) for a quarter's queries in chunks"""
+        path = self.path(quarter_index)
+        for start in range(0, self.counts[quarter_index], chunk_size):
+            records = np.fromfile(
+                path,
+                dtype=SPILL_DTYPE,
+                count=chunk_size,
+                offset=start * SPILL_DTYPE.itemsize,
+            )
+            yield records["position"], records["seconds"].view("datetime64[s]")
+
+    def read_times(self, chunk_size: int) -> Iterator[tuple[int, np.ndarray]]:
+        """Yield (start position, datetime64[s] input times) in input order, in chunks"""
+        times = np.memmap(self.times_path, dtype="<i8", mode="r")
+        for start in range(0, len(times), chunk_size):
+            yield start, np.array(times[start : start + chunk_size]).view(
+                "datetime64[s]"
+            )
+        del times
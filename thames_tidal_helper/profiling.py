@@ -0,0 +1,99 @@
+"""
+Stage timing and counters for Client runs.
+
+A Profiler is passed to the Client and DataManager, which wrap each stage of a run in
+`profiler.stage(...)` and record counts with `profiler.count(...)`. The default
+NullProfiler does nothing, so the instrumentation costs next to nothing when disabled.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+# Stages, in the order a run reaches them. Stages nest: "run" covers the whole of Client.run.
+STAGES = (
+    "run",
+    "cache_scan",
+    "input_load",
+    "fetch",
+    "cache_read",
+    "json_parse",
+    "parse_data_package",
+    "interpolator_build",
+    "interpolation",
+    "grid_build",
+    "grid_lookup",
+    "output_write",
+)
+
+
+class NullProfiler:
+    """A profiler that records nothing"""
+
+    enabled = False
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        pass
+
+
+class Profiler(NullProfiler):
+    """Records wall time per stage and named counters, safe to share between threads"""
+
+    enabled = True
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self) -> dict:
+        """Return the stage times, counters and interpolation throughput as a dict"""
+        with self.lock:
+            order = list(STAGES) + sorted(set(self.seconds) - set(STAGES))
+            stages = {
+                name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+                for name in order
+                if name in self.seconds
+            }
+            counters = dict(sorted(self.counters.items()))
+        interpolation_seconds = self.seconds.get("interpolation", 0.0)
+        interpolation_seconds += self.seconds.get("grid_lookup", 0.0)
+        queries = counters.get("queries", 0)
+        return {
+            "stages": stages,
+            "counters": counters,
+            "queries_per_second": (
+                queries / interpolation_seconds if interpolation_seconds > 0 else None
+            ),
+        }
+
+    def write_report(self, path: str) -> None:
+        """Write the report as JSON to a file, or to stderr if the path is '-'"""
+        text = json.dumps(self.report(), indent=2)
+        if path == "-":
+            print(text, file=sys.stderr)
+            return
+        with open(path, "w") as file:
+            file.write(text + "\n")
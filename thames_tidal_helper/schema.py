@@ -2,6 +2,10 @@ from json import loads as load_json
 from datetime import datetime
 from typing import TypedDict, Self
 
+import numpy as np
+
+from thames_tidal_helper.timezones import to_utc
+
 
 class TideEntry:
     def __init__(self, time: datetime, type: str, height: float):
@@ -16,6 +20,36 @@ class TideEntry:
         return self.__str__()
 
 
+class TideSeries:
+    """
+    Tidal events held as parallel arrays, sorted by time.
+
+    Times are integer seconds since 1970-01-01 00:00 UTC. Arrays that are already sorted and
+    of the right types are used as they are, not copied, so a series can be a view of
+    shared memory.
+    """
+
+    def __init__(self, times: np.ndarray, heights: np.ndarray, is_high: np.ndarray):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.heights = np.asarray(heights, dtype=np.float64)
+        self.is_high = np.asarray(is_high, dtype=bool)
+        if np.any(self.times[1:] < self.times[:-1]):
+            order = np.argsort(self.times, kind="stable")
+            self.times = self.times[order]
+            self.heights = self.heights[order]
+            self.is_high = self.is_high[order]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @staticmethod
+    def from_entries(entries: list[TideEntry]) -> "TideSeries":
+        times = np.array([entry.time for entry in entries], dtype="datetime64[s]")
+        heights = [entry.height for entry in entries]
+        is_high = [entry.type == "HIGH" for entry in entries]
+        return TideSeries(times.astype(np.int64), heights, is_high)
+
+
 class TideEntryDict(TypedDict):
     """Type hints for the PLA data entry format"""
 
@@ -114,6 +148,73 @@ def parse_data_package(data_package: DataPackage) -> list[TideEntry]:
     return entries
 
 
+def parse_data_package_series(
+    data_package: DataPackage, table_timezone: str = "utc"
+) -> TideSeries:
+    """
+    Parse the high and low waters in a payload straight into a TideSeries in UTC.
+
+    The payload's TimeOffset (hours ahead of the table timezone) is removed, and if the
+    table is in UK civil time ("uk") the GMT/BST rules are applied, once for the whole
+    quarter. No datetime objects are created.
+    """
+    month_starts, rows = [], []
+    for month_data in data_package.table.values():
+        month_str, year_str = month_data["name"].split(" ")
+        month = datetime.strptime(month_str, "%B").month
+        month_start = np.datetime64(f"{year_str}-{month:02d}", "M")
+        for day_data in month_data["rows"].values():
+            rows.extend(day_data)
+            month_starts.extend([month_start] * len(day_data))
+    if not rows:
+        return TideSeries(np.empty(0), np.empty(0), np.empty(0))
+
+    starts = np.array(month_starts, dtype="datetime64[M]").astype("datetime64[s]")
+    days = np.array([entry["Day"] for entry in rows], dtype=np.int64)
+    # time is in the format '2010' for 10 minutes past 8pm
+    clock = np.array([entry["Time"] for entry in rows]).astype(np.int64)
+    heights = np.char.replace(np.array([entry["Height"] for entry in rows]), "m", "")
+    is_high = np.array([entry["Type"] for entry in rows]) != 0
+
+    offset_hours = float(data_package.json_data.get("TimeOffset") or 0)
+    seconds = (
+        starts.view(np.int64)
+        + (days - 1) * 86400
+        + (clock // 100) * 3600
+        + (clock % 100) * 60
+        - round(offset_hours * 3600)
+    )
+    times = to_utc(seconds.view("datetime64[s]"), table_timezone)
+    return TideSeries(times.view(np.int64), heights.astype(np.float64), is_high)
+
+
+def parse_reference_heights(
+    data_package: DataPackage,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the per-minute heights in a payload as (datetime64[s] times, heights) arrays.
+
+    Uses the 'listing' rows, falling back to the 'graph_data' curves when the listing is empty.
+    """
+    listing = data_package.json_data.get("listing") or []
+    if listing:
+        # date is in the format '01/07/2024', time '00:00'
+        stamps = [
+            f"{row['date'][6:]}-{row['date'][3:5]}-{row['date'][:2]}T{row['time']}"
+            for row in listing
+        ]
+        times = np.array(stamps, dtype="datetime64[s]")
+        heights = np.array([row["height"] for row in listing], dtype=np.float64)
+    else:
+        graphs = data_package.json_data.get("graph_data", {}).get("graphs", {})
+        points = [point for graph in graphs.values() for point in graph]
+        times = np.array([point["x"] for point in points], dtype=np.int64)
+        times = times.view("datetime64[s]")
+        heights = np.array([point["y"] for point in points], dtype=np.float64)
+    order = np.argsort(times, kind="stable")
+    return times[order], heights[order]
+
+
 class CalendarQuarter:
     def __init__(self, year: int, quarter: int):
         self.year = year
@@ -139,3 +240,34 @@ class CalendarQuarter:
         month = dt.month
         quarter = (month - 1) // 3 + 1
         return CalendarQuarter(year, quarter)
+
+    @staticmethod
+    def from_datetime64(times: np.ndarray) -> list["CalendarQuarter"]:
+        """Return the distinct, sorted quarters covered by an array of datetime64 values"""
+        quarters = np.unique(CalendarQuarter.index_datetime64(times))
+        return [CalendarQuarter.from_index(int(q)) for q in quarters]
+
+    @staticmethod
+    def index_datetime64(times: np.ndarray) -> np.ndarray:
+        """Return the number of quarters since 1970 Q1 for each datetime64 value"""
+        # months since 1970-01 integer-divided by 3 gives quarters since 1970 Q1
+        months = times.astype("datetime64[M]").astype(np.int64)
+        return months // 3
+
+    @staticmethod
+    def from_index(index: int) -> "CalendarQuarter":
+        """Return the quarter a number of quarters after 1970 Q1"""
+        return CalendarQuarter(1970 + index // 4, index % 4 + 1)
+
+    def index(self) -> int:
+        """Return the number of quarters since 1970 Q1"""
+        return (self.year - 1970) * 4 + self.quarter - 1
+
+    def month_indices(self) -> range:
+        """Return the months of this quarter, as numbers of months since 1970-01"""
+        return range(self.index() * 3, self.index() * 3 + 3)
+
+    def bounds(self) -> tuple[np.datetime64, np.datetime64]:
+        """Return the start of this quarter and of the next, as datetime64[s] values"""
+        start = np.datetime64(f"{self.year:04d}-{self.quarter * 3 - 2:02d}", "M")
+        return start.astype("datetime64[s]"), (start + 3).astype("datetime64[s]")
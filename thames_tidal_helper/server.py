@@ -0,0 +1,210 @@
+"""
+A long-running server that keeps parsed tide data in memory, and a thin client for it.
+
+The server holds one Client for its lifetime, so the cache scan and JSON parsing are paid
+once rather than on every invocation. Queries are sent as raw int64 epoch seconds and
+answered with raw float64 heights, to avoid text encoding on both sides.
+
+    POST /heights?site=<site>&method=<method>   body: int64 seconds, returns float64 heights
+    GET  /health                                 returns {"status": "ok", ...} as JSON
+"""
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Sequence
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.client import Client
+from thames_tidal_helper.config import (
+    DEFAULT_CACHE_PATH,
+    DEFAULT_SERVER_HOST,
+    DEFAULT_SERVER_PORT,
+)
+from thames_tidal_helper.interpolation import INTERPOLATION_METHODS
+from thames_tidal_helper.timezones import to_utc
+
+
+class TideRequestHandler(BaseHTTPRequestHandler):
+    server: "TideServer"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_error(404, "Unknown endpoint")
+            return
+        sites = self.server.client.loaded_sites()
+        self.send_body(200, json.dumps({"status": "ok", "sites": sites}).encode())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/heights":
+            self.send_error(404, "Unknown endpoint")
+            return
+        query = parse_qs(url.query)
+        site = query.get("site", [self.server.client.site])[0]
+        method = query.get("method", [None])[0]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # only a bad query is the caller's fault (400); anything else is the server's (500)
+        problem = self.query_problem(site, method, body)
+        if problem:
+            self.send_body(400, problem.encode(), "text/plain")
+            return
+        try:
+            times = np.frombuffer(body, dtype="<i8").view("datetime64[s]")
+            # remote clients always send UTC
+            heights = self.server.client.heights(site, times, method, "utc")
+        except Exception as e:
+            # e.g. a failed fetch or an unreadable cache file; reply rather than hang up
+            self.send_body(500, f"{type(e).__name__}: {e}".encode(), "text/plain")
+            return
+        self.send_body(200, heights.astype("<f8").tobytes())
+
+    @staticmethod
+    def query_problem(site: str | None, method: str | None, body: bytes) -> str | None:
+        """Return what is wrong with a height query, or None if it is well formed"""
+        if site is None:
+            return "No site given."
+        try:
+            API.site_to_code(site)
+        except ValueError as e:
+            return str(e)
+        if method is not None and method not in INTERPOLATION_METHODS:
+            return f"Interpolation method {method} not found. Choose from {INTERPOLATION_METHODS}."
+        if len(body) % 8:
+            return "The body must be int64 epoch seconds."
+        return None
+
+    def send_body(
+        self, status: int, body: bytes, content_type: str = "application/octet-stream"
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        if not self.server.client.silent:
+            super().log_message(format, *args)
+
+
+class TideServer(ThreadingHTTPServer):
+    """An HTTP server answering height queries from a shared, preloaded Client"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        client: Client,
+        host: str = DEFAULT_SERVER_HOST,
+        port: int = DEFAULT_SERVER_PORT,
+    ):
+        self.client = client
+        super().__init__((host, port), TideRequestHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(
+    cache_path: str = DEFAULT_CACHE_PATH,
+    host: str = DEFAULT_SERVER_HOST,
+    port: int = DEFAULT_SERVER_PORT,
+    method: str = "linear",
+    silent: bool = False,
+    table_timezone: str = "utc",
+) -> None:
+    """Preload every cached quarter and answer queries until interrupted"""
+    client = Client(
+        cache_path=cache_path,
+        method=method,
+        silent=silent,
+        table_timezone=table_timezone,
+    )
+    client.preload()
+    with TideServer(client, host, port) as server:
+        if not silent:
+            print(f"Serving tidal heights at {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+class RemoteClient:
+    """
+    Forwards height queries to a running server instead of loading data.
+
+    It wraps a local Client for the input, output and options, so run() behaves as it does
+    locally. The Client can be made without a cache (cache_path=None), as the server owns
+    it. Options that only the server could honour are rejected rather than ignored.
+    """
+
+    def __init__(self, server_url: str, client: Client, timeout: float = 60.0):
+        unsupported = [
+            option
+            for option, value in (
+                ("chainage", client.chainage is not None),
+                ("memory_limit", client.memory_limit),
+                ("grid_step", client.grid_step),
+                ("harmonic_fallback", client.harmonic_fallback),
+                ("store_directory", client.store),
+                ("fetch_granularity", client.fetch_granularity != "quarter"),
+                # the server reads the tables as it was started with
+                ("table_timezone", client.table_timezone != "utc"),
+            )
+            if value
+        ]
+        if unsupported:
+            raise ValueError(
+                f"Not supported when querying a server: {', '.join(unsupported)}."
+            )
+        self.server_url = server_url.rstrip("/")
+        self.client = client
+        self.timeout = timeout
+
+    def heights(
+        self,
+        site: str,
+        times: Sequence | np.ndarray,
+        method: str | None = None,
+        timezone: str | None = None,
+    ) -> np.ndarray:
+        """Return the server's heights at a site, as Client.heights does locally"""
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+
+        timezone = timezone or self.client.timezone
+        query_times = to_utc(self.client.as_query_times(times), timezone)
+        query = urlencode({"site": site, "method": method or self.client.method})
+        body = query_times.view(np.int64).astype("<i8").tobytes()
+        request = Request(f"{self.server_url}/heights?{query}", data=body)
+        request.add_header("Content-Type", "application/octet-stream")
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return np.frombuffer(response.read(), dtype="<f8").astype(np.float64)
+        except HTTPError as e:
+            message = e.read().decode()
+            if e.code == 400:
+                # only a bad query is answered with a 400
+                raise ValueError(message) from None
+            raise OSError(f"Server error {e.code}: {message}") from None
+
+    def run(self):
+        """Read the input, query the server and write the output, as Client.run does"""
+        client = self.client
+        with client.profiler.stage("run"):
+            with client.profiler.stage("input_load"):
+                times = client.load_input_times(client.input_file)
+            with client.profiler.stage("remote_query"):
+                heights = self.heights(client.site, times)
+            client.profiler.count("queries", len(times))
+
+            with client.profiler.stage("output_write"):
+                if not client.silent:
+                    client.print_results(times, heights)
+                client.write_results(times, heights)
@@ -0,0 +1,95 @@
+"""
+Heights between gauges along the river.
+
+A position is given as a chainage (approximate km downstream of Teddington Lock) or as a
+latitude and longitude, which is projected onto the line through the gauges. The two
+gauges either side are evaluated and blended: the tide reaches the downstream gauge first,
+so each gauge is sampled a fraction of the phase lag away from the query time.
+"""
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.schema import TideSeries
+
+EARTH_RADIUS_KM = 6371.0
+# longest delay between a high water downstream and the same high water upstream
+MAX_PHASE_LAG = 4 * 3600
+
+
+def bracketing_gauges(
+    chainage: float,
+) -> tuple[API.TidalGauge, API.TidalGauge, float]:
+    """
+    Return the gauges upstream and downstream of a chainage, and how far (0 to 1) the
+    chainage lies from the upstream gauge to the downstream one.
+    """
+    gauges = API.GAUGES.by_chainage
+    if not gauges[0].chainage <= chainage <= gauges[-1].chainage:
+        raise ValueError(
+            f"Chainage {chainage} km is outside the gauges, which run from "
+            f"{gauges[0].chainage} to {gauges[-1].chainage} km."
+        )
+    for upstream, downstream in zip(gauges, gauges[1:]):
+        if chainage <= downstream.chainage:
+            break
+    fraction = (chainage - upstream.chainage) / (
+        downstream.chainage - upstream.chainage
+    )
+    return upstream, downstream, fraction
+
+
+def chainage_from_position(latitude: float, longitude: float) -> float:
+    """Project a latitude and longitude onto the line through the gauges, giving a chainage"""
+    gauges = API.GAUGES.by_chainage
+    # equirectangular projection to km, fine over the length of the estuary
+    scale = np.cos(np.radians(latitude))
+    points = (
+        np.radians([[gauge.longitude * scale, gauge.latitude] for gauge in gauges])
+        * EARTH_RADIUS_KM
+    )
+    target = np.radians([longitude * scale, latitude]) * EARTH_RADIUS_KM
+    starts, ends = points[:-1], points[1:]
+    segments = ends - starts
+    fractions = np.clip(
+        np.sum((target - starts) * segments, axis=1) / np.sum(segments**2, axis=1),
+        0.0,
+        1.0,
+    )
+    nearest = starts + fractions[:, None] * segments
+    closest = int(np.argmin(np.sum((nearest - target) ** 2, axis=1)))
+    chainages = np.array([gauge.chainage for gauge in gauges])
+    return float(
+        chainages[closest]
+        + fractions[closest] * (chainages[closest + 1] - chainages[closest])
+    )
+
+
+def estimate_phase_lag(upstream: TideSeries, downstream: TideSeries) -> float:
+    """
+    Estimate how many seconds high water takes to travel from the downstream gauge to the
+    upstream one, as the median delay between matching high waters.
+    """
+    upstream_highs = upstream.times[upstream.is_high]
+    downstream_highs = downstream.times[downstream.is_high]
+    if len(upstream_highs) == 0 or len(downstream_highs) == 0:
+        return 0.0
+    # the latest downstream high water at or before each upstream one
+    index = np.searchsorted(downstream_highs, upstream_highs, side="right") - 1
+    matched = index >= 0
+    delays = upstream_highs[matched] - downstream_highs[index[matched]]
+    delays = delays[delays <= MAX_PHASE_LAG]
+    if len(delays) == 0:
+        return 0.0
+    return float(np.median(delays))
+
+
+def blend_heights(
+    upstream_heights: np.ndarray,
+    downstream_heights: np.ndarray,
+    amplitude_weight: float,
+) -> np.ndarray:
+    """Weight the downstream heights by amplitude_weight, and the upstream by the rest"""
+    return (1 - amplitude_weight) * upstream_heights + (
+        amplitude_weight * downstream_heights
+    )
@@ -0,0 +1,241 @@
+"""
+A node-local store of parsed tide series, shared by every worker process on a host.
+
+A loader process parses each cached quarter once and publishes it as a read-only .npy file
+in the store directory (in /dev/shm where available, so it lives in memory). Clients
+memory-map these files, so all workers share one copy of each quarter's arrays and none
+of them parse JSON. Each attached process keeps a lease file naming the quarters it maps,
+which gives every quarter a reference count, and teardown waits for them to be released.
+Files are only ever replaced or unlinked, never modified, so a mapped quarter stays valid
+even if it is republished or torn down while in use.
+"""
+
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API, SITE_CODE_PATTERN
+from thames_tidal_helper.files import pid_alive, remove_file, write_atomic
+from thames_tidal_helper.schema import CalendarQuarter, TideSeries
+
+DEFAULT_STORE_DIRECTORY = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "thames_tidal_helper",
+)
+# Written last by a publish and removed first by a teardown; no attaches happen without it
+READY_FILENAME = "ready.json"
+LEASES_DIRECTORY = "leases"
+
+ENTRY_PATTERN = re.compile(rf"^{SITE_CODE_PATTERN}_\d{{4}}_Q[1-4]\.[a-z]+\.npy$")
+LEASE_PATTERN = re.compile(r"^(\d+)\.\d+\.lease$")
+
+
+def series_dtype(length: int) -> np.dtype:
+    """
+    Return the dtype of a published series: one record holding each array whole, so every
+    field maps as a contiguous, aligned array rather than a strided view of packed rows.
+    """
+    return np.dtype(
+        [
+            ("time", "<i8", (length,)),
+            ("height", "<f8", (length,)),
+            ("is_high", "?", (length,)),
+        ]
+    )
+
+
+class TideStore:
+    """A directory of published quarters, and this process's leases on them"""
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIRECTORY):
+        self.directory = directory
+        self.attached: set[str] = set()
+        self.lease_path = os.path.join(
+            directory, LEASES_DIRECTORY, f"{os.getpid()}.{id(self)}.lease"
+        )
+        self.lock = threading.Lock()
+        # removes the lease file when closed, collected, or at exit, whichever is first
+        self.finalizer = weakref.finalize(self, remove_file, self.lease_path)
+
+    @staticmethod
+    def entry_name(site: str, quarter: CalendarQuarter, table_timezone: str) -> str:
+        code = API.site_to_code(site)
+        return f"{code}_{quarter.year}_Q{quarter.quarter}.{table_timezone}.npy"
+
+    @property
+    def ready(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, READY_FILENAME))
+
+    def publish(
+        self,
+        site: str,
+        quarter: CalendarQuarter,
+        series: TideSeries,
+        table_timezone: str = "utc",
+    ) -> None:
+        """Write a quarter's series to the store, replacing any earlier version"""
+        os.makedirs(self.directory, exist_ok=True)
+        records = np.empty((), dtype=series_dtype(len(series)))
+        records["time"] = series.times
+        records["height"] = series.heights
+        records["is_high"] = series.is_high
+        path = os.path.join(
+            self.directory, self.entry_name(site, quarter, table_timezone)
+        )
+        buffer = io.BytesIO()
+        np.save(buffer, records)
+        write_atomic(path, buffer.getvalue(), mode=0o444)
+
+    def mark_ready(self, info: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomic(os.path.join(self.directory, READY_FILENAME), json.dumps(info))
+
+    def attach(
+        self, site: str, quarter: CalendarQuarter, table_timezone: str = "utc"
+    ) -> TideSeries | None:
+        """
+        Map a published quarter read-only, or return None if the store does not have it.
+
+        The returned series' arrays are views of the shared mapping, not copies.
+        """
+        if not self.ready:
+            return None
+        name = self.entry_name(site, quarter, table_timezone)
+        try:
+            records = np.load(os.path.join(self.directory, name), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if name not in self.attached:
+                self.attached.add(name)
+                if not self.finalizer.alive:
+                    # attached again after being closed
+                    self.finalizer = weakref.finalize(
+                        self, remove_file, self.lease_path
+                    )
+                self.write_lease()
+        return TideSeries(records["time"], records["height"], records["is_high"])
+
+    def write_lease(self) -> None:
+        os.makedirs(os.path.dirname(self.lease_path), exist_ok=True)
+        write_atomic(self.lease_path, json.dumps(sorted(self.attached)))
+
+    def close(self) -> None:
+        """Release this process's leases. Mapped arrays stay readable until dropped."""
+        with self.lock:
+            self.attached.clear()
+            self.finalizer()
+
+    def refcounts(self) -> dict[str, int]:
+        """Return how many live processes hold each published quarter"""
+        counts = {name: 0 for name in self.entries()}
+        leases_directory = os.path.join(self.directory, LEASES_DIRECTORY)
+        if not os.path.isdir(leases_directory):
+            return counts
+        for filename in os.listdir(leases_directory):
+            match = LEASE_PATTERN.match(filename)
+            if match is None:
+                continue
+            path = os.path.join(leases_directory, filename)
+            if not pid_alive(int(match[1])):
+                # the process died without releasing its leases
+                remove_file(path)
+                continue
+            try:
+                with open(path, "r") as file:
+                    names = json.load(file)
+            except (FileNotFoundError, ValueError):
+                continue
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def entries(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if ENTRY_PATTERN.match(f))
+
+    def teardown(self, timeout: float = 0.0) -> dict:
+        """
+        Stop new attaches, wait up to timeout seconds for leases to be released, then
+        remove the store. Quarters still mapped by a process stay valid for it, as the files
+        are only unlinked.
+        """
+        ready_path = os.path.join(self.directory, READY_FILENAME)
+        if os.path.exists(ready_path):
+            os.remove(ready_path)
+        deadline = time.monotonic() + timeout
+        while True:
+            counts = self.refcounts()
+            in_use = {name: count for name, count in counts.items() if count}
+            if not in_use or time.monotonic() >= deadline:
+                break
+            time.sleep(0.1)
+        for name in counts:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        leases_directory = os.path.join(self.directory, LEASES_DIRECTORY)
+        if os.path.isdir(leases_directory):
+            for filename in os.listdir(leases_directory):
+                os.remove(os.path.join(leases_directory, filename))
+            os.rmdir(leases_directory)
+        if os.path.isdir(self.directory) and not os.listdir(self.directory):
+            os.rmdir(self.directory)
+        return {"store": self.directory, "removed": len(counts), "in_use": in_use}
+
+    def status(self) -> dict:
+        info = None
+        if self.ready:
+            with open(os.path.join(self.directory, READY_FILENAME), "r") as file:
+                info = json.load(file)
+        counts = self.refcounts()
+        return {
+            "store": self.directory,
+            "ready": info,
+            "quarters": len(counts),
+            "bytes": sum(
+                os.path.getsize(os.path.join(self.directory, name)) for name in counts
+            ),
+            "refcounts": counts,
+        }
+
+
+def publish_cache(
+    cache_directory: str,
+    store_directory: str = DEFAULT_STORE_DIRECTORY,
+    table_timezone: str = "utc",
+) -> dict:
+    """Parse every complete quarter in a cache once and publish it to the store"""
+    from thames_tidal_helper.data_manager import DataManager
+    from thames_tidal_helper.schema import parse_data_package_series
+
+    started = time.perf_counter()
+    data_manager = DataManager(cache_directory)
+    store = TideStore(store_directory)
+    published = []
+    for site, quarter in sorted(
+        data_manager.contents, key=lambda key: (key[1], key[0])
+    ):
+        series = parse_data_package_series(
+            data_manager.get_from_cache(site, quarter), table_timezone
+        )
+        store.publish(site, quarter, series, table_timezone)
+        published.append(store.entry_name(site, quarter, table_timezone))
+    data_manager.usage.close()
+    store.mark_ready(
+        {"cache": os.path.abspath(cache_directory), "published": time.time()}
+    )
+    return {
+        "store": store_directory,
+        "published": published,
+        "seconds": time.perf_counter() - started,
+    }
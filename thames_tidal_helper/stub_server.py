@@ -0,0 +1,327 @@
+"""
+A local stand-in for the PLA API, for testing the fetch and cache layers offline.
+
+Payloads are synthetic but have the PLA's schema: three months of high and low waters from
+the requested month, a per-minute listing and per-minute graphs from the requested day.
+The tides are those of the example payloads in test/example_data, repeated in whole
+spring-neap cycles to cover any period. Responses can be delayed, fail, or come back
+truncated, at configurable rates, and the graphs can be made as long as those of the
+3.8 MB 2014 payload.
+
+    GET <root>/<code>/<year>/<month>/<day>/0/1/   returns a payload as JSON
+    GET /stats                                     returns request counts as JSON
+
+The stub is a thread-per-request server, so one started in-process shares the GIL with
+the client under test; run it as its own process (the stub command) to keep them apart.
+"""
+
+import calendar
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from thames_tidal_helper.api_adapter import API
+from thames_tidal_helper.config import DEFAULT_SERVER_HOST, DEFAULT_STUB_PORT
+from thames_tidal_helper.interpolation import TideInterpolator
+from thames_tidal_helper.schema import (
+    CalendarQuarter,
+    DataPackage,
+    TideSeries,
+    parse_data_package_series,
+)
+
+DEFAULT_EXAMPLES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "example_data"
+)
+# Days of per-minute graphs and listing in each payload; the 2024 payloads have two of
+# each, and the 2014 payload has 59 days of graphs and no listing
+DEFAULT_GRAPH_DAYS = 2
+DEFAULT_LISTING_DAYS = 2
+# Synodic period of the spring-neap cycle, so repeated tides keep their fortnightly pattern
+SPRING_NEAP_SECONDS = round(14.765294 * 86400)
+
+QUERY_PATTERN = re.compile(r"/([A-Za-z0-9]+)/(\d{4})/(\d{1,2})/(\d{1,2})/0/1/?$")
+EXAMPLE_PATTERN = re.compile(r"^(\d{4})_Q([1-4])\.json$")
+DAY_NAMES = ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")
+
+
+def load_template(examples_directory: str = DEFAULT_EXAMPLES_DIRECTORY) -> TideSeries:
+    """
+    Return the high and low waters of the longest run of consecutive example quarters,
+    trimmed to a whole number of spring-neap cycles so that it can be repeated.
+    """
+    quarters = {}
+    for filename in os.listdir(examples_directory):
+        match = EXAMPLE_PATTERN.match(filename)
+        if match:
+            quarter = CalendarQuarter(int(match[1]), int(match[2]))
+            quarters[quarter.index()] = os.path.join(examples_directory, filename)
+    if not quarters:
+        raise ValueError(f"No example quarters found in {examples_directory}.")
+    runs: list[list[int]] = []
+    for index in sorted(quarters):
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    run = max(runs, key=len)
+    parts = []
+    for index in run:
+        with open(quarters[index], "r") as file:
+            parts.append(parse_data_package_series(DataPackage(file.read())))
+    times = np.concatenate([part.times for part in parts])
+    heights = np.concatenate([part.heights for part in parts])
+    is_high = np.concatenate([part.is_high for part in parts])
+    cycles = (times[-1] - times[0]) // SPRING_NEAP_SECONDS
+    if cycles == 0:
+        raise ValueError("The example quarters are too short to repeat.")
+    keep = times < times[0] + cycles * SPRING_NEAP_SECONDS
+    return TideSeries(times[keep], heights[keep], is_high[keep])
+
+
+class PayloadGenerator:
+    """Builds schema-correct payloads for any period by repeating a template's tides"""
+
+    def __init__(
+        self,
+        template: TideSeries,
+        graph_days: int = DEFAULT_GRAPH_DAYS,
+        listing_days: int = DEFAULT_LISTING_DAYS,
+    ):
+        self.template = template
+        # the template is repeated every whole number of cycles covering it
+        cycles = (template.times[-1] - template.times[0]) // SPRING_NEAP_SECONDS + 1
+        self.period = int(cycles) * SPRING_NEAP_SECONDS
+        self.interpolator = TideInterpolator(template, "pchip")
+        self.graph_days = graph_days
+        self.listing_days = listing_days
+
+    def events(self, start: int, end: int) -> TideSeries:
+        """Return the repeated template's events from start to end (epoch seconds)"""
+        origin = int(self.template.times[0])
+        first, last = (start - origin) // self.period, (end - origin) // self.period
+        repeats = np.arange(first, last + 1) * self.period
+        times = (self.template.times[None, :] + repeats[:, None]).ravel()
+        within = (times >= start) & (times < end)
+        heights = np.tile(self.template.heights, len(repeats))
+        is_high = np.tile(self.template.is_high, len(repeats))
+        return TideSeries(times[within], heights[within], is_high[within])
+
+    def heights(self, seconds: np.ndarray) -> np.ndarray:
+        """Return per-minute heights of the repeated template's curve"""
+        origin = int(self.template.times[0])
+        folded = origin + (seconds - origin) % self.period
+        return np.round(self.interpolator(folded.view("datetime64[s]")), 2)
+
+    def month_table(self, month: np.datetime64) -> dict:
+        """Return a month's high and low waters as a PLA table, with a row per day"""
+        first, after = (
+            np.array([month, month + 1]).astype("datetime64[s]").view(np.int64).tolist()
+        )
+        series = self.events(first, after)
+        rows: dict[str, list[dict]] = {
+            str(day): [] for day in range((after - first) // 86400)
+        }
+        for moment, height, high in zip(
+            series.times.view("datetime64[s]").astype(object),
+            series.heights.tolist(),
+            series.is_high.tolist(),
+        ):
+            rows[str(moment.day - 1)].append(
+                {
+                    "Day": moment.day,
+                    "DayName": DAY_NAMES[moment.weekday()],
+                    "Time": moment.strftime("%H%M"),
+                    "Height": f"{height:.2f}",
+                    "Type": 1 if high else 0,
+                    "moon": "nope",
+                }
+            )
+        year, month_index = divmod(int(month.astype(np.int64)), 12)
+        name = f"{calendar.month_name[month_index + 1]} {1970 + year}"
+        return {"name": name, "rows": rows}
+
+    def payload(self, year: int, month: int, day: int) -> str:
+        """Return the payload the PLA would send for a query URL's date, as JSON"""
+        start_month = np.datetime64(f"{year:04d}-{month:02d}", "M")
+        table = {str(i): self.month_table(start_month + i) for i in range(3)}
+
+        origin = int(
+            (start_month.astype("datetime64[D]") + day - 1)
+            .astype("datetime64[s]")
+            .view(np.int64)
+        )
+        graphs = {}
+        for graph_day in range(self.graph_days):
+            seconds = origin + graph_day * 86400 + np.arange(0, 86400, 60)
+            graphs[str(graph_day)] = [
+                {"y": y, "x": float(x)}
+                for x, y in zip(seconds.tolist(), self.heights(seconds).tolist())
+            ]
+        listing = []
+        seconds = origin + np.arange(0, self.listing_days * 86400, 60)
+        for x, y in zip(
+            seconds.view("datetime64[s]").astype(object), self.heights(seconds).tolist()
+        ):
+            listing.append(
+                {
+                    "height": f"{y:.2f}",
+                    "dayname": DAY_NAMES[x.weekday()],
+                    "minute": x.hour * 60 + x.minute,
+                    "day": x.day,
+                    "month": x.month,
+                    "date": x.strftime("%d/%m/%Y"),
+                    "moon": "nope",
+                    "time": x.strftime("%H:%M"),
+                }
+            )
+        return json.dumps(
+            {
+                "year": str(year),
+                "month": str(month),
+                "TimeOffset": "0",
+                "table": table,
+                "listing": listing,
+                "graph_data": {"graphs": graphs, "shadows": {}},
+            }
+        )
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_body(200, json.dumps(self.server.stats()).encode())
+            return
+        match = QUERY_PATTERN.search(self.path)
+        if match is None or API.GAUGES.find_code(match[1]) is None:
+            self.server.record("not_found")
+            self.send_error(404, "Unknown gauge or query")
+            return
+        delay, outcome = self.server.draw()
+        time.sleep(delay)
+        if outcome == "error":
+            self.server.record(outcome)
+            self.send_error(503, "Stub failure")
+            return
+        year, month, day = (int(value) for value in match.groups()[1:])
+        body = self.server.body(year, month, day)
+        if outcome == "truncated":
+            body = body[: len(body) // 2]
+        self.server.record(outcome, len(body))
+        self.send_body(200, body)
+
+    def send_body(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        if not self.server.silent:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A PLA stub answering from a PayloadGenerator. Each request waits latency seconds, plus
+    up to jitter more, then fails with a 503 at error_rate, or has its body cut in half at
+    truncate_rate. Payloads are built per request, unless prepared in advance.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        generator: PayloadGenerator,
+        host: str = DEFAULT_SERVER_HOST,
+        port: int = DEFAULT_STUB_PORT,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        truncate_rate: float = 0.0,
+        seed: int | None = None,
+        silent: bool = True,
+    ):
+        self.generator = generator
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.silent = silent
+        self.random = random.Random(seed)
+        self.counts = {"requests": 0, "bytes": 0}
+        # Bodies built by prepare, keyed by (year, month, day)
+        self.prepared: dict[tuple[int, int, int], bytes] = {}
+        self.lock = threading.Lock()
+        super().__init__((host, port), StubRequestHandler)
+
+    @property
+    def url(self) -> str:
+        """The API root to query, as API.root"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/gauge_data/"
+
+    def prepare(self, dates: list[tuple[int, int, int]]) -> None:
+        """Build the bodies for query dates in advance, so serving them is only a copy"""
+        for date in dates:
+            self.prepared[date] = self.generator.payload(*date).encode()
+
+    def body(self, year: int, month: int, day: int) -> bytes:
+        """Return the body for a query date, prepared or built now"""
+        body = self.prepared.get((year, month, day))
+        if body is None:
+            body = self.generator.payload(year, month, day).encode()
+        return body
+
+    def draw(self) -> tuple[float, str]:
+        """Return a request's delay and whether it succeeds, fails or is truncated"""
+        with self.lock:
+            delay = self.latency + self.jitter * self.random.random()
+            roll = self.random.random()
+        if roll < self.error_rate:
+            return delay, "error"
+        if roll < self.error_rate + self.truncate_rate:
+            return delay, "truncated"
+        return delay, "ok"
+
+    def record(self, outcome: str, size: int = 0) -> None:
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            self.counts["bytes"] += size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+
+def serve_stub(
+    host: str = DEFAULT_SERVER_HOST,
+    port: int = DEFAULT_STUB_PORT,
+    examples_directory: str = DEFAULT_EXAMPLES_DIRECTORY,
+    graph_days: int = DEFAULT_GRAPH_DAYS,
+    listing_days: int = DEFAULT_LISTING_DAYS,
+    silent: bool = False,
+    **options,
+) -> None:
+    """Run a stub PLA server until interrupted"""
+    generator = PayloadGenerator(
+        load_template(examples_directory), graph_days, listing_days
+    )
+    with StubServer(generator, host, port, silent=silent, **options) as server:
+        if not silent:
+            print(f"Serving stub PLA payloads at {server.url}")
+            print(f"Point clients at it with --api-root {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
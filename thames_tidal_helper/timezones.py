@@ -0,0 +1,60 @@
+"""
+Vectorised conversion between UTC and UK civil time (GMT/BST).
+
+Tide series are stored as UTC epoch seconds. These functions convert whole arrays at once,
+so no per-row tzinfo work is done. British Summer Time runs from 01:00 UTC on the last
+Sunday in March to 01:00 UTC on the last Sunday in October; these rules have applied since
+1996 and are used for all years.
+"""
+
+import numpy as np
+
+TIMEZONES = ("utc", "uk")
+
+SECONDS_PER_DAY = 86400
+BST_OFFSET = 3600
+
+
+def last_sunday_seconds(years: np.ndarray, month: int) -> np.ndarray:
+    """Return 01:00 UTC on the last Sunday of a month, for each year, as epoch seconds"""
+    first_of_next_month = years.astype("datetime64[Y]").astype("datetime64[M]") + month
+    last_day = first_of_next_month.astype("datetime64[D]").astype(np.int64) - 1
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays and 6 on Sundays
+    last_sunday = last_day - (last_day + 3 - 6) % 7
+    return last_sunday * SECONDS_PER_DAY + 3600
+
+
+def uk_offsets(utc_seconds: np.ndarray) -> np.ndarray:
+    """Return the UK civil time offset from UTC, in seconds, at each UTC instant"""
+    years = utc_seconds.view("datetime64[s]").astype("datetime64[Y]")
+    bst_start = last_sunday_seconds(years, 3)
+    bst_end = last_sunday_seconds(years, 10)
+    in_bst = (utc_seconds >= bst_start) & (utc_seconds < bst_end)
+    return np.where(in_bst, BST_OFFSET, 0)
+
+
+def uk_to_utc(times: np.ndarray) -> np.ndarray:
+    """
+    Convert UK civil times to UTC, as datetime64[s] arrays.
+
+    Times repeated when the clocks go back are taken as BST (the first occurrence), and
+    times skipped when the clocks go forward are taken as GMT.
+    """
+    local = times.astype("datetime64[s]", copy=False).view(np.int64)
+    in_bst = uk_offsets(local - BST_OFFSET) == BST_OFFSET
+    return np.where(in_bst, local - BST_OFFSET, local).view("datetime64[s]")
+
+
+def utc_to_uk(times: np.ndarray) -> np.ndarray:
+    """Convert UTC times to UK civil time, as datetime64[s] arrays"""
+    utc = times.astype("datetime64[s]", copy=False).view(np.int64)
+    return (utc + uk_offsets(utc)).view("datetime64[s]")
+
+
+def to_utc(times: np.ndarray, timezone: str) -> np.ndarray:
+    """Convert datetime64 values in one of TIMEZONES to UTC"""
+    if timezone not in TIMEZONES:
+        raise ValueError(f"Timezone {timezone} not found. Choose from {TIMEZONES}.")
+    if timezone == "uk":
+        return uk_to_utc(times)
+    return times.astype("datetime64[s]", copy=False)
@@ -0,0 +1,295 @@
+"""
+Cache accounting and size-bounded eviction.
+
+Each cache entry is a site's quarter: its JSON file, any partial files and any arrays
+derived from it, all named '<code>_<year>_Q<n>.*'. The index records when each entry was
+last fetched and last accessed. A running DataManager keeps a pin file listing the
+entries it has used, so pruning never removes a quarter a live job depends on.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows, where the index is not locked
+    fcntl = None
+
+from thames_tidal_helper.api_adapter import API, SITE_CODE_PATTERN
+from thames_tidal_helper.files import pid_alive, remove_file, write_atomic
+
+INDEX_FILENAME = "index.json"
+INDEX_LOCK_FILENAME = "index.json.lock"
+PINS_DIRECTORY = "pins"
+# Evict the least recently accessed entries, or the least recently fetched
+EVICTION_POLICIES = ("lru", "fetched")
+
+ENTRY_PATTERN = re.compile(rf"^(({SITE_CODE_PATTERN})_(\d{{4}})_Q[1-4])\.")
+PIN_PATTERN = re.compile(r"^(\d+)\.\d+\.pin$")
+SIZE_SUFFIXES = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes, with an optional K, M, G or T suffix, e.g. '500M'"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Invalid size {size!r}, expected e.g. 500M or 2G.")
+    return int(float(match[1]) * SIZE_SUFFIXES[match[2]])
+
+
+def write_json(path: str, data) -> None:
+    write_atomic(path, json.dumps(data, indent=2, sort_keys=True))
+
+
+def load_index(directory: str) -> dict[str, dict[str, float]]:
+    try:
+        with open(os.path.join(directory, INDEX_FILENAME), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        # the index only orders evictions, so a missing or bad one is started afresh
+        return {}
+
+
+class CacheUsage:
+    """
+    Records a process's use of cache entries in the index and in its pin file.
+
+    Recording is best-effort: if the cache cannot be written to, for example because it
+    is read-only, entries are still read but not recorded.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pinned: set[str] = set()
+        self.pin_path = os.path.join(
+            directory, PINS_DIRECTORY, f"{os.getpid()}.{id(self)}.pin"
+        )
+        self.lock = threading.Lock()
+        # removes the pin file when closed, collected, or at exit, whichever is first
+        self.finalizer = weakref.finalize(self, remove_file, self.pin_path)
+
+    def record(self, filename: str, fetched: bool = False) -> None:
+        """Record an access to (or fetch of) the entry a cache file belongs to"""
+        match = ENTRY_PATTERN.match(os.path.basename(filename))
+        if match is None:
+            return
+        entry = match[1]
+        with self.lock:
+            # the index is updated once per entry per process, and on every fetch
+            if entry in self.pinned and not fetched:
+                return
+            try:
+                if entry not in self.pinned:
+                    self.pinned.add(entry)
+                    if not self.finalizer.alive:
+                        # pinned again after being closed
+                        self.finalizer = weakref.finalize(
+                            self, remove_file, self.pin_path
+                        )
+                    os.makedirs(os.path.dirname(self.pin_path), exist_ok=True)
+                    write_json(self.pin_path, sorted(self.pinned))
+                now = time.time()
+                with index_lock(self.directory):
+                    index = load_index(self.directory)
+                    times = index.setdefault(entry, {})
+                    times["accessed"] = now
+                    if fetched:
+                        times["fetched"] = now
+                    write_json(os.path.join(self.directory, INDEX_FILENAME), index)
+            except OSError:
+                pass  # e.g. a read-only cache, which is still read as usual
+
+    def close(self) -> None:
+        """Release this process's pins"""
+        with self.lock:
+            self.pinned.clear()
+            self.finalizer()
+
+
+@contextmanager
+def index_lock(directory: str):
+    """
+    Hold an exclusive lock on the index while it is read, changed and written back, so
+    processes sharing the cache do not lose each other's updates.
+    """
+    with open(os.path.join(directory, INDEX_LOCK_FILENAME), "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def live_pins(directory: str) -> set[str]:
+    """Return the entries pinned by running processes, removing pins of dead ones"""
+    pins_directory = os.path.join(directory, PINS_DIRECTORY)
+    if not os.path.isdir(pins_directory):
+        return set()
+    pinned: set[str] = set()
+    for filename in os.listdir(pins_directory):
+        match = PIN_PATTERN.match(filename)
+        if match is None:
+            continue
+        path = os.path.join(pins_directory, filename)
+        if not pid_alive(int(match[1])):
+            remove_file(path)
+            continue
+        try:
+            with open(path, "r") as file:
+                pinned.update(json.load(file))
+        except (FileNotFoundError, ValueError):
+            continue
+    return pinned
+
+
+def scan_entries(directory: str) -> dict[str, dict]:
+    """Return each entry's files, size and last fetch and access times"""
+    index = load_index(directory)
+    entries: dict[str, dict] = {}
+    for filename in os.listdir(directory):
+        match = ENTRY_PATTERN.match(filename)
+        path = os.path.join(directory, filename)
+        if match is None or filename.endswith(".tmp") or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        entry = entries.setdefault(
+            match[1],
+            {"code": match[2], "year": int(match[3]), "files": [], "bytes": 0},
+        )
+        entry["files"].append(filename)
+        entry["bytes"] += stat.st_size
+        # entries fetched before the index existed fall back to their files' times
+        entry["mtime"] = max(entry.get("mtime", 0.0), stat.st_mtime)
+    for name, entry in entries.items():
+        times = index.get(name, {})
+        entry["fetched"] = times.get("fetched", entry["mtime"])
+        entry["accessed"] = times.get("accessed", entry["fetched"])
+    return entries
+
+
+def cache_stats(directory: str) -> dict:
+    """Return the bytes and quarters held per site and year, and entry access times"""
+    entries = scan_entries(directory)
+    sites: dict[str, dict[str, dict[str, int]]] = {}
+    for entry in entries.values():
+        try:
+            site = API.code_to_site(entry["code"])
+        except ValueError:
+            site = entry["code"]
+        year = sites.setdefault(site, {}).setdefault(
+            str(entry["year"]), {"bytes": 0, "quarters": 0}
+        )
+        year["bytes"] += entry["bytes"]
+        year["quarters"] += 1
+    accessed = [entry["accessed"] for entry in entries.values()]
+    return {
+        "cache": directory,
+        "total_bytes": sum(entry["bytes"] for entry in entries.values()),
+        "quarters": len(entries),
+        "sites": {
+            site: dict(sorted(years.items())) for site, years in sorted(sites.items())
+        },
+        "oldest_access": min(accessed, default=None),
+        "newest_access": max(accessed, default=None),
+        "pinned": sorted(live_pins(directory)),
+    }
+
+
+def prune_cache(
+    directory: str,
+    max_size: int,
+    policy: str = "lru",
+    keep: set[str] | frozenset[str] = frozenset(),
+) -> dict:
+    """
+    Remove whole entries, oldest first by the policy, until the cache fits in max_size
+    bytes. Entries pinned by running processes, or in keep, are never removed.
+    """
+    if policy not in EVICTION_POLICIES:
+        raise ValueError(f"Policy {policy} not found. Choose from {EVICTION_POLICIES}.")
+    entries = scan_entries(directory)
+    total = sum(entry["bytes"] for entry in entries.values())
+    report = {
+        "cache": directory,
+        "max_bytes": max_size,
+        "before_bytes": total,
+        "removed": [],
+        "freed_bytes": 0,
+        "pinned": [],
+    }
+    if total > max_size:
+        protected = live_pins(directory) | set(keep)
+        key = "accessed" if policy == "lru" else "fetched"
+        for name in sorted(entries, key=lambda name: (entries[name][key], name)):
+            if total <= max_size:
+                break
+            if name in protected:
+                report["pinned"].append(name)
+                continue
+            for filename in entries[name]["files"]:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    pass  # removed by someone else in the meantime
+            total -= entries[name]["bytes"]
+            report["removed"].append(name)
+            report["freed_bytes"] += entries[name]["bytes"]
+        if report["removed"]:
+            with index_lock(directory):
+                index = load_index(directory)
+                for name in report["removed"]:
+                    index.pop(name, None)
+                write_json(os.path.join(directory, INDEX_FILENAME), index)
+    report["after_bytes"] = total
+    return report
+
+
+def format_size(size: float) -> str:
+    for suffix in ("B", "KB", "MB", "GB"):
+        if size < 1024 or suffix == "GB":
+            break
+        size /= 1024
+    return f"{size:.1f} {suffix}" if suffix != "B" else f"{int(size)} B"
+
+
+def summarise_stats(stats: dict) -> str:
+    """Return a short human-readable table of cache usage"""
+    lines = [
+        f"{stats['cache']}: {format_size(stats['total_bytes'])} in "
+        f"{stats['quarters']} quarters"
+    ]
+    for site, years in stats["sites"].items():
+        for year, usage in years.items():
+            lines.append(
+                f"  {site:<20} {year}  {usage['quarters']} "
+                f"{'quarter' if usage['quarters'] == 1 else 'quarters'}  "
+                f"{format_size(usage['bytes'])}"
+            )
+    if stats["oldest_access"] is not None:
+        oldest = time.strftime("%Y-%m-%d %H:%M", time.localtime(stats["oldest_access"]))
+        newest = time.strftime("%Y-%m-%d %H:%M", time.localtime(stats["newest_access"]))
+        lines.append(f"Last accessed between {oldest} and {newest}")
+    if stats["pinned"]:
+        lines.append(f"In use by running jobs: {', '.join(stats['pinned'])}")
+    return "\n".join(lines)
+
+
+def summarise_prune(report: dict) -> str:
+    lines = [
+        f"Pruned {len(report['removed'])} quarters from {report['cache']}, freeing "
+        f"{format_size(report['freed_bytes'])}: "
+        f"{format_size(report['before_bytes'])} -> {format_size(report['after_bytes'])} "
+        f"(limit {format_size(report['max_bytes'])})"
+    ]
+    if report["pinned"]:
+        lines.append(f"Kept, in use by running jobs: {', '.join(report['pinned'])}")
+    if report["after_bytes"] > report["max_bytes"]:
+        lines.append("The cache is still over the limit.")
+    return "\n".join(lines)
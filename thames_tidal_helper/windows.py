@@ -0,0 +1,118 @@
+"""
+Inverse queries: the windows of time when the tide is above, or below, a height.
+
+Crossings are solved per interval between consecutive high and low waters, so a search
+costs time proportional to the number of events in the period, not to its length in
+minutes. Each window also reports its extreme, the highest (or lowest) point within it.
+"""
+
+import numpy as np
+
+from thames_tidal_helper.interpolation import TideInterpolator
+
+WINDOW_DTYPE = np.dtype(
+    [
+        ("start", "<M8[s]"),
+        ("end", "<M8[s]"),
+        ("extreme_time", "<M8[s]"),
+        ("extreme_height", "<f8"),
+    ]
+)
+
+WINDOWS_HEADER = "Start, End, Duration, Extreme Time, Extreme Height (m)"
+
+
+def find_windows(
+    interpolator: TideInterpolator,
+    threshold: float,
+    start: np.datetime64,
+    end: np.datetime64,
+    below: bool = False,
+) -> np.ndarray:
+    """
+    Return the windows between start and end (UTC datetime64 values) when the curve is
+    above the threshold, or at or below it if below is set, as a WINDOW_DTYPE array.
+
+    Windows open at start, or close at end, if the tide is already past the threshold
+    there. Times are rounded to the second.
+    """
+    start_seconds, end_seconds = (
+        np.array([start, end], dtype="datetime64[s]").view(np.int64).tolist()
+    )
+    if end_seconds <= start_seconds:
+        return np.empty(0, dtype=WINDOW_DTYPE)
+    times, rising = interpolator.crossings(threshold)
+    opening = rising != below
+    # a crossing at start takes effect from start, and one at end after the period, so
+    # the state at each bound follows from the crossings at or before it
+    first = np.searchsorted(times, start_seconds, side="right")
+    last = np.searchsorted(times, end_seconds, side="left")
+    if first > 0:
+        open_at_start = bool(opening[first - 1])
+    elif len(times):
+        # crossings alternate, so before the first the curve is on its other side
+        open_at_start = not opening[0]
+    else:
+        height = interpolator(np.array([start_seconds]).view("datetime64[s]"))[0]
+        open_at_start = bool((height > threshold) != below)
+    times, opening = times[first:last], opening[first:last]
+    open_at_end = bool(opening[-1]) if len(opening) else open_at_start
+
+    # crossings alternate, so with the bounds added the openings and closings pair up
+    starts = np.rint(times[opening]).astype(np.int64)
+    ends = np.rint(times[~opening]).astype(np.int64)
+    if open_at_start:
+        starts = np.insert(starts, 0, start_seconds)
+    if open_at_end:
+        ends = np.append(ends, end_seconds)
+    windows = np.empty(len(starts), dtype=WINDOW_DTYPE)
+    windows["start"] = starts.view("datetime64[s]")
+    windows["end"] = ends.view("datetime64[s]")
+    if len(windows) == 0:
+        return windows
+
+    # the curve is monotone between events, so each window's extreme is at one of the
+    # events within it or at one of its ends
+    event_heights = np.append(interpolator.coefficients[:, 0], interpolator.last_height)
+    events = (interpolator.times > start_seconds) & (interpolator.times < end_seconds)
+    candidate_times = np.concatenate([starts, ends, interpolator.times[events]])
+    candidate_heights = np.concatenate(
+        [
+            interpolator(starts.view("datetime64[s]")),
+            interpolator(ends.view("datetime64[s]")),
+            event_heights[events],
+        ]
+    )
+    owners = np.searchsorted(starts, candidate_times, side="right") - 1
+    owned = (owners >= 0) & (candidate_times <= ends[np.maximum(owners, 0)])
+    owners = owners[owned]
+    candidate_times = candidate_times[owned]
+    candidate_heights = candidate_heights[owned]
+    order = np.lexsort((candidate_heights if below else -candidate_heights, owners))
+    # every window owns its own ends, so each has a first candidate
+    _, first = np.unique(owners[order], return_index=True)
+    windows["extreme_time"] = candidate_times[order[first]].view("datetime64[s]")
+    windows["extreme_height"] = candidate_heights[order[first]]
+    return windows
+
+
+def summarise_windows(windows: np.ndarray) -> list[str]:
+    """Return a line per window: its start, end, duration and extreme"""
+    from thames_tidal_helper.client import Client
+
+    if len(windows) == 0:
+        return []
+    starts = Client.format_times(windows["start"])
+    ends = Client.format_times(windows["end"])
+    extreme_times = Client.format_times(windows["extreme_time"])
+    durations = (windows["end"] - windows["start"]).view(np.int64) // 60
+    return [
+        f"{start}, {end}, {minutes // 60}h{minutes % 60:02d}m, {extreme_time}, {height}"
+        for start, end, minutes, extreme_time, height in zip(
+            starts,
+            ends,
+            durations.tolist(),
+            extreme_times,
+            windows["extreme_height"].tolist(),
+        )
+    ]